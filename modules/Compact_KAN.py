@@ -0,0 +1,162 @@
+import torch
+import torch.nn as nn
+from .spline import *
+
+
+class Compact_KANLayer(nn.Module):
+    """
+    Compact_KANLayer class: inference-only KAN layer that stores and evaluates live edges only
+
+    Attributes:
+    -----------
+        in_dim: int
+            input dimension
+        out_dim: int
+            output dimension
+        k: int
+            the piecewise polynomial order of splines
+        layout: str
+            'dense' (all in_dim * out_dim edges, row j * in_dim + i as in KANLayer) or 'csr' (live edges only, sorted by output neuron)
+        edge_in: 1D torch.long
+            input neuron of each stored edge
+        edge_out: 1D torch.long
+            output neuron of each stored edge
+        row_ptr: 1D torch.long
+            CSR row pointers over output neurons (edges of output j are row_ptr[j]:row_ptr[j+1])
+        grid, coef, scale_base, scale_sp, mask:
+            per-edge spline parameters, copied from the parent KANLayer
+        bias: 2D torch.float
+            node biases added to the outputs, shape (1, out_dim)
+        symbolic_edges: list
+            (i, j, fun, (a, b, c, d), mask) of live symbolic edges
+    """
+
+    def __init__(self, in_dim, out_dim, edge_in, edge_out, grid, coef, scale_base, scale_sp, mask, bias, k, base_fun, layout='csr', symbolic_edges=None):
+        '''
+        initialize a Compact_KANLayer (usually created by KAN.compact rather than by hand)
+
+        Args:
+        -----
+            in_dim : int
+                input dimension
+            out_dim : int
+                output dimension
+            edge_in : 1D torch.long
+                input neuron of each stored edge
+            edge_out : 1D torch.long
+                output neuron of each stored edge (non-decreasing)
+            grid : 2D torch.float
+                grids of the stored edges, shape (number of edges, num + 1)
+            coef : 2D torch.float
+                coefficients of the stored edges, shape (number of edges, num + k)
+            scale_base : 1D torch.float
+                scale of the residual function of the stored edges
+            scale_sp : 1D torch.float
+                scale of the spline of the stored edges
+            mask : 1D torch.float
+                numeric mask of the stored edges
+            bias : 2D torch.float
+                biases of the output neurons, shape (1, out_dim)
+            k : int
+                the order of piecewise polynomial
+            base_fun : fun
+                residual function b(x)
+            layout : str
+                'dense' or 'csr'. Default: 'csr'.
+            symbolic_edges : list or None
+                live symbolic edges as (i, j, fun, (a, b, c, d), mask)
+        '''
+        super(Compact_KANLayer, self).__init__()
+        self.in_dim = in_dim
+        self.out_dim = out_dim
+        self.k = k
+        self.base_fun = base_fun
+        self.layout = layout
+
+        self.register_buffer('edge_in', edge_in.long())
+        self.register_buffer('edge_out', edge_out.long())
+        self.register_buffer('row_ptr', torch.cat([torch.zeros(1, dtype=torch.long, device=edge_out.device), torch.bincount(self.edge_out, minlength=out_dim).cumsum(0)]))
+        self.register_buffer('grid', grid.detach().clone())
+        self.register_buffer('coef', coef.detach().clone())
+        self.register_buffer('scale_base', scale_base.detach().clone())
+        self.register_buffer('scale_sp', scale_sp.detach().clone())
+        self.register_buffer('mask', mask.detach().clone())
+        self.register_buffer('bias', bias.detach().clone())
+        self.symbolic_edges = symbolic_edges if symbolic_edges is not None else []
+
+    @property
+    def num_edges(self):
+        return self.edge_in.shape[0]
+
+    def forward(self, x):
+        '''
+        Compact_KANLayer forward given input x
+
+        Args:
+        -----
+            x : 2D torch.float
+                inputs, shape (number of samples, input dimension)
+
+        Returns:
+        --------
+            y : 2D torch.float
+                outputs, shape (number of samples, output dimension)
+        '''
+        batch = x.shape[0]
+        y = self.bias.expand(batch, -1).clone()
+
+        if self.num_edges > 0:
+            if self.layout == 'dense':
+                x_edge = x.repeat(1, self.out_dim)  # shape (batch, out_dim * in_dim)
+            else:
+                x_edge = x[:, self.edge_in]  # shape (batch, number of edges)
+            spline = coef2curve(x_eval=x_edge.permute(1, 0), grid=self.grid, coef=self.coef, k=self.k, device=x.device).permute(1, 0)
+            acts = self.mask * (self.scale_base * self.base_fun(x_edge) + self.scale_sp * spline)
+            if self.layout == 'dense':
+                y = y + acts.reshape(batch, self.out_dim, self.in_dim).sum(dim=2)
+            else:
+                y = y.index_add(1, self.edge_out, acts)
+
+        for i, j, fun, (a, b, c, d), mask in self.symbolic_edges:
+            y[:, j] = y[:, j] + mask * (c * fun(a * x[:, i] + b) + d)
+
+        return y
+
+
+class CompactKAN(nn.Module):
+    '''
+    inference-only KAN built by KAN.compact: dead neurons are removed and only live edges are evaluated
+
+    Attributes:
+    -----------
+        width : list of int
+            number of neurons in each layer after compaction
+        layers : nn.ModuleList of Compact_KANLayer
+        active_neurons : list of lists of int
+            which neurons of the original model are kept in each layer
+    '''
+
+    def __init__(self, layers, active_neurons):
+        super(CompactKAN, self).__init__()
+        self.layers = nn.ModuleList(layers)
+        self.active_neurons = active_neurons
+        self.width = [layers[0].in_dim] + [layer.out_dim for layer in layers]
+
+    def forward(self, x):
+        '''
+        Args:
+        -----
+            x : 2D torch.float
+                inputs, shape (batch, input dimension of the original model)
+
+        Returns:
+        --------
+            y : 2D torch.float
+                outputs, shape (batch, output dimension)
+        '''
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+    def num_edges(self):
+        return sum(layer.num_edges + len(layer.symbolic_edges) for layer in self.layers)
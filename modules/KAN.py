@@ -3,6 +3,8 @@ import torch.nn as nn
 import numpy as np
 from .KANLayer import *
 from .Symbolic_KANLayer import *
+from .Compact_KAN import *
+from .symbolic_compiler import CompiledSymbolicKAN, compile_formulas
 from .LBFGS import *
 import os
 import glob
@@ -209,6 +211,84 @@ class KAN(nn.Module):
             self.forward(x)
             self.act_fun[l].update_grid_from_samples(self.acts[l])
 
+    def enable_grid_sketch(self, num_bins=256, decay=0.99):
+        '''
+        track activation quantiles in every layer during forward passes (see update_grid_from_sketch)
+        
+        Args:
+        -----
+            num_bins : int
+                number of histogram bins per neuron. Default: 256.
+            decay : float
+                exponential decay of old counts per forward pass. Default: 0.99.
+            
+        Returns:
+        --------
+            None
+        '''
+        for l in range(self.depth):
+            self.act_fun[l].enable_grid_sketch(num_bins=num_bins, decay=decay)
+
+    def update_grid_from_sketch(self):
+        '''
+        update grids from the quantiles tracked during previous forward passes. Unlike update_grid_from_samples,
+        this needs no extra forward passes, sorting or least squares, so it is cheap enough to run often.
+        
+        Returns:
+        --------
+            None
+         
+        Example
+        -------
+        >>> model = KAN(width=[2,5,1], grid=5, k=3)
+        >>> model.enable_grid_sketch()
+        >>> model(torch.rand(100,2)*5)
+        >>> model.update_grid_from_sketch()
+        '''
+        for l in range(self.depth):
+            self.act_fun[l].update_grid_from_sketch()
+
+    def freeze(self, table_size=1024, dtype=torch.float32, tolerance=None):
+        '''
+        evaluate every spline from a lookup table (inference only, see KANLayer.freeze). train() unfreezes the model.
+        
+        Args:
+        -----
+            table_size : int
+                number of table points per spline. Default: 1024.
+            dtype : torch.dtype
+                table storage, torch.float32, torch.float16 or torch.int8. Default: torch.float32.
+            tolerance : float or None
+                if given, raise ValueError (leaving every layer as it was) when the table error of any layer exceeds it. Default: None.
+            
+        Returns:
+        --------
+            table_error : float
+                the largest table error over all layers
+         
+        Example
+        -------
+        >>> model = KAN(width=[2,5,1], grid=5, k=3)
+        >>> model.freeze(table_size=512, dtype=torch.int8)
+        >>> model(torch.rand(100,2))
+        '''
+        previous = [(layer.spline_table, layer.table_error) for layer in self.act_fun]
+        try:
+            errors = [self.act_fun[l].freeze(table_size=table_size, dtype=dtype, tolerance=tolerance) for l in range(self.depth)]
+        except Exception:
+            # leave every layer as it was, not just the ones before the failing layer, whatever went wrong
+            for layer, (table, error) in zip(self.act_fun, previous):
+                layer.spline_table, layer.table_error = table, error
+            raise
+        return max(errors)
+
+    def unfreeze(self):
+        '''
+        go back to exact spline evaluation in every layer
+        '''
+        for l in range(self.depth):
+            self.act_fun[l].unfreeze()
+
     def initialize_grid_from_another_model(self, model, x):
         '''
         initialize grid from a parent model
@@ -725,7 +805,7 @@ class KAN(nn.Module):
             plt.gcf().get_axes()[0].text(0.5, y0 * (len(self.width) - 1) + 0.2, title, fontsize=40 * scale, horizontalalignment='center', verticalalignment='center')
 
     def train(self, dataset, opt="LBFGS", steps=100, log=1, lamb=0., lamb_l1=1., lamb_entropy=2., lamb_coef=0., lamb_coefdiff=0., update_grid=True, grid_update_num=10, loss_fn=None, lr=1., stop_grid_update_step=50, batch=-1,
-              small_mag_threshold=1e-16, small_reg_factor=1., metrics=None, sglr_avoid=False, save_fig=False, in_vars=None, out_vars=None, beta=3, save_fig_freq=1, img_folder='./video', device='cpu'):
+              small_mag_threshold=1e-16, small_reg_factor=1., metrics=None, sglr_avoid=False, save_fig=False, in_vars=None, out_vars=None, beta=3, save_fig_freq=1, img_folder='./video', device='cpu', grid_sketch=False):
         '''
         training
 
@@ -765,6 +845,8 @@ class KAN(nn.Module):
                 device   
             save_fig_freq : int
                 save figure every (save_fig_freq) step
+            grid_sketch : bool
+                If True, grid updates use quantiles tracked during training forward passes (update_grid_from_sketch) instead of update_grid_from_samples
 
         Returns:
         --------
@@ -855,13 +937,20 @@ class KAN(nn.Module):
             if not os.path.exists(img_folder):
                 os.makedirs(img_folder)
 
+        self.unfreeze()
+        if grid_sketch and update_grid:
+            self.enable_grid_sketch()
+
         for _ in pbar:
 
             train_id = np.random.choice(dataset['train_input'].shape[0], batch_size, replace=False)
             test_id = np.random.choice(dataset['test_input'].shape[0], batch_size_test, replace=False)
 
             if _ % grid_update_freq == 0 and _ < stop_grid_update_step and update_grid:
-                self.update_grid_from_samples(dataset['train_input'][train_id].to(device))
+                if grid_sketch:
+                    self.update_grid_from_sketch()
+                else:
+                    self.update_grid_from_samples(dataset['train_input'][train_id].to(device))
 
             if opt == "LBFGS":
                 optimizer.step(closure)
@@ -963,6 +1052,113 @@ class KAN(nn.Module):
 
         return model2
 
+    def compact(self, dense_threshold=0.5):
+        '''
+        build an inference-only copy that physically drops masked edges and dead neurons (unlike prune/remove_edge, which only zero masks)
+        
+        A hidden neuron is dead if it has no live path from the inputs or to the outputs. Neurons that cannot be reached from the inputs
+        are constants; their outgoing activations (numeric and symbolic) are folded into the next layer's biases, so outputs are unchanged.
+        Symbolic edges only count when symbolic_enabled, matching forward. The cached activations of the last forward (acts, acts_scale, ...)
+        are left untouched, so compact() can be called between a forward pass and prune().
+        Layers whose live-edge density is below dense_threshold store their edges in CSR order and only evaluate those;
+        denser layers keep the KANLayer layout.
+        
+        Args:
+        -----
+            dense_threshold : float
+                live-edge density above which a layer keeps the dense layout. Default: 0.5.
+            
+        Returns:
+        --------
+            model2 : CompactKAN
+            
+        Example
+        -------
+        >>> model = KAN(width=[2,5,1], grid=5, k=3, noise_scale=0.1, seed=0)
+        >>> model.remove_edge(0,0,1)
+        >>> model.remove_node(1,3)
+        >>> model2 = model.compact()
+        >>> model2.width
+        [2, 4, 1]
+        '''
+        with torch.no_grad():
+            live = []
+            for l in range(self.depth):
+                numeric = self.act_fun[l].mask.reshape(self.width[l + 1], self.width[l]) != 0
+                symbolic = (self.symbolic_fun[l].mask != 0) if self.symbolic_enabled else torch.zeros_like(numeric)
+                live.append((numeric | symbolic).cpu())
+
+            reach_in = [torch.ones(self.width[0], dtype=torch.bool)]
+            for l in range(self.depth):
+                reach_in.append((live[l] & reach_in[l][None, :]).any(dim=1))
+            reach_out = [torch.ones(self.width[-1], dtype=torch.bool)]
+            for l in reversed(range(self.depth)):
+                reach_out.insert(0, (live[l] & reach_out[0][:, None]).any(dim=0))
+
+            keep = [reach_in[l] & reach_out[l] for l in range(self.depth + 1)]
+            keep[0][:] = True
+            keep[-1][:] = True
+
+            # values of neurons unreachable from the inputs do not depend on the inputs; evaluate every edge at a
+            # zero input without going through forward, which would overwrite the cached activations prune() reads
+            postacts = []
+            x = torch.zeros(1, self.width[0], device=self.device)
+            for l in range(self.depth):
+                x_numerical, _, postacts_numerical, _ = self.act_fun[l](x)
+                if self.symbolic_enabled:
+                    x_symbolic, postacts_symbolic = self.symbolic_fun[l](x)
+                else:
+                    x_symbolic, postacts_symbolic = 0., 0.
+                postacts.append(postacts_numerical + postacts_symbolic)
+                x = x_numerical + x_symbolic + self.biases[l].weight
+            biases = [self.biases[l].weight.detach().clone() for l in range(self.depth)]
+            for l in range(1, self.depth):
+                for i in torch.where(~reach_in[l])[0].tolist():
+                    for j in torch.where(live[l][:, i] & keep[l + 1])[0].tolist():
+                        biases[l][0, j] += postacts[l][0, j, i]
+
+            active_neurons = [torch.where(keep[l])[0].tolist() for l in range(self.depth + 1)]
+            layers = []
+            for l in range(self.depth):
+                act_fun = self.act_fun[l]
+                sym_fun = self.symbolic_fun[l]
+                in_id = active_neurons[l]
+                out_id = active_neurons[l + 1]
+                in_pos = {i: p for p, i in enumerate(in_id)}
+
+                edges = live[l] & (self.act_fun[l].mask.reshape(self.width[l + 1], self.width[l]) != 0).cpu() & (keep[l] & reach_in[l])[None, :] & keep[l + 1][:, None]
+                density = edges.sum().item() / max(len(in_id) * len(out_id), 1)
+                if density >= dense_threshold:
+                    layout = 'dense'
+                    rows = (torch.tensor(out_id)[:, None] * self.width[l] + torch.tensor(in_id)[None, :]).reshape(-1)
+                    edge_out = torch.arange(len(out_id))[:, None].expand(-1, len(in_id)).reshape(-1)
+                    edge_in = torch.arange(len(in_id))[None, :].expand(len(out_id), -1).reshape(-1)
+                    mask = act_fun.mask[rows] * edges[rows // self.width[l], rows % self.width[l]].to(act_fun.mask.device, act_fun.mask.dtype)
+                else:
+                    layout = 'csr'
+                    sub = edges[out_id][:, in_id]
+                    edge_out, edge_in = torch.where(sub)  # row-major, i.e. sorted by output neuron
+                    rows = torch.tensor(out_id, dtype=torch.long)[edge_out] * self.width[l] + torch.tensor(in_id, dtype=torch.long)[edge_in]
+                    mask = act_fun.mask[rows]
+
+                shared = act_fun.weight_sharing[rows]
+                symbolic_edges = []
+                for j_new, j in enumerate(out_id):
+                    for i in in_id:
+                        if self.symbolic_enabled and sym_fun.mask[j, i] != 0 and reach_in[l][i]:
+                            a, b, c, d = [v.item() for v in sym_fun.affine[j, i]]
+                            symbolic_edges.append((in_pos[i], j_new, sym_fun.funs[j][i], (a, b, c, d), sym_fun.mask[j, i].item()))
+
+                layers.append(Compact_KANLayer(
+                    in_dim=len(in_id), out_dim=len(out_id),
+                    edge_in=edge_in.to(self.device), edge_out=edge_out.to(self.device),
+                    grid=act_fun.grid[shared], coef=act_fun.coef[shared],
+                    scale_base=act_fun.scale_base[rows], scale_sp=act_fun.scale_sp[rows], mask=mask,
+                    bias=biases[l][:, out_id], k=act_fun.k, base_fun=act_fun.base_fun,
+                    layout=layout, symbolic_edges=symbolic_edges))
+
+        return CompactKAN(layers, active_neurons)
+
     def remove_edge(self, l, i, j):
         '''
         remove activtion phi(l,i,j) (set its mask to zero)
@@ -1222,6 +1418,50 @@ class KAN(nn.Module):
         out_dim = len(symbolic_acts[-1])
         return [ex_round(symbolic_acts[-1][i]) for i in range(len(symbolic_acts[-1]))], x0
 
+    def compile_symbolic(self, backend='torch', floating_digit=12, simplify=False):
+        '''
+        compile the symbolic formula of a fully symbolified model into a single vectorized function
+        
+        Raises ValueError if any unmasked edge is still spline-valued, since the compiled formula would not contain it.
+        
+        The result evaluates the closed form directly, with common subexpressions shared across outputs, instead of
+        running the spline and symbolic fronts of every edge in KAN.forward.
+        
+        Args:
+        -----
+            backend : str
+                'torch' (returns an nn.Module, see CompiledSymbolicKAN.to_torchscript) or 'numpy' (returns a function). Default: 'torch'.
+            floating_digit : int
+                digits kept for constants. Default: 12 (symbolic_formula rounds to 2 for display).
+            simplify : bool
+                If True, simplify each layer's expressions first (slow). Default: False.
+            
+        Returns:
+        --------
+            CompiledSymbolicKAN or callable
+            
+        Example
+        -------
+        >>> model.auto_symbolic(lib=['exp','sin','x^2'])
+        >>> compiled = model.compile_symbolic()
+        >>> compiled(dataset['test_input']).shape
+        '''
+        # the formula only covers symbolic fronts; an edge that still has a live spline would silently drop out of it
+        numeric_edges = []
+        for l in range(self.depth):
+            numeric = self.act_fun[l].mask.reshape(self.width[l + 1], self.width[l]) != 0
+            numeric_edges += [(l, i, j) for j, i in torch.nonzero(numeric).tolist()]
+        if numeric_edges:
+            raise ValueError(f"{len(numeric_edges)} active edge(s) are still spline-valued, e.g. (l, i, j) = {numeric_edges[:5]}; "
+                             "run auto_symbolic or fix_symbolic (or remove_edge) on them before compiling.")
+        result = self.symbolic_formula(floating_digit=floating_digit, simplify=simplify)
+        if result is None:
+            raise ValueError("All activations must be symbolic before compiling; run auto_symbolic or fix_symbolic first.")
+        formulas, variables = result
+        if backend == 'torch':
+            return CompiledSymbolicKAN(formulas, variables)
+        return compile_formulas(formulas, variables, backend=backend)
+
     def clear_ckpts(self, folder='./model_ckpt'):
         '''
         clear all checkpoints
@@ -2,6 +2,8 @@ import torch
 import torch.nn as nn
 import numpy as np
 from .spline import *
+from .grid_adaptation import QuantileSketch, BSplineGramProjector, extend_knots
+from .spline_table import SplineTable, table_nodes, table_midpoints
 
 
 class KANLayer(nn.Module):
@@ -52,6 +54,14 @@ class KANLayer(nn.Module):
             forward 
         update_grid_from_samples():
             update grids based on samples' incoming activations
+        enable_grid_sketch():
+            track incoming activation quantiles during forward passes
+        update_grid_from_sketch():
+            update grids from the tracked quantiles
+        freeze():
+            evaluate splines from lookup tables (inference)
+        unfreeze():
+            go back to exact spline evaluation
         initialize_grid_from_parent():
             initialize grids from another model
         get_subset():
@@ -133,6 +143,9 @@ class KANLayer(nn.Module):
         self.lock_counter = 0
         self.lock_id = torch.zeros(size)
         self.device = device
+        self.grid_sketch = None
+        self.spline_table = None
+        self.table_error = None
 
     def forward(self, x):
         '''
@@ -166,12 +179,17 @@ class KANLayer(nn.Module):
          torch.Size([100, 5, 3]))
         '''
         batch = x.shape[0]
+        if self.grid_sketch is not None and self.training:
+            self.grid_sketch.update(x)
         # x: shape (batch, in_dim) => shape (size, batch) (size = out_dim * in_dim)
         x = torch.einsum('ij,k->ikj', x, torch.ones(self.out_dim, device=self.device)).reshape(batch, self.size).permute(1, 0)
         preacts = x.permute(1, 0).clone().reshape(batch, self.out_dim, self.in_dim)
         base = self.base_fun(x).permute(1, 0)  # shape (batch, size)
-        y = coef2curve(x_eval=x, grid=self.grid[self.weight_sharing], coef=self.coef[self.weight_sharing], k=self.k, device=self.device)  # shape (size, batch)
-        y = y.permute(1, 0)  # shape (batch, size)
+        if self.spline_table is not None:
+            y = self.spline_table(x.permute(1, 0))  # shape (batch, size)
+        else:
+            y = coef2curve(x_eval=x, grid=self.grid[self.weight_sharing], coef=self.coef[self.weight_sharing], k=self.k, device=self.device)  # shape (size, batch)
+            y = y.permute(1, 0)  # shape (batch, size)
         postspline = y.clone().reshape(batch, self.out_dim, self.in_dim)
         y = self.scale_base.unsqueeze(dim=0) * base + self.scale_sp.unsqueeze(dim=0) * y
         y = self.mask[None, :] * y
@@ -205,6 +223,7 @@ class KANLayer(nn.Module):
         tensor([[-1.0000, -0.6000, -0.2000,  0.2000,  0.6000,  1.0000]])
         tensor([[-3.0002, -1.7882, -0.5763,  0.6357,  1.8476,  3.0002]])
         '''
+        self.unfreeze()
         batch = x.shape[0]
         x = torch.einsum('ij,k->ikj', x, torch.ones(self.out_dim, ).to(self.device)).reshape(batch, self.size).permute(1, 0)
         x_pos = torch.sort(x, dim=1)[0]
@@ -217,6 +236,115 @@ class KANLayer(nn.Module):
         self.grid.data = self.grid_eps * grid_uniform + (1 - self.grid_eps) * grid_adaptive
         self.coef.data = curve2coef(x_pos, y_eval, self.grid, self.k, device=self.device)
 
+    def enable_grid_sketch(self, num_bins=256, decay=0.99):
+        '''
+        track quantiles of incoming activations during forward passes (used by update_grid_from_sketch)
+        
+        Args:
+        -----
+            num_bins : int
+                number of histogram bins per input dimension. Default: 256.
+            decay : float
+                exponential decay of old counts per forward pass. Default: 0.99.
+            
+        Returns:
+        --------
+            None
+        '''
+        self.grid_sketch = QuantileSketch(self.in_dim, num_bins=num_bins, decay=decay, device=self.device)
+
+    def update_grid_from_sketch(self, points_per_interval=4):
+        '''
+        update grid from the quantile sketch and reproject coefficients onto the new grid
+        
+        Unlike update_grid_from_samples, no samples are sorted and no least squares is solved: the old splines are
+        evaluated at fixed points inside each new grid interval and projected with a Cholesky-factorized Gram matrix.
+        
+        Args:
+        -----
+            points_per_interval : int
+                number of projection points per grid interval. Default: 4.
+            
+        Returns:
+        --------
+            None
+        
+        Example
+        -------
+        >>> model = KANLayer(in_dim=1, out_dim=1, num=5, k=3)
+        >>> model.enable_grid_sketch()
+        >>> model(torch.linspace(-3,3,steps=100)[:,None])
+        >>> model.update_grid_from_sketch()
+        >>> print(model.grid.data)
+        '''
+        if self.grid_sketch is None or not self.grid_sketch.has_data():
+            return
+        self.unfreeze()
+        num_interval = self.grid.shape[1] - 1
+        levels = torch.linspace(0, 1, steps=num_interval + 1, device=self.device)
+        # sketch rows are input dimensions; grid rows are ordered as j * in_dim + i
+        grid_adaptive = self.grid_sketch.quantiles(levels).repeat(self.out_dim, 1)
+        margin = 0.01
+        grid_uniform = grid_adaptive[:, [0]] - margin + (grid_adaptive[:, [-1]] - grid_adaptive[:, [0]] + 2 * margin) * levels[None, :]
+        grid = self.grid_eps * grid_uniform + (1 - self.grid_eps) * grid_adaptive
+        projector = BSplineGramProjector(extend_knots(grid, self.k), self.k, points_per_interval=points_per_interval)
+        y_eval = coef2curve(projector.points, self.grid, self.coef, self.k, device=self.device)
+        self.grid.data = grid
+        self.coef.data = projector.project(y_eval.unsqueeze(dim=2)).squeeze(dim=2)
+
+    @torch.no_grad()
+    def freeze(self, table_size=1024, dtype=torch.float32, tolerance=None):
+        '''
+        tabulate every spline on table_size uniform points and evaluate it by linear interpolation (inference only)
+        
+        The table spans the support of the B-spline bases, i.e. the grid extended by k intervals on each side.
+        The maximum deviation from the exact splines, measured halfway between table points, is stored in table_error.
+        Grid updates (and lock/unlock) unfreeze the layer.
+        
+        Args:
+        -----
+            table_size : int
+                number of table points per spline. Default: 1024.
+            dtype : torch.dtype
+                table storage, torch.float32, torch.float16 or torch.int8. Default: torch.float32.
+            tolerance : float or None
+                if given, raise ValueError (and stay unfrozen) when table_error exceeds it. Default: None.
+            
+        Returns:
+        --------
+            table_error : float
+        
+        Example
+        -------
+        >>> model = KANLayer(in_dim=3, out_dim=5)
+        >>> model.freeze(table_size=512, dtype=torch.float16)
+        >>> y, preacts, postacts, postspline = model(torch.normal(0,1,size=(100,3)))
+        '''
+        grid = self.grid[self.weight_sharing]
+        coef = self.coef[self.weight_sharing]
+        h = (grid[:, -1] - grid[:, 0]) / (grid.shape[1] - 1)
+        low, high = grid[:, 0] - self.k * h, grid[:, -1] + self.k * h
+        values = coef2curve(table_nodes(low, high, table_size), grid, coef, self.k, device=self.device)
+        table = SplineTable(values, low, high, dtype=dtype)
+
+        mids = table_midpoints(low, high, table_size)
+        exact = coef2curve(mids, grid, coef, self.k, device=self.device)
+        approx = table(mids.permute(1, 0)).permute(1, 0)
+        error = torch.max(torch.abs(self.scale_sp[:, None] * (exact - approx))).item()
+
+        if tolerance is not None and error > tolerance:
+            raise ValueError(f"Spline table error {error:.3e} exceeds tolerance {tolerance:.3e}; increase table_size or use a wider dtype")
+        self.spline_table = table
+        self.table_error = error
+        return error
+
+    def unfreeze(self):
+        '''
+        drop the lookup tables and evaluate splines exactly again
+        '''
+        self.spline_table = None
+        self.table_error = None
+
     def initialize_grid_from_parent(self, parent, x):
         '''
         update grid from a parent KANLayer & samples
@@ -245,6 +373,7 @@ class KANLayer(nn.Module):
         tensor([[-1.0000, -0.8000, -0.6000, -0.4000, -0.2000,  0.0000,  0.2000,  0.4000,
           0.6000,  0.8000,  1.0000]])
         '''
+        self.unfreeze()
         batch = x.shape[0]
         # preacts: shape (batch, in_dim) => shape (size, batch) (size = out_dim * in_dim)
         x_eval = torch.einsum('ij,k->ikj', x, torch.ones(self.out_dim, ).to(self.device)).reshape(batch, self.size).permute(1, 0)
@@ -316,6 +445,7 @@ class KANLayer(nn.Module):
                 [3, 4, 0],
                 [6, 0, 8]])
         '''
+        self.unfreeze()
         self.lock_counter += 1
         # ids: [[i1,j1],[i2,j2],[i3,j3],...]
         for i in range(len(ids)):
@@ -358,6 +488,7 @@ class KANLayer(nn.Module):
         if locked == False:
             print("they are not locked. unlock failed.")
             return 0
+        self.unfreeze()
         for i in range(len(ids)):
             self.weight_sharing[ids[i][1] * self.in_dim + ids[i][0]] = ids[i][1] * self.in_dim + ids[i][0]
             self.lock_id[ids[i][1] * self.in_dim + ids[i][0]] = 0
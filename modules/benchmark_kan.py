@@ -0,0 +1,113 @@
+"""
+Compare the reference and fused efficient_kan.KANLinear paths.
+
+Run from the repository root:
+
+    python -m modules.benchmark_kan --batch 8192 --in_features 64 --out_features 64
+
+Reports forward/backward time and the memory autograd keeps for backward.
+Peak allocator memory is reported as well when running on CUDA. Inference
+time and table error of the frozen (lookup-table) layer are reported for
+each table dtype.
+"""
+import argparse
+import time
+
+import torch
+
+from .efficient_kan import KANLinear
+
+
+def saved_tensor_bytes(fn):
+    """Run fn and return (result, bytes of tensors saved for backward)."""
+    total = [0]
+
+    def pack(tensor):
+        total[0] += tensor.numel() * tensor.element_size()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        result = fn()
+    return result, total[0]
+
+
+def time_call(fn, device, repeats):
+    fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def benchmark_layer(layer, x, device, repeats):
+    def train_step():
+        layer.zero_grad(set_to_none=True)
+        x.grad = None
+        layer(x).sum().backward()
+
+    def infer():
+        with torch.no_grad():
+            layer(x)
+
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+    _, saved = saved_tensor_bytes(lambda: layer(x))
+    train_time = time_call(train_step, device, repeats)
+    peak = torch.cuda.max_memory_allocated() if device.type == 'cuda' else None
+    infer_time = time_call(infer, device, repeats)
+    return {'train_s': train_time, 'infer_s': infer_time, 'saved_mb': saved / 2 ** 20, 'peak_mb': None if peak is None else peak / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fused vs reference KANLinear.")
+    parser.add_argument('--batch', type=int, default=8192)
+    parser.add_argument('--in_features', type=int, default=64)
+    parser.add_argument('--out_features', type=int, default=64)
+    parser.add_argument('--grid_size', type=int, default=5)
+    parser.add_argument('--spline_order', type=int, default=3)
+    parser.add_argument('--chunk_size', type=int, default=1024)
+    parser.add_argument('--table_size', type=int, default=1024)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--device', type=str, default='cpu')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    reference = KANLinear(args.in_features, args.out_features, grid_size=args.grid_size, spline_order=args.spline_order).to(device)
+    fused = KANLinear(args.in_features, args.out_features, grid_size=args.grid_size, spline_order=args.spline_order,
+                      fused=True, fused_chunk_size=args.chunk_size).to(device)
+    fused.load_state_dict(reference.state_dict())
+
+    x = (torch.rand(args.batch, args.in_features, device=device) * 2 - 1).requires_grad_(True)
+
+    y_ref = reference(x)
+    grad_ref = torch.autograd.grad(y_ref.sum(), x)[0]
+    y_fused = fused(x)
+    grad_fused = torch.autograd.grad(y_fused.sum(), x)[0]
+    print(f"max |output diff|: {(y_ref - y_fused).abs().max().item():.3e}")
+    print(f"max |input grad diff|: {(grad_ref - grad_fused).abs().max().item():.3e}")
+
+    for name, layer in (('reference', reference), ('fused', fused)):
+        stats = benchmark_layer(layer, x, device, args.repeats)
+        line = f"{name:>9}: train step {stats['train_s'] * 1e3:8.2f} ms | inference {stats['infer_s'] * 1e3:8.2f} ms | saved for backward {stats['saved_mb']:8.2f} MB"
+        if stats['peak_mb'] is not None:
+            line += f" | peak {stats['peak_mb']:8.2f} MB"
+        print(line)
+
+    frozen = KANLinear(args.in_features, args.out_features, grid_size=args.grid_size, spline_order=args.spline_order).to(device)
+    frozen.load_state_dict(reference.state_dict())
+    for dtype in (torch.float32, torch.float16, torch.int8):
+        error = frozen.freeze(table_size=args.table_size, dtype=dtype)
+        with torch.no_grad():
+            y_table = frozen(x)
+            infer_time = time_call(lambda: frozen(x), device, args.repeats)
+        name = str(dtype).replace('torch.', 'table ')
+        print(f"{name:>13}: inference {infer_time * 1e3:8.2f} ms | table error {error:.3e} | max |output diff| {(y_ref - y_table).abs().max().item():.3e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,69 @@
 import torch
 import torch.nn.functional as F
 import math
+from .grid_adaptation import QuantileSketch, BSplineGramProjector, b_spline_basis, cox_de_boor
+from .spline_table import SplineTable, table_nodes, table_midpoints
+
+
+def spline_bases(x: torch.Tensor, grid: torch.Tensor, spline_order: int, derivative=False):
+    """
+    B-spline bases (and optionally their derivative) in the batch-major layout of KANLinear.
+
+    Args:
+        x (torch.Tensor): Input tensor of shape (batch_size, in_features).
+        grid (torch.Tensor): Extended grid of shape (in_features, grid_size + 2 * spline_order + 1).
+        spline_order (int): Order of the piecewise polynomials.
+        derivative (bool): Also return the derivative of the bases with respect to x.
+
+    Returns:
+        Tuple[torch.Tensor, Optional[torch.Tensor]]: Bases and derivatives, each of shape
+        (batch_size, in_features, grid_size + spline_order).
+    """
+    return cox_de_boor(x.unsqueeze(-1), grid, spline_order, derivative=derivative)
+
+
+class FusedSplineLinear(torch.autograd.Function):
+    """
+    Spline branch of KANLinear as a single autograd node.
+
+    The bases are computed chunk by chunk along the batch and contracted with
+    the weight immediately, so at most (chunk_size, in_features, coeff) bases
+    are alive at a time. Only the input and the weight are saved for backward;
+    the bases (and their analytic derivative) are recomputed there instead of
+    keeping every intermediate of the recursion in the autograd graph.
+    """
+
+    @staticmethod
+    def forward(ctx, x, grid, weight, spline_order, chunk_size):
+        # x: (batch, in), weight: (out, in * coeff)
+        output = x.new_empty(x.size(0), weight.size(0))
+        for start in range(0, x.size(0), chunk_size):
+            bases, _ = spline_bases(x[start : start + chunk_size], grid, spline_order)
+            torch.mm(bases.reshape(bases.size(0), -1), weight.t(), out=output[start : start + chunk_size])
+
+        ctx.save_for_backward(x, grid, weight)
+        ctx.spline_order = spline_order
+        ctx.chunk_size = chunk_size
+        return output
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        x, grid, weight = ctx.saved_tensors
+        need_x, _, need_weight = ctx.needs_input_grad[:3]
+        grad_x = torch.empty_like(x) if need_x else None
+        grad_weight = torch.zeros_like(weight) if need_weight else None
+
+        for start in range(0, x.size(0), ctx.chunk_size):
+            end = start + ctx.chunk_size
+            bases, dbases = spline_bases(x[start:end], grid, ctx.spline_order, derivative=need_x)
+            grad_chunk = grad_output[start:end]
+            if need_weight:
+                grad_weight.addmm_(grad_chunk.t(), bases.reshape(bases.size(0), -1))
+            if need_x:
+                grad_bases = torch.mm(grad_chunk, weight).view_as(dbases)
+                grad_x[start:end] = (grad_bases * dbases).sum(-1)
+
+        return grad_x, None, grad_weight, None, None
 
 
 class KANLinear(torch.nn.Module):
@@ -17,6 +80,8 @@ class KANLinear(torch.nn.Module):
         base_activation=torch.nn.SiLU,
         grid_eps=0.02,
         grid_range=[-1, 1],
+        fused=False,
+        fused_chunk_size=4096,
     ):
         super(KANLinear, self).__init__()
         self.in_features = in_features
@@ -50,6 +115,13 @@ class KANLinear(torch.nn.Module):
         self.enable_standalone_scale_spline = enable_standalone_scale_spline
         self.base_activation = base_activation()
         self.grid_eps = grid_eps
+        self.grid_sketch = None
+        self.fused = fused
+        self.fused_chunk_size = fused_chunk_size
+        self._scaled_weight_cache = None
+        self._scaled_weight_key = None
+        self.spline_table = None
+        self.table_error = None
 
         self.reset_parameters()
 
@@ -87,21 +159,7 @@ class KANLinear(torch.nn.Module):
         """
         assert x.dim() == 2 and x.size(1) == self.in_features
 
-        grid: torch.Tensor = (
-            self.grid
-        )  # (in_features, grid_size + 2 * spline_order + 1)
-        x = x.unsqueeze(-1)
-        bases = ((x >= grid[:, :-1]) & (x < grid[:, 1:])).to(x.dtype)
-        for k in range(1, self.spline_order + 1):
-            bases = (
-                (x - grid[:, : -(k + 1)])
-                / (grid[:, k:-1] - grid[:, : -(k + 1)])
-                * bases[:, :, :-1]
-            ) + (
-                (grid[:, k + 1 :] - x)
-                / (grid[:, k + 1 :] - grid[:, 1:(-k)])
-                * bases[:, :, 1:]
-            )
+        bases, _ = spline_bases(x, self.grid, self.spline_order)
 
         assert bases.size() == (
             x.size(0),
@@ -150,25 +208,105 @@ class KANLinear(torch.nn.Module):
             else 1.0
         )
 
+    def fused_spline_weight(self):
+        """
+        Flattened scaled spline weight of shape (out_features, in_features * (grid_size + spline_order)).
+
+        When no gradient is needed the product is cached and only recomputed
+        after the spline weight or scaler has been modified in place (optimizer
+        steps, load_state_dict, grid updates all bump the tensor versions).
+        """
+        params = [self.spline_weight]
+        if self.enable_standalone_scale_spline:
+            params.append(self.spline_scaler)
+        if torch.is_grad_enabled() and any(p.requires_grad for p in params):
+            return self.scaled_spline_weight.view(self.out_features, -1)
+
+        key = tuple((p.data_ptr(), p._version, p.dtype, p.device) for p in params)
+        if self._scaled_weight_key != key:
+            with torch.no_grad():
+                self._scaled_weight_cache = (
+                    self.scaled_spline_weight.view(self.out_features, -1).contiguous()
+                )
+            self._scaled_weight_key = key
+        return self._scaled_weight_cache
+
     def forward(self, x: torch.Tensor):
         assert x.size(-1) == self.in_features
         original_shape = x.shape
         x = x.view(-1, self.in_features)
 
+        if self.grid_sketch is not None and self.training:
+            self.grid_sketch.update(x)
+
         base_output = F.linear(self.base_activation(x), self.base_weight)
-        spline_output = F.linear(
-            self.b_splines(x).view(x.size(0), -1),
-            self.scaled_spline_weight.view(self.out_features, -1),
-        )
+        if self.spline_table is not None:
+            spline_output = F.linear(
+                self.spline_table(x).view(x.size(0), -1),
+                self.fused_spline_weight(),
+            )
+        elif self.fused:
+            spline_output = FusedSplineLinear.apply(
+                x.contiguous(),
+                self.grid,
+                self.fused_spline_weight(),
+                self.spline_order,
+                self.fused_chunk_size,
+            )
+        else:
+            spline_output = F.linear(
+                self.b_splines(x).view(x.size(0), -1),
+                self.scaled_spline_weight.view(self.out_features, -1),
+            )
         output = base_output + spline_output
         
         output = output.view(*original_shape[:-1], self.out_features)
         return output
 
+    @torch.no_grad()
+    def freeze(self, table_size=1024, dtype=torch.float32, tolerance=None):
+        """
+        Replace the B-spline recursion with a lookup table for inference.
+
+        The bases of every input feature are tabulated on table_size uniform
+        points over the extended grid and evaluated by gather + linear
+        interpolation. The maximum deviation of the spline output from the
+        exact spline, measured halfway between table points, is stored in
+        table_error.
+
+        Args:
+            table_size (int): Number of table points per input feature.
+            dtype (torch.dtype): Table storage dtype (torch.float32, torch.float16 or torch.int8).
+            tolerance (float): If given, raise ValueError instead of freezing when table_error exceeds it.
+
+        Returns:
+            float: The measured table error.
+        """
+        low, high = self.grid[:, 0], self.grid[:, -1]
+        values = self.b_splines(table_nodes(low, high, table_size).T)  # (table_size, in, coeff)
+        table = SplineTable(values.permute(1, 0, 2), low, high, dtype=dtype).to(self.grid.device)
+
+        mids = table_midpoints(low, high, table_size).T.contiguous()  # (table_size - 1, in)
+        weight = self.scaled_spline_weight.reshape(self.out_features, -1)
+        exact = F.linear(self.b_splines(mids).reshape(mids.size(0), -1), weight)
+        approx = F.linear(table(mids).reshape(mids.size(0), -1).to(weight.dtype), weight)
+        error = (exact - approx).abs().max().item()
+
+        if tolerance is not None and error > tolerance:
+            raise ValueError(f"Spline table error {error:.3e} exceeds tolerance {tolerance:.3e}; increase table_size or use a wider dtype")
+        self.spline_table = table
+        self.table_error = error
+        return error
+
+    def unfreeze(self):
+        self.spline_table = None
+        self.table_error = None
+
     @torch.no_grad()
     def update_grid(self, x: torch.Tensor, margin=0.01):
         assert x.dim() == 2 and x.size(1) == self.in_features
         batch = x.size(0)
+        self.unfreeze()
 
         splines = self.b_splines(x)  # (batch, in, coeff)
         splines = splines.permute(1, 0, 2)  # (in, batch, coeff)
@@ -214,6 +352,67 @@ class KANLinear(torch.nn.Module):
         self.grid.copy_(grid.T)
         self.spline_weight.data.copy_(self.curve2coeff(x, unreduced_spline_output))
 
+    def enable_grid_sketch(self, num_bins=256, decay=0.99):
+        """
+        Track input quantiles during training forward passes so the grid can be
+        refined with update_grid_from_sketch instead of a full-batch update_grid.
+        """
+        self.grid_sketch = QuantileSketch(
+            self.in_features, num_bins=num_bins, decay=decay, device=self.grid.device
+        )
+
+    @torch.no_grad()
+    def update_grid_from_sketch(self, margin=0.01, points_per_interval=4):
+        """
+        Rebuild the grid from the streaming quantile sketch and reproject the
+        spline coefficients onto it.
+
+        Unlike update_grid this does not sort a batch or solve a least squares
+        problem per call; the cost only depends on the grid size.
+        """
+        if self.grid_sketch is None or not self.grid_sketch.has_data():
+            return
+        self.unfreeze()
+
+        levels = torch.linspace(0, 1, self.grid_size + 1, device=self.grid.device)
+        grid_adaptive = self.grid_sketch.quantiles(levels)  # (in, grid_size + 1)
+
+        uniform_step = (
+            grid_adaptive[:, -1:] - grid_adaptive[:, :1] + 2 * margin
+        ) / self.grid_size
+        grid_uniform = (
+            torch.arange(self.grid_size + 1, dtype=self.grid.dtype, device=self.grid.device)
+            * uniform_step
+            + grid_adaptive[:, :1]
+            - margin
+        )
+
+        grid = self.grid_eps * grid_uniform + (1 - self.grid_eps) * grid_adaptive
+        grid = torch.cat(
+            [
+                grid[:, :1]
+                - uniform_step
+                * torch.arange(self.spline_order, 0, -1, device=self.grid.device),
+                grid,
+                grid[:, -1:]
+                + uniform_step
+                * torch.arange(1, self.spline_order + 1, device=self.grid.device),
+            ],
+            dim=1,
+        )
+
+        projector = BSplineGramProjector(
+            grid, self.spline_order, points_per_interval=points_per_interval
+        )
+
+        # the spline scaler multiplies the whole curve, so projecting the raw
+        # coefficients keeps the scaled activation unchanged
+        old_bases = b_spline_basis(projector.points, self.grid, self.spline_order)
+        old_values = torch.bmm(old_bases, self.spline_weight.permute(1, 2, 0))  # (in, points, out)
+
+        self.grid.copy_(grid)
+        self.spline_weight.data.copy_(projector.project(old_values).permute(2, 0, 1))
+
     def regularization_loss(self, regularize_activation=1.0, regularize_entropy=1.0):
         """
         Compute the regularization loss.
@@ -249,6 +448,8 @@ class KAN(torch.nn.Module):
         base_activation=torch.nn.SiLU,
         grid_eps=0.02,
         grid_range=[-1, 1],
+        fused=False,
+        fused_chunk_size=4096,
     ):
         super(KAN, self).__init__()
         self.grid_size = grid_size
@@ -268,6 +469,8 @@ class KAN(torch.nn.Module):
                     base_activation=base_activation,
                     grid_eps=grid_eps,
                     grid_range=grid_range,
+                    fused=fused,
+                    fused_chunk_size=fused_chunk_size,
                 )
             )
 
@@ -278,6 +481,31 @@ class KAN(torch.nn.Module):
             x = layer(x)
         return x
 
+    def enable_grid_sketch(self, num_bins=256, decay=0.99):
+        for layer in self.layers:
+            layer.enable_grid_sketch(num_bins=num_bins, decay=decay)
+
+    def update_grid_from_sketch(self, margin=0.01):
+        for layer in self.layers:
+            layer.update_grid_from_sketch(margin=margin)
+
+    def freeze(self, table_size=1024, dtype=torch.float32, tolerance=None):
+        previous = [(layer.spline_table, layer.table_error) for layer in self.layers]
+        try:
+            return max(
+                layer.freeze(table_size=table_size, dtype=dtype, tolerance=tolerance)
+                for layer in self.layers
+            )
+        except Exception:
+            # roll back the layers frozen before the one that failed, whatever went wrong
+            for layer, (table, error) in zip(self.layers, previous):
+                layer.spline_table, layer.table_error = table, error
+            raise
+
+    def unfreeze(self):
+        for layer in self.layers:
+            layer.unfreeze()
+
     def regularization_loss(self, regularize_activation=1.0, regularize_entropy=1.0):
         return sum(
             layer.regularization_loss(regularize_activation, regularize_entropy)
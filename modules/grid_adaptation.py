@@ -0,0 +1,216 @@
+import torch
+
+
+def extend_knots(grid: torch.Tensor, k_extend: int, h: torch.Tensor = None):
+    """
+    Pad a grid with uniformly spaced knots on both sides.
+
+    Args:
+        grid (torch.Tensor): Grid of shape (num_features, num_points).
+        k_extend (int): Number of knots to add on each side.
+        h (torch.Tensor): Knot spacing of shape (num_features, 1). Defaults to the mean spacing of the grid.
+
+    Returns:
+        torch.Tensor: Extended grid of shape (num_features, num_points + 2 * k_extend).
+    """
+    if h is None:
+        h = (grid[:, -1:] - grid[:, :1]) / (grid.shape[1] - 1)
+    steps = torch.arange(1, k_extend + 1, dtype=grid.dtype, device=grid.device)
+    return torch.cat(
+        [grid[:, :1] - h * steps.flip(0), grid, grid[:, -1:] + h * steps], dim=1
+    )
+
+
+def cox_de_boor(x: torch.Tensor, grid: torch.Tensor, spline_order: int, derivative=False):
+    """
+    Cox-de Boor recursion for B-spline bases, the one implementation shared by
+    every KAN layer in this package.
+
+    Knots run along the last dimension of grid; x and grid only need to
+    broadcast against each other, so callers pick the batch layout.
+
+    Args:
+        x (torch.Tensor): Evaluation points with a trailing singleton dimension, e.g. (..., 1).
+        grid (torch.Tensor): Extended grid of shape (..., grid_size + 2 * spline_order + 1).
+        spline_order (int): Order of the piecewise polynomials.
+        derivative (bool): Also return the derivative of the bases with respect to x.
+
+    Returns:
+        Tuple[torch.Tensor, Optional[torch.Tensor]]: Bases and derivatives (None unless derivative),
+        each with grid_size + spline_order entries in the last dimension.
+    """
+    bases = ((x >= grid[..., :-1]) & (x < grid[..., 1:])).to(x.dtype)
+    dbases = torch.zeros_like(bases) if derivative and spline_order == 0 else None
+    for k in range(1, spline_order + 1):
+        left = grid[..., k:-1] - grid[..., : -(k + 1)]
+        right = grid[..., k + 1 :] - grid[..., 1:(-k)]
+        if derivative and k == spline_order:
+            dbases = k * (bases[..., :-1] / left - bases[..., 1:] / right)
+        bases = (x - grid[..., : -(k + 1)]) / left * bases[..., :-1] + (
+            grid[..., k + 1 :] - x
+        ) / right * bases[..., 1:]
+    return bases, dbases
+
+
+def b_spline_basis(x: torch.Tensor, grid: torch.Tensor, spline_order: int):
+    """
+    Evaluate B-spline bases with per-feature evaluation points.
+
+    Args:
+        x (torch.Tensor): Evaluation points of shape (num_features, num_points).
+        grid (torch.Tensor): Extended grid of shape (num_features, grid_size + 2 * spline_order + 1).
+        spline_order (int): Order of the piecewise polynomials.
+
+    Returns:
+        torch.Tensor: Bases of shape (num_features, num_points, grid_size + spline_order).
+    """
+    return cox_de_boor(x.unsqueeze(-1), grid.unsqueeze(1), spline_order)[0]
+
+
+class QuantileSketch:
+    """
+    Streaming per-feature histogram used to track activation quantiles.
+
+    The sketch is updated from ordinary forward passes: the bin range only ever
+    grows, with some headroom so that the histogram is rarely rebinned (the
+    only host-device synchronization is the check whether a batch left the
+    range), and counts are exponentially decayed so that the quantiles follow
+    the activation distribution as training moves it.
+
+    It is deliberately a plain object rather than an nn.Module, so it never
+    appears in the owning layer's state_dict: checkpoints of a model with a
+    sketch load into a fresh model and vice versa. It follows the device of
+    the activations it is fed.
+    """
+
+    def __init__(self, num_features, num_bins=256, decay=0.99, headroom=0.1, device=None):
+        self.num_features = num_features
+        self.num_bins = num_bins
+        self.decay = decay
+        self.headroom = headroom
+
+        self.counts = torch.zeros(num_features, num_bins, device=device)
+        self.low = torch.full((num_features,), float("inf"), device=device)
+        self.high = torch.full((num_features,), float("-inf"), device=device)
+
+    def to(self, device):
+        self.counts = self.counts.to(device)
+        self.low = self.low.to(device)
+        self.high = self.high.to(device)
+        return self
+
+    def reset(self):
+        self.counts.zero_()
+        self.low.fill_(float("inf"))
+        self.high.fill_(float("-inf"))
+
+    def has_data(self):
+        return bool(self.counts.sum() > 0)
+
+    def _bin_index(self, x: torch.Tensor, low: torch.Tensor, high: torch.Tensor):
+        index = (x - low) / (high - low) * self.num_bins
+        return index.floor().clamp(0, self.num_bins - 1).long()
+
+    def _rebin(self, new_low: torch.Tensor, new_high: torch.Tensor):
+        width = self.high - self.low
+        valid = torch.isfinite(width)
+        old_low = torch.where(valid, self.low, new_low)
+        old_width = torch.where(valid, width, new_high - new_low)
+        offsets = (torch.arange(self.num_bins, device=self.counts.device) + 0.5) / self.num_bins
+        centers = old_low.unsqueeze(1) + offsets * old_width.unsqueeze(1)
+        index = self._bin_index(centers, new_low.unsqueeze(1), new_high.unsqueeze(1))
+        counts = torch.zeros_like(self.counts).scatter_add_(1, index, self.counts)
+        self.counts.copy_(counts)
+        self.low.copy_(new_low)
+        self.high.copy_(new_high)
+
+    @torch.no_grad()
+    def update(self, x: torch.Tensor):
+        """
+        Add a batch of activations to the sketch.
+
+        Args:
+            x (torch.Tensor): Activations of shape (..., num_features).
+        """
+        if x.device != self.counts.device:
+            self.to(x.device)
+        x = x.detach().reshape(-1, self.num_features).to(self.counts.dtype)
+        batch_min = x.min(dim=0)[0]
+        batch_max = x.max(dim=0)[0]
+
+        below = batch_min < self.low
+        above = batch_max > self.high
+        if bool((below | above).any()):
+            low = torch.minimum(self.low, batch_min)
+            high = torch.maximum(self.high, batch_max)
+            pad = self.headroom * (high - low) + 1e-6
+            self._rebin(
+                torch.where(below, low - pad, self.low),
+                torch.where(above, high + pad, self.high),
+            )
+
+        index = self._bin_index(x, self.low, self.high).T
+        self.counts.mul_(self.decay).scatter_add_(
+            1, index, torch.ones_like(index, dtype=self.counts.dtype)
+        )
+
+    @torch.no_grad()
+    def quantiles(self, q: torch.Tensor):
+        """
+        Estimate quantiles by linear interpolation inside the histogram bins.
+
+        Args:
+            q (torch.Tensor): Quantile levels in [0, 1] of shape (num_quantiles,).
+
+        Returns:
+            torch.Tensor: Quantiles of shape (num_features, num_quantiles).
+        """
+        cdf = torch.cumsum(self.counts, dim=1)
+        cdf = cdf / cdf[:, -1:].clamp_min(1e-12)
+        target = q.to(cdf).clamp_min(1e-6).unsqueeze(0).expand(self.num_features, -1).contiguous()
+
+        index = torch.searchsorted(cdf, target).clamp(max=self.num_bins - 1)
+        cdf_prev = torch.cat([torch.zeros_like(cdf[:, :1]), cdf[:, :-1]], dim=1).gather(1, index)
+        cdf_here = cdf.gather(1, index)
+        frac = ((target - cdf_prev) / (cdf_here - cdf_prev).clamp_min(1e-12)).clamp(0, 1)
+
+        bin_width = ((self.high - self.low) / self.num_bins).unsqueeze(1)
+        return self.low.unsqueeze(1) + (index + frac) * bin_width
+
+
+class BSplineGramProjector:
+    """
+    L2 projection onto the B-spline basis of a fixed grid.
+
+    The projection points are placed at fixed fractions inside every grid
+    interval, so when the grid follows the data quantiles they are distributed
+    like the data and the fit weights the input range the same way the
+    sample-based least squares does. The Gram matrix of the basis is banded
+    (bandwidth spline_order) and small, so it is factorized with Cholesky at
+    a cost that depends on the grid size only, independent of the batch size.
+    """
+
+    def __init__(self, grid: torch.Tensor, spline_order: int, points_per_interval=4, ridge=1e-6):
+        self.grid = grid
+        self.spline_order = spline_order
+
+        inner = grid[:, spline_order : grid.shape[1] - spline_order]
+        frac = (torch.arange(points_per_interval, dtype=grid.dtype, device=grid.device) + 0.5) / points_per_interval
+        points = inner[:, :-1, None] + (inner[:, 1:] - inner[:, :-1])[..., None] * frac
+        self.points = points.reshape(grid.shape[0], -1)  # (num_features, num_points)
+
+        self.basis = b_spline_basis(self.points, grid, spline_order)  # (num_features, num_points, coeff)
+        gram = self.basis.transpose(1, 2) @ self.basis
+        gram = gram + ridge * torch.eye(gram.shape[-1], dtype=grid.dtype, device=grid.device)
+        self.cholesky = torch.linalg.cholesky(gram)
+
+    def project(self, values: torch.Tensor):
+        """
+        Args:
+            values (torch.Tensor): Function values at self.points, shape (num_features, num_points, num_outputs).
+
+        Returns:
+            torch.Tensor: Coefficients of shape (num_features, coeff, num_outputs).
+        """
+        rhs = self.basis.transpose(1, 2) @ values
+        return torch.cholesky_solve(rhs, self.cholesky)
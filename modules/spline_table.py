@@ -0,0 +1,76 @@
+import torch
+
+
+class SplineTable(torch.nn.Module):
+    """
+    Univariate functions tabulated on a uniform grid, evaluated by gather + linear interpolation.
+
+    Each of the num_features rows holds table_size samples of C functions of
+    that feature on [low, high]; outside that range the functions are taken to
+    be zero (B-spline bases vanish outside their extended grid).
+
+    Tables can be stored as float32, float16 or int8 (symmetric, one scale per
+    feature); interpolation is always done in the input dtype.
+    """
+
+    def __init__(self, values: torch.Tensor, low: torch.Tensor, high: torch.Tensor, dtype=torch.float32):
+        """
+        Args:
+            values (torch.Tensor): Samples of shape (num_features, table_size, C) or (num_features, table_size).
+            low (torch.Tensor): Left end of each feature's range, shape (num_features,).
+            high (torch.Tensor): Right end of each feature's range, shape (num_features,).
+            dtype (torch.dtype): Storage dtype: torch.float32, torch.float16 or torch.int8.
+        """
+        super(SplineTable, self).__init__()
+        self.squeeze = values.dim() == 2
+        if self.squeeze:
+            values = values.unsqueeze(-1)
+        self.num_features, self.table_size, self.num_functions = values.shape
+
+        if dtype == torch.int8:
+            scale = values.abs().amax(dim=(1, 2)).clamp_min(1e-12) / 127
+            table = torch.round(values / scale[:, None, None]).clamp(-127, 127).to(torch.int8)
+        elif dtype in (torch.float32, torch.float16):
+            scale = None
+            table = values.to(dtype)
+        else:
+            raise ValueError(f"Unsupported table dtype: {dtype}")
+
+        self.register_buffer("table", table.reshape(-1, self.num_functions).contiguous(), persistent=False)
+        self.register_buffer("scale", scale, persistent=False)
+        self.register_buffer("low", low.clone(), persistent=False)
+        self.register_buffer("step", (high - low) / (self.table_size - 1), persistent=False)
+
+    def forward(self, x: torch.Tensor):
+        """
+        Args:
+            x (torch.Tensor): Inputs of shape (batch_size, num_features).
+
+        Returns:
+            torch.Tensor: Shape (batch_size, num_features, C), or (batch_size, num_features) for 2-D tables.
+        """
+        pos = (x - self.low) / self.step
+        inside = (pos >= 0) & (pos <= self.table_size - 1)
+        index = pos.floor().clamp(0, self.table_size - 2).long()
+        frac = (pos - index).clamp(0, 1).unsqueeze(-1)
+
+        flat = index + torch.arange(self.num_features, device=x.device) * self.table_size
+        v0 = self.table[flat].to(x.dtype)
+        v1 = self.table[flat + 1].to(x.dtype)
+        out = v0 + frac * (v1 - v0)
+        if self.scale is not None:
+            out = out * self.scale.to(x.dtype)[:, None]
+        out = out * inside.unsqueeze(-1).to(x.dtype)
+        return out.squeeze(-1) if self.squeeze else out
+
+
+def table_nodes(low: torch.Tensor, high: torch.Tensor, table_size: int):
+    """Uniform table nodes of shape (num_features, table_size)."""
+    steps = torch.linspace(0, 1, table_size, dtype=low.dtype, device=low.device)
+    return low[:, None] + (high - low)[:, None] * steps
+
+
+def table_midpoints(low: torch.Tensor, high: torch.Tensor, table_size: int):
+    """Points halfway between table nodes, where interpolation error peaks; shape (num_features, table_size - 1)."""
+    nodes = table_nodes(low, high, table_size)
+    return (nodes[:, :-1] + nodes[:, 1:]) / 2
@@ -0,0 +1,124 @@
+import math
+import numpy as np
+import sympy
+import torch
+import torch.nn as nn
+
+# sympy function names -> torch implementations (names must match what sympy's LambdaPrinter emits)
+TORCH_NAMESPACE = {
+    'sin': torch.sin, 'cos': torch.cos, 'tan': torch.tan,
+    'asin': torch.asin, 'acos': torch.acos, 'atan': torch.atan,
+    'sinh': torch.sinh, 'cosh': torch.cosh, 'tanh': torch.tanh,
+    'asinh': torch.asinh, 'acosh': torch.acosh, 'atanh': torch.atanh,
+    'exp': torch.exp, 'log': torch.log, 'sqrt': torch.sqrt,
+    'Abs': torch.abs, 'sign': torch.sign,
+    'pi': math.pi, 'E': math.e,
+}
+
+NUMPY_NAMESPACE = {
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan,
+    'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh,
+    'asinh': np.arcsinh, 'acosh': np.arccosh, 'atanh': np.arctanh,
+    'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt,
+    'Abs': np.abs, 'sign': np.sign,
+    'pi': math.pi, 'E': math.e,
+}
+
+
+def compile_formulas(formulas, variables, backend='torch'):
+    '''
+    compile symbolic formulas into one vectorized function. Common subexpressions are shared across all outputs.
+
+    Args:
+    -----
+        formulas : list of sympy expressions
+            one expression per output (e.g. the first return value of KAN.symbolic_formula)
+        variables : list of sympy symbols
+            input variables, in input-column order (e.g. the second return value of KAN.symbolic_formula)
+        backend : str
+            'torch' or 'numpy'. Default: 'torch'.
+
+    Returns:
+    --------
+        fun : callable
+            maps inputs of shape (batch, len(variables)) to outputs of shape (batch, len(formulas))
+
+    Example
+    -------
+    >>> x1, x2 = sympy.symbols('x_1 x_2')
+    >>> fun = compile_formulas([sympy.sin(x1) + x2 ** 2, sympy.sin(x1) * 2], [x1, x2])
+    >>> fun(torch.zeros(4, 2)).shape
+    torch.Size([4, 2])
+    '''
+    if backend == 'torch':
+        namespace, stack = TORCH_NAMESPACE, torch.stack
+    elif backend == 'numpy':
+        namespace, stack = NUMPY_NAMESPACE, np.stack
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    formulas = [sympy.sympify(f) for f in formulas]
+    lambdified = sympy.lambdify(variables, formulas, modules=[namespace], cse=True)
+
+    def fun(x):
+        outputs = lambdified(*[x[:, i] for i in range(x.shape[1])])
+        columns = []
+        for out in outputs:
+            # constant formulas come back as Python numbers
+            if backend == 'torch':
+                out = torch.as_tensor(out, dtype=x.dtype, device=x.device).expand(x.shape[0])
+            else:
+                out = np.broadcast_to(np.asarray(out, dtype=x.dtype), (x.shape[0],))
+            columns.append(out)
+        return stack(columns, 1)
+
+    return fun
+
+
+class CompiledSymbolicKAN(nn.Module):
+    '''
+    closed-form replacement for a fully symbolified KAN (see KAN.compile_symbolic)
+
+    Attributes:
+    -----------
+        formulas : list of sympy expressions
+            one expression per output
+        variables : list of sympy symbols
+            input variables in input-column order
+    '''
+
+    def __init__(self, formulas, variables):
+        super(CompiledSymbolicKAN, self).__init__()
+        self.formulas = formulas
+        self.variables = variables
+        self.fun = compile_formulas(formulas, variables, backend='torch')
+
+    def forward(self, x):
+        '''
+        Args:
+        -----
+            x : 2D torch.float
+                inputs, shape (batch, input dimension)
+
+        Returns:
+        --------
+            y : 2D torch.float
+                outputs, shape (batch, output dimension)
+        '''
+        return self.fun(x)
+
+    def to_torchscript(self, example_input):
+        '''
+        trace the compiled formulas into a TorchScript module
+
+        Args:
+        -----
+            example_input : 2D torch.float
+                example inputs, shape (batch, input dimension)
+
+        Returns:
+        --------
+            torch.jit.ScriptModule
+        '''
+        return torch.jit.trace(self, example_input)
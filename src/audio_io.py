@@ -0,0 +1,132 @@
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+# format name -> (extension, libsndfile format, subtype); 'npy' is raw float32 PCM for the cache builder
+AUDIO_FORMATS = {
+    'ogg': ('.ogg', 'OGG', 'VORBIS'),
+    'flac': ('.flac', 'FLAC', 'PCM_16'),
+    'wav': ('.wav', 'WAV', 'FLOAT'),
+    'npy': ('.npy', None, None),
+}
+AUDIO_EXTENSIONS = tuple(extension for extension, _, _ in AUDIO_FORMATS.values())
+
+
+def audio_extension(audio_format: str) -> str:
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format: {audio_format}. Choose from {list(AUDIO_FORMATS)}")
+    return AUDIO_FORMATS[audio_format][0]
+
+
+def _sidecar_path(npy_path: str) -> str:
+    return f"{npy_path[:-len('.npy')]}.json"
+
+
+def write_audio(waveform: np.ndarray, sample_rate: int, file_path: str, audio_format: str = None) -> str:
+    """
+    Encode waveform straight from memory with libsndfile (or as raw float32 .npy) and return the path.
+
+    The format defaults to the one matching the file extension. The file is written under a
+    temporary name and renamed into place, so a file that exists is always complete. For
+    'npy' the sample rate goes into a '<name>.json' sidecar, written before the data.
+    """
+    audio_format = audio_format or next((name for name, (extension, _, _) in AUDIO_FORMATS.items() if file_path.endswith(extension)), None)
+    extension, container, subtype = AUDIO_FORMATS[audio_format] if audio_format in AUDIO_FORMATS else (None, None, None)
+    if extension is None:
+        raise ValueError(f"Cannot infer an audio format for {file_path}")
+
+    temp_path = f"{file_path}.partial"
+    if audio_format == 'npy':
+        with open(_sidecar_path(file_path), 'w') as f:
+            json.dump({'sample_rate': int(sample_rate), 'shape': list(waveform.shape)}, f)
+        with open(temp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(waveform, dtype=np.float32))
+    else:
+        sf.write(temp_path, waveform, int(sample_rate), format=container, subtype=subtype)
+    os.replace(temp_path, file_path)
+    return file_path
+
+
+def read_audio(file_path: str, dtype: str = 'float32', mmap: bool = True) -> Tuple[np.ndarray, int]:
+    """Read any AUDIO_FORMATS file as (data, sample_rate); .npy files are memory-mapped instead of decoded."""
+    if file_path.endswith('.npy'):
+        with open(_sidecar_path(file_path)) as f:
+            sample_rate = json.load(f)['sample_rate']
+        data = np.load(file_path, mmap_mode='r' if mmap else None)
+        return (data if data.dtype == dtype else data.astype(dtype)), sample_rate
+    return sf.read(file_path, dtype=dtype)
+
+
+def audio_info(file_path: str) -> Dict[str, int]:
+    """Sample rate, frame count and channel count without decoding."""
+    if file_path.endswith('.npy'):
+        with open(_sidecar_path(file_path)) as f:
+            meta = json.load(f)
+        shape = meta['shape']
+        return {'sample_rate': meta['sample_rate'], 'frames': shape[0], 'channels': shape[1] if len(shape) > 1 else 1}
+    info = sf.info(file_path)
+    return {'sample_rate': info.samplerate, 'frames': info.frames, 'channels': info.channels}
+
+
+def find_audio_file(directory: str, base_name: str) -> str:
+    """Path of base_name in directory with whichever supported extension exists (.ogg if none does)."""
+    for extension in AUDIO_EXTENSIONS:
+        path = os.path.join(directory, f"{base_name}{extension}")
+        if os.path.exists(path):
+            return path
+    return os.path.join(directory, f"{base_name}.ogg")
+
+
+class AudioWriter:
+    """
+    Thread pool for parallel encodes (libsndfile releases the GIL while encoding).
+
+    At most max_pending waveforms are queued, so a fast producer cannot pile up audio in
+    memory; submit() blocks until a slot frees up. Errors are logged and counted, and
+    wait() blocks until everything submitted so far is on disk.
+    """
+    def __init__(self, audio_format: str = 'ogg', num_threads: int = 4, max_pending: int = None):
+        audio_extension(audio_format)
+        self.audio_format = audio_format
+        self.extension = audio_extension(audio_format)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_threads), thread_name_prefix='audio-writer')
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * max(1, num_threads))
+        self._pending: List = []
+        self.failures = 0
+
+    def path(self, directory: str, base_name: str) -> str:
+        return os.path.join(directory, f"{base_name}{self.extension}")
+
+    def submit(self, waveform: np.ndarray, sample_rate: int, file_path: str):
+        self._slots.acquire()
+        future = self._executor.submit(write_audio, waveform, sample_rate, file_path, self.audio_format)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._pending.append(future)
+        return future
+
+    def wait(self):
+        pending, self._pending = self._pending, []
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error writing audio: {e}")
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
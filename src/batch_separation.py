@@ -0,0 +1,297 @@
+import os
+import csv
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+import torch
+
+from audio_io import AUDIO_EXTENSIONS, AUDIO_FORMATS, audio_extension, read_audio, write_audio
+from separate_stems import (
+    RECONSTRUCTION_MODES, find_stem_checkpoints, load_inference_model, mono, reconstruct_audio, separate_chunks, separation_features
+)
+
+logger = logging.getLogger(__name__)
+
+DONE_FILE = 'done.json'
+REPORT_FIELDS = ['track', 'status', 'audio_seconds', 'decode_s', 'features_s', 'inference_s', 'reconstruct_s', 'total_s', 'realtime_factor', 'error']
+
+
+def _track_key(path: str, root: str) -> str:
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    if relative.startswith(os.pardir):
+        # outside the input root: keep the name, disambiguated by the full path
+        name = os.path.splitext(os.path.basename(path))[0]
+        return f"{name}_{hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]}"
+    return os.path.splitext(relative)[0]
+
+
+def find_tracks(source: str) -> List[Tuple[str, str]]:
+    """
+    (path, key) of every track in source: a directory searched recursively for audio files, or
+    a manifest with one path per line ('#' starts a comment, relative paths are relative to
+    the manifest). key is the track's output subdirectory, its path relative to the root.
+    """
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(root, f) for root, _, files in os.walk(source) for f in files if f.endswith(AUDIO_EXTENSIONS))
+        return [(path, _track_key(path, source)) for path in paths]
+
+    root = os.path.dirname(os.path.abspath(source))
+    tracks = []
+    with open(source) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                path = line if os.path.isabs(line) else os.path.join(root, line)
+                tracks.append((path, _track_key(path, root)))
+    return tracks
+
+
+def stem_names(checkpoints: Sequence[str]) -> List[str]:
+    """Output name per checkpoint: the stem of model_final_stem_<stem>.pt, else the file name."""
+    names = []
+    for path in checkpoints:
+        name = os.path.splitext(os.path.basename(path))[0]
+        names.append(name[len('model_final_stem_'):] if name.startswith('model_final_stem_') else name)
+    return names
+
+
+class _Track:
+    __slots__ = ('path', 'key', 'out_dir', 'chunks', 'mixture', 'num_frames', 'num_samples', 'sample_rate', 'timings', 'start')
+
+    def __init__(self, path, key, out_dir):
+        self.path = path
+        self.key = key
+        self.out_dir = out_dir
+        self.chunks = None
+        self.mixture = None
+        self.num_frames = 0
+        self.num_samples = 0
+        self.sample_rate = 0
+        self.timings = {}
+        self.start = time.perf_counter()
+
+
+class BatchSeparator:
+    """
+    Headless separation of many tracks through a pipelined set of stages.
+
+    Decode threads read tracks and compute their log-mel chunks into a bounded queue; the
+    inference loop packs chunks of consecutive tracks into batches of up to batch_chunks and
+    runs every stem model once per batch; encode threads reconstruct and write the stems.
+    At most max_pending tracks wait between stages, so memory stays bounded for any catalogue.
+
+    Each track's stems go to '<output_dir>/<key>/<stem><ext>', followed by a done.json holding
+    its timings; tracks with a done.json are skipped, so an interrupted run resumes where it
+    stopped. One row per track is appended to '<output_dir>/timings.csv'.
+    """
+    def __init__(
+        self, checkpoints: Sequence[str], n_mels: int, target_length: int, n_fft: int, output_dir: str,
+        device: str = None, batch_chunks: int = 64, decode_threads: int = 4, encode_threads: int = 4,
+        max_pending: int = 16, audio_format: str = 'wav', griffin_lim_iters: int = 32, reconstruction: str = 'griffinlim'
+    ):
+        if not checkpoints:
+            raise ValueError("No checkpoints to separate with")
+        if reconstruction not in RECONSTRUCTION_MODES:
+            raise ValueError(f"Unknown reconstruction mode: {reconstruction}. Choose from {RECONSTRUCTION_MODES}")
+        self.n_mels = n_mels
+        self.target_length = target_length
+        self.n_fft = n_fft
+        self.output_dir = output_dir
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.batch_chunks = batch_chunks
+        self.decode_threads = decode_threads
+        self.encode_threads = encode_threads
+        self.max_pending = max_pending
+        self.audio_format = audio_format
+        self.extension = audio_extension(audio_format)
+        self.griffin_lim_iters = griffin_lim_iters
+        self.reconstruction = reconstruction
+        self.stems = stem_names(checkpoints)
+        self.models = [load_inference_model(path, n_mels, target_length, self.device) for path in checkpoints]
+        self._report_lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def is_processed(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.output_dir, key, DONE_FILE))
+
+    def _report(self, track: _Track, status: str, error: str = ''):
+        timings = track.timings
+        audio_seconds = track.num_samples / track.sample_rate if track.sample_rate else 0.0
+        total = time.perf_counter() - track.start
+        row = {
+            'track': track.path, 'status': status, 'audio_seconds': round(audio_seconds, 3),
+            **{field: round(timings.get(field, 0.0), 4) for field in ('decode_s', 'features_s', 'inference_s', 'reconstruct_s')},
+            'total_s': round(total, 4), 'realtime_factor': round(audio_seconds / total, 2) if total > 0 else 0.0, 'error': error,
+        }
+        report_path = os.path.join(self.output_dir, 'timings.csv')
+        with self._report_lock:
+            new = not os.path.exists(report_path)
+            with open(report_path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                if new:
+                    writer.writeheader()
+                writer.writerow(row)
+        return row
+
+    def _decode_worker(self, tracks: queue.Queue, prepared: queue.Queue, failed: List[Dict]):
+        while True:
+            try:
+                track = tracks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                started = time.perf_counter()
+                audio, track.sample_rate = read_audio(track.path, dtype='float32')
+                track.num_samples = len(audio)
+                decoded = time.perf_counter()
+                audio = mono(audio)
+                if self.reconstruction == 'mixture_phase':
+                    track.mixture = audio
+                track.chunks, track.num_frames = separation_features(audio, track.sample_rate, self.n_mels, self.n_fft, self.target_length)
+                track.timings['decode_s'] = decoded - started
+                track.timings['features_s'] = time.perf_counter() - decoded
+                prepared.put(track)
+            except Exception as e:
+                logger.error(f"Error decoding {track.path}: {e}")
+                failed.append(self._report(track, 'failed', str(e)))
+        prepared.put(None)
+
+    def _reconstruct(self, track: _Track, stem_chunks: List[torch.Tensor]) -> Dict:
+        try:
+            started = time.perf_counter()
+            os.makedirs(track.out_dir, exist_ok=True)
+            for stem, chunks in zip(self.stems, stem_chunks):
+                audio = reconstruct_audio(chunks, track.num_frames, track.num_samples, track.sample_rate,
+                                          self.n_mels, self.n_fft, self.griffin_lim_iters, self.reconstruction, track.mixture)
+                write_audio(audio, track.sample_rate, os.path.join(track.out_dir, f"{stem}{self.extension}"), self.audio_format)
+            track.timings['reconstruct_s'] = time.perf_counter() - started
+            track.mixture = None
+            row = self._report(track, 'done')
+            # written last: marks the track complete for resumed runs
+            with open(os.path.join(track.out_dir, DONE_FILE), 'w') as f:
+                json.dump(row, f)
+            return row
+        except Exception as e:
+            logger.error(f"Error reconstructing {track.path}: {e}")
+            return self._report(track, 'failed', str(e))
+
+    def _run_batch(self, batch: List[_Track], encoder: ThreadPoolExecutor, slots: threading.Semaphore, futures: List):
+        started = time.perf_counter()
+        chunks = torch.cat([track.chunks for track in batch])
+        outputs = separate_chunks(self.models, chunks, self.device, self.batch_chunks)
+        elapsed = time.perf_counter() - started
+        offset = 0
+        for track in batch:
+            count = track.chunks.size(0)
+            track.timings['inference_s'] = elapsed * count / chunks.size(0)
+            stem_chunks = [output[offset:offset + count] for output in outputs]
+            track.chunks = None
+            offset += count
+            slots.acquire()
+            try:
+                future = encoder.submit(self._reconstruct, track, stem_chunks)
+            except Exception:
+                slots.release()
+                raise
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+
+    def run(self, tracks: Sequence[Tuple[str, str]]) -> Dict[str, float]:
+        """Separate every (path, key) track not yet processed; returns a summary of the run."""
+        todo = [(path, key) for path, key in tracks if not self.is_processed(key)]
+        skipped = len(tracks) - len(todo)
+        logger.info(f"{len(todo)} track(s) to separate, {skipped} already done")
+        if not todo:
+            return {'separated': 0, 'failed': 0, 'skipped': skipped, 'audio_seconds': 0.0, 'seconds': 0.0}
+
+        started = time.perf_counter()
+        pending = queue.Queue()
+        for path, key in todo:
+            pending.put(_Track(path, key, os.path.join(self.output_dir, key)))
+        prepared = queue.Queue(maxsize=self.max_pending)
+        failed: List[Dict] = []
+        decoders = [threading.Thread(target=self._decode_worker, args=(pending, prepared, failed), daemon=True, name=f'batch-decode-{i}')
+                    for i in range(max(1, self.decode_threads))]
+        for thread in decoders:
+            thread.start()
+
+        futures = []
+        slots = threading.Semaphore(self.max_pending)
+        with ThreadPoolExecutor(max_workers=max(1, self.encode_threads), thread_name_prefix='batch-encode') as encoder:
+            running = len(decoders)
+            batch, batch_size = [], 0
+            while running:
+                # block while the batch is empty; once it has tracks, only wait briefly for more
+                try:
+                    track = prepared.get(timeout=None if not batch else 0.01)
+                except queue.Empty:
+                    track = False
+                if track is None:
+                    running -= 1
+                elif track is not False:
+                    batch.append(track)
+                    batch_size += track.chunks.size(0)
+                if batch and (batch_size >= self.batch_chunks or track is False or not running):
+                    submitted = len(futures)
+                    try:
+                        self._run_batch(batch, encoder, slots, futures)
+                    except Exception as e:
+                        # tracks already handed to the encoder report their own outcome
+                        unsubmitted = batch[len(futures) - submitted:]
+                        logger.error(f"Error separating a batch of {len(batch)} track(s): {e}")
+                        failed.extend(self._report(t, 'failed', str(e)) for t in unsubmitted)
+                    batch, batch_size = [], 0
+            rows = [future.result() for future in futures]
+        for thread in decoders:
+            thread.join()
+
+        done = [row for row in rows if row['status'] == 'done']
+        summary = {
+            'separated': len(done),
+            'failed': len(failed) + len(rows) - len(done),
+            'skipped': skipped,
+            'audio_seconds': sum(row['audio_seconds'] for row in done),
+            'seconds': time.perf_counter() - started,
+        }
+        logger.info(f"Separated {summary['separated']} track(s) ({summary['audio_seconds'] / 3600:.2f} h of audio) in "
+                    f"{summary['seconds']:.1f} s, {summary['audio_seconds'] / max(summary['seconds'], 1e-9):.1f}x real time; "
+                    f"{summary['failed']} failed, {skipped} skipped")
+        return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Separate a directory or manifest of tracks without the web app.")
+    parser.add_argument('input', help="directory searched recursively for audio files, or a manifest with one path per line")
+    parser.add_argument('output_dir')
+    parser.add_argument('--checkpoint_dir', required=True)
+    parser.add_argument('--num_stems', type=int, default=None)
+    parser.add_argument('--n_mels', type=int, default=128)
+    parser.add_argument('--target_length', type=int, default=256)
+    parser.add_argument('--n_fft', type=int, default=2048)
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--batch_chunks', type=int, default=64, help="spectrogram chunks per forward pass")
+    parser.add_argument('--decode_threads', type=int, default=4)
+    parser.add_argument('--encode_threads', type=int, default=4)
+    parser.add_argument('--max_pending', type=int, default=16, help="tracks buffered between stages")
+    parser.add_argument('--audio_format', default='wav', choices=[name for name in AUDIO_FORMATS if name != 'npy'])
+    parser.add_argument('--griffin_lim_iters', type=int, default=32)
+    parser.add_argument('--reconstruction', default='griffinlim', choices=list(RECONSTRUCTION_MODES),
+                        help="phase from Griffin-Lim, or from the mixture's STFT (faster)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    separator = BatchSeparator(
+        find_stem_checkpoints(args.checkpoint_dir, args.num_stems), args.n_mels, args.target_length, args.n_fft, args.output_dir,
+        device=args.device, batch_chunks=args.batch_chunks, decode_threads=args.decode_threads, encode_threads=args.encode_threads,
+        max_pending=args.max_pending, audio_format=args.audio_format, griffin_lim_iters=args.griffin_lim_iters,
+        reconstruction=args.reconstruction
+    )
+    separator.run(find_tracks(args.input))
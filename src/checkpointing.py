@@ -0,0 +1,143 @@
+import os
+import re
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FORMAT_VERSION = 1
+
+
+def capture_rng_state() -> Dict[str, Any]:
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: Dict[str, Any]):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'].cpu())
+    if 'cuda' in state and torch.cuda.is_available():
+        cuda_states = [s.cpu() for s in state['cuda']]
+        if len(cuda_states) == torch.cuda.device_count():
+            torch.cuda.set_rng_state_all(cuda_states)
+        else:
+            logger.warning("CUDA device count changed since the checkpoint was written; CUDA RNG state not restored.")
+
+
+def _to_host(obj: Any, pin: bool) -> Any:
+    # copies every tensor to (pinned) host memory with non-blocking copies; other leaves are kept as-is
+    if isinstance(obj, torch.Tensor):
+        if obj.device.type == 'cpu':
+            return obj.detach().clone()
+        host = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=pin)
+        host.copy_(obj.detach(), non_blocking=pin)
+        return host
+    if isinstance(obj, dict):
+        return type(obj)((key, _to_host(value, pin)) for key, value in obj.items())
+    if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+        return type(obj)(*(_to_host(value, pin) for value in obj))
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_host(value, pin) for value in obj)
+    return obj
+
+
+class CheckpointManager:
+    """
+    Writes full training-state checkpoints without blocking the training thread.
+
+    save() snapshots the state into pinned host buffers with non-blocking copies and hands
+    it to a single background writer thread, which waits for the copies on a CUDA event,
+    writes to a temporary file and atomically renames it into place, then deletes all but
+    the keep_last most recent checkpoints. At most one snapshot is in flight: a new save()
+    waits for the previous write only if the disk has not caught up yet.
+    """
+    def __init__(self, checkpoint_dir: str, prefix: str = 'checkpoint', keep_last: int = 3):
+        self.checkpoint_dir = checkpoint_dir
+        self.prefix = prefix
+        self.keep_last = keep_last
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint-writer')
+        self._pending = None
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def path_for(self, global_step: int) -> str:
+        return os.path.join(self.checkpoint_dir, f"{self.prefix}_step_{global_step:09d}.pt")
+
+    def list_checkpoints(self) -> List[str]:
+        return list_full_checkpoints(self.checkpoint_dir, self.prefix)
+
+    def save(self, state: Dict[str, Any], global_step: int) -> str:
+        self.wait()
+        pin = torch.cuda.is_available()
+        snapshot = _to_host(state, pin)
+        snapshot['format_version'] = CHECKPOINT_FORMAT_VERSION
+        event = None
+        if pin:
+            event = torch.cuda.Event()
+            event.record()
+        path = self.path_for(global_step)
+        self._pending = self._executor.submit(self._write, snapshot, event, path)
+        return path
+
+    def _write(self, snapshot: Dict[str, Any], event: Optional[torch.cuda.Event], path: str):
+        if event is not None:
+            event.synchronize()
+        tmp_path = f"{path}.tmp"
+        torch.save(snapshot, tmp_path)
+        os.replace(tmp_path, path)
+        for old_path in self.list_checkpoints()[:-self.keep_last] if self.keep_last > 0 else []:
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                logger.warning(f"Could not remove old checkpoint {old_path}: {e}")
+        logger.info(f"Saved checkpoint: {path}")
+
+    def wait(self):
+        if self._pending is not None:
+            try:
+                self._pending.result()
+            except Exception as e:
+                logger.error(f"Checkpoint write failed: {e}", exc_info=True)
+            self._pending = None
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown(wait=True)
+
+
+def list_full_checkpoints(checkpoint_dir: str, prefix: str = 'checkpoint') -> List[str]:
+    """Full-state checkpoints in checkpoint_dir, oldest first."""
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    pattern = re.compile(rf"^{re.escape(prefix)}_step_(\d+)\.pt$")
+    found = []
+    for file_name in os.listdir(checkpoint_dir):
+        match = pattern.match(file_name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(checkpoint_dir, file_name)))
+    return [path for _, path in sorted(found)]
+
+
+def find_latest_checkpoint(checkpoint_dir: str) -> Optional[str]:
+    """Most recently written full-state checkpoint of any prefix in checkpoint_dir, or None."""
+    if not os.path.isdir(checkpoint_dir):
+        return None
+    pattern = re.compile(r"^.+_step_\d+\.pt$")
+    paths = [os.path.join(checkpoint_dir, f) for f in os.listdir(checkpoint_dir) if pattern.match(f)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def load_checkpoint(path: str, map_location: Any = 'cpu') -> Dict[str, Any]:
+    # full-state checkpoints hold optimizer/RNG state and the run configuration, not just tensors
+    return torch.load(path, map_location=map_location, weights_only=False)
@@ -0,0 +1,162 @@
+import os
+import json
+import struct
+import logging
+from functools import lru_cache
+from typing import Dict, Any, Union, List
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# Layout (safetensors-like, little endian):
+#   u64 header_size | JSON header (space padded) | raw tensor bytes
+# The header maps "<model>/<tensor name>" to {"dtype", "shape", "data_offsets": [begin, end]}
+# (offsets relative to the start of the data section) and holds "__metadata__" with one
+# JSON config per model. Every tensor starts on an ALIGNMENT boundary so it can be viewed
+# in place from a memory map.
+FLAT_CHECKPOINT_SUFFIX = '.flat'
+ALIGNMENT = 64
+
+_DTYPE_TO_NAME = {
+    torch.float64: 'F64', torch.float32: 'F32', torch.float16: 'F16', torch.bfloat16: 'BF16',
+    torch.int64: 'I64', torch.int32: 'I32', torch.int16: 'I16', torch.int8: 'I8', torch.uint8: 'U8',
+    torch.bool: 'BOOL',
+}
+_NAME_TO_DTYPE = {name: dtype for dtype, name in _DTYPE_TO_NAME.items()}
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_flat_checkpoint(path: str, models: Dict[str, Union[nn.Module, Dict[str, torch.Tensor]]], configs: Dict[str, Dict[str, Any]] = None):
+    """
+    Write one or more models (e.g. one per stem) into a single flat tensor file.
+
+    models maps a model name to an nn.Module or a state dict; configs optionally maps the
+    same names to JSON-serializable constructor arguments stored alongside the weights.
+    """
+    header, tensors, offset = {}, [], 0
+    for model_name, model in models.items():
+        state_dict = model.state_dict() if isinstance(model, nn.Module) else model
+        for tensor_name, tensor in state_dict.items():
+            tensor = tensor.detach().cpu().contiguous()
+            if tensor.dtype not in _DTYPE_TO_NAME:
+                raise ValueError(f"Unsupported dtype {tensor.dtype} for {model_name}/{tensor_name}")
+            begin = _align(offset)
+            end = begin + tensor.numel() * tensor.element_size()
+            header[f"{model_name}/{tensor_name}"] = {'dtype': _DTYPE_TO_NAME[tensor.dtype], 'shape': list(tensor.shape), 'data_offsets': [begin, end]}
+            tensors.append((begin, tensor))
+            offset = end
+    header['__metadata__'] = {'models': list(models), 'configs': configs or {}}
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    # pad the header so the data section itself starts aligned
+    header_bytes += b' ' * (_align(8 + len(header_bytes)) - 8 - len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        data_start = f.tell()
+        for begin, tensor in tensors:
+            f.seek(data_start + begin)
+            f.write(tensor.reshape(-1).view(torch.uint8).numpy().tobytes() if tensor.numel() else b'')
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote flat checkpoint with {len(models)} model(s) to {path}")
+
+
+class FlatCheckpoint:
+    """
+    Read-only view of a flat checkpoint file.
+
+    The file is memory-mapped copy-on-write once; state_dict() returns tensors that are
+    views into the mapping, so nothing is read until the pages are touched and several
+    models stored in the same file share one mapping.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            header_size = struct.unpack('<Q', f.read(8))[0]
+            header = json.loads(f.read(header_size).decode('utf-8'))
+        self.metadata = header.pop('__metadata__', {})
+        self.entries = header
+        self.data_start = 8 + header_size
+        file_size = os.path.getsize(path)
+        self._buffer = torch.from_numpy(np.memmap(path, dtype=np.uint8, mode='c', offset=self.data_start, shape=(file_size - self.data_start,))) if file_size > self.data_start else torch.empty(0, dtype=torch.uint8)
+
+    @property
+    def models(self) -> List[str]:
+        return self.metadata.get('models', [])
+
+    def config(self, model_name: str) -> Dict[str, Any]:
+        return self.metadata.get('configs', {}).get(model_name, {})
+
+    def state_dict(self, model_name: str = None) -> Dict[str, torch.Tensor]:
+        if model_name is None:
+            if len(self.models) != 1:
+                raise ValueError(f"{self.path} holds models {self.models}; pass the one to load")
+            model_name = self.models[0]
+        prefix = f"{model_name}/"
+        state_dict = {}
+        for key, entry in self.entries.items():
+            if not key.startswith(prefix):
+                continue
+            begin, end = entry['data_offsets']
+            dtype = _NAME_TO_DTYPE[entry['dtype']]
+            state_dict[key[len(prefix):]] = self._buffer[begin:end].view(dtype).reshape(entry['shape'])
+        if not state_dict:
+            raise KeyError(f"No model named {model_name} in {self.path}")
+        return state_dict
+
+
+@lru_cache(maxsize=8)
+def _open_flat_checkpoint(path: str, mtime: float) -> FlatCheckpoint:
+    return FlatCheckpoint(path)
+
+
+def open_flat_checkpoint(path: str) -> FlatCheckpoint:
+    """Shared FlatCheckpoint for path (re-opened when the file changes)."""
+    path = os.path.abspath(path)
+    return _open_flat_checkpoint(path, os.path.getmtime(path))
+
+
+def materialize(model_factory, state_dict: Dict[str, torch.Tensor], device: Union[str, torch.device] = 'cpu') -> nn.Module:
+    """
+    Build a model on the meta device and assign state_dict tensors as its parameters.
+
+    No parameter memory is allocated for the random initialisation; on CPU the parameters
+    stay views of the memory map, on other devices they are copied over once.
+    """
+    with torch.device('meta'):
+        model = model_factory()
+    model.load_state_dict(state_dict, assign=True)
+    return model.to(device)
+
+
+def export_flat_checkpoint(checkpoint_paths: Dict[str, str], out_path: str, config: Dict[str, Any] = None):
+    """Convert torch.save checkpoints (plain or full training-state) into one flat file, e.g. {'vocals': 'model_final_stem_vocals.pt', ...}."""
+    models = {}
+    for name, checkpoint_path in checkpoint_paths.items():
+        state_dict = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+        if 'model_state_dict' in state_dict:
+            state_dict = state_dict['model_state_dict']
+        models[name] = state_dict
+    save_flat_checkpoint(out_path, models, {name: config or {} for name in models})
+    return out_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack stem model checkpoints into one memory-mappable flat checkpoint.")
+    parser.add_argument('out_path', help=f"output file, conventionally ending in {FLAT_CHECKPOINT_SUFFIX}")
+    parser.add_argument('models', nargs='+', help="name=checkpoint.pt pairs, e.g. vocals=checkpoints/model_final_stem_vocals.pt")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    export_flat_checkpoint(dict(model.split('=', 1) for model in args.models), args.out_path)
@@ -1,65 +1,146 @@
 import os
-import random
 import numpy as np
-import soundfile as sf
-from prepare_dataset import normalize_length, ensure_mono
-from pydub import AudioSegment
+from concurrent.futures import ProcessPoolExecutor
+from prepare_dataset import normalize_length, read_source
+from pcm_store import open_pcm_store
+from audio_io import AudioWriter, audio_extension
 import warnings
 
 warnings.filterwarnings("ignore", message="Lazy modules are a new feature under heavy development")
 warnings.filterwarnings("ignore", message="oneDNN custom operations are on. You may see slightly different numerical results due to floating-point round-off errors from different computation orders.")
 
-def save_as_ogg(waveform, sample_rate, file_path):
-    temp_wav_path = file_path.replace('.ogg', '.wav')
-    sf.write(temp_wav_path, waveform, sample_rate)
-    audio = AudioSegment.from_wav(temp_wav_path)
-    audio.export(file_path, format='ogg')
-    os.remove(temp_wav_path)
-
-def generate_shuffled_noise(input_dirs, output_dir, num_examples=100, target_length=180):
+SHUFFLE_MODES = ('sample', 'block')
+DEFAULT_BATCH_SIZE = 4
+
+_writers = {}
+
+def _get_writer(audio_format, encode_threads):
+    # one encoder pool per worker process, reused across batches
+    key = (audio_format, encode_threads)
+    if key not in _writers:
+        _writers[key] = AudioWriter(audio_format, num_threads=encode_threads)
+    return _writers[key]
+
+def block_shuffle(buffer, rng, block_size):
+    """Shuffle each row of buffer in blocks of block_size samples (a trailing partial block stays in place)."""
+    rows, num_samples = buffer.shape
+    num_blocks = num_samples // block_size
+    if num_blocks < 2:
+        return buffer
+    body = buffer[:, :num_blocks * block_size].reshape(rows, num_blocks, block_size)
+    order = rng.permuted(np.broadcast_to(np.arange(num_blocks), (rows, num_blocks)), axis=1)
+    buffer[:, :num_blocks * block_size] = np.take_along_axis(body, order[:, :, None], axis=1).reshape(rows, -1)
+    return buffer
+
+def _noise_path(output_dir, index, audio_format):
+    return os.path.join(output_dir, f'shuffled_noise_{index+1}{audio_extension(audio_format)}')
+
+def generate_noise_batch(indices, files_dict, output_dir, target_length, seed=None, shuffle_mode='sample', block_size=2048,
+                         audio_format='ogg', encode_threads=4, pcm_store_dir=None, write=None):
+    """
+    Generate the noise examples in indices with one (examples * stems, samples) buffer.
+
+    Every row is filled with a randomly chosen stem, the whole buffer is shuffled along time
+    in a single Generator.permuted call ('sample') or block-wise ('block', keeping the
+    spectral texture inside each block), and each example is the peak-normalized sum of its
+    stem rows. The generator is seeded with (seed, indices[0]), so a batch always holds the
+    same examples; write restricts the output to some of them (default: all). Encodes overlap
+    with generating the next batch. Returns the indices written.
+    """
+    writer = _get_writer(audio_format, encode_threads)
+    write = set(indices if write is None else write)
+    rng = np.random.default_rng(None if seed is None else [seed, indices[0]])
+    stems = list(files_dict)
+    buffer, sample_rate = None, None
+
+    for row, stem in enumerate(stems * len(indices)):
+        files = files_dict[stem]
+        waveform, file_sample_rate = read_source(files[rng.integers(len(files))], pcm_store_dir)
+        if buffer is None:
+            sample_rate = file_sample_rate
+            buffer = np.empty((len(indices) * len(stems), target_length * sample_rate), dtype=np.float32)
+        buffer[row] = normalize_length(waveform, sample_rate, target_length)
+
+    if shuffle_mode == 'block':
+        block_shuffle(buffer, rng, block_size)
+    else:
+        rng.permuted(buffer, axis=1, out=buffer)
+
+    mixtures = buffer.reshape(len(indices), len(stems), -1).sum(axis=1)
+    peaks = np.abs(mixtures).max(axis=1, keepdims=True)
+    mixtures /= np.where(peaks > 0, peaks, 1)
+
+    written = [index for index in indices if index in write]
+    for index, mixture in zip(indices, mixtures):
+        if index in write:
+            writer.submit(mixture, sample_rate, _noise_path(output_dir, index, audio_format))
+    writer.wait()
+    return written
+
+def _generate_noise_batch_task(args):
+    indices, write, kwargs = args
+    try:
+        return generate_noise_batch(indices, write=write, **kwargs)
+    except Exception as e:
+        print(f"Error generating shuffled noise examples {indices[0]+1}-{indices[-1]+1}: {e}")
+        return []
+
+def generate_shuffled_noise(input_dirs, output_dir, num_examples=100, target_length=180, audio_format='ogg', encode_threads=4, pcm_store_dir=None,
+                            num_workers=None, seed=None, shuffle_mode='sample', block_size=2048, batch_size=DEFAULT_BATCH_SIZE):
+    if shuffle_mode not in SHUFFLE_MODES:
+        raise ValueError(f"Unknown shuffle mode: {shuffle_mode}. Choose from {SHUFFLE_MODES}")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
     stem_types = list(input_dirs.keys())
     files_dict = {stem: [os.path.join(input_dirs[stem], f) for f in os.listdir(input_dirs[stem]) if f.endswith(('.wav', '.ogg', '.flac'))] for stem in stem_types}
+    files_dict = {stem: files for stem, files in files_dict.items() if files}
     
     print(f"Generating shuffled noise from stems.")
 
     for stem, files in files_dict.items():
         print(f"Found {len(files)} audio files in {stem} stem")
 
-    data = []
-
-    for i in range(num_examples):
-        combined_waveform = None
-        sample_rate = None
-
-        for stem in stem_types:
-            file = random.choice(files_dict[stem])
-            file_path = os.path.join(input_dirs[stem], file)
-            waveform, sample_rate = sf.read(file_path, dtype='float32')
-            waveform = ensure_mono(waveform)
-            normalized_waveform = normalize_length(waveform, sample_rate, target_length)
-            
-            shuffled_waveform = np.random.permutation(normalized_waveform)  # Shuffle the waveform
-            
-            if combined_waveform is None:
-                combined_waveform = np.zeros_like(shuffled_waveform)
-            
-            combined_waveform += shuffled_waveform  # Combine shuffled noise
-
-        # Normalize to prevent clipping
-        combined_waveform = combined_waveform / np.max(np.abs(combined_waveform))
-
-        data.append(combined_waveform)
-        
-        print(f"Generated shuffled noise example {i+1}")
-
-    data = np.array(data)
-
-    for idx, example in enumerate(data):
-        file_path = os.path.join(output_dir, f'shuffled_noise_{idx+1}.ogg')
-        save_as_ogg(example, sample_rate, file_path)
+    if not files_dict:
+        print("No audio files found; nothing to generate.")
+        return
+
+    num_workers = num_workers or os.cpu_count() or 1
+    if pcm_store_dir:
+        # decode every source once; examples then read memory-mapped PCM
+        open_pcm_store(pcm_store_dir).ingest_all([f for files in files_dict.values() for f in files], num_workers)
+
+    # examples already on disk are complete (writes are atomic), so reruns resume
+    pending = [i for i in range(num_examples) if not os.path.exists(_noise_path(output_dir, i, audio_format))]
+    if len(pending) < num_examples:
+        print(f"Resuming: {num_examples - len(pending)} of {num_examples} examples already in {output_dir}")
+    kwargs = dict(files_dict=files_dict, output_dir=output_dir, target_length=target_length, seed=seed, shuffle_mode=shuffle_mode,
+                  block_size=block_size, audio_format=audio_format, encode_threads=encode_threads, pcm_store_dir=pcm_store_dir)
+    # batches follow a fixed grid over range(num_examples) rather than the pending list, so a resumed
+    # run regenerates a partly written batch from the same seed and fills in only its missing examples
+    batch_size = max(1, int(batch_size))
+    pending_set = set(pending)
+    tasks = []
+    for start in range(0, num_examples, batch_size):
+        indices = list(range(start, min(start + batch_size, num_examples)))
+        write = [i for i in indices if i in pending_set]
+        if write:
+            tasks.append((indices, write, kwargs))
+
+    done = num_examples - len(pending)
+    if num_workers <= 1:
+        results = map(_generate_noise_batch_task, tasks)
+        for written in results:
+            done += len(written)
+            print(f"Generated shuffled noise examples ({done}/{num_examples})")
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            for written in executor.map(_generate_noise_batch_task, tasks):
+                done += len(written)
+                print(f"Generated shuffled noise examples ({done}/{num_examples})")
 
     print(f"Saved shuffled noise data to {output_dir}")
 
@@ -84,6 +165,13 @@ if __name__ == "__main__":
     parser.add_argument('--input_dir', type=str, required=True, help='Base directory with organized stems.')
     parser.add_argument('--output_dir', type=str, required=True, help='Output directory for shuffled noise dataset.')
     parser.add_argument('--num_examples', type=int, required=True, help='Number of shuffled noise examples to generate.')
+    parser.add_argument('--audio_format', type=str, default='ogg', choices=['ogg', 'flac', 'wav', 'npy'], help='Output encoding (npy: raw float32 PCM).')
+    parser.add_argument('--pcm_store_dir', type=str, default=None, help='Decode source stems once into this memory-mapped PCM store.')
+    parser.add_argument('--num_workers', type=int, default=None, help='Worker processes (default: one per CPU).')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible examples.')
+    parser.add_argument('--shuffle_mode', type=str, default='sample', choices=SHUFFLE_MODES, help='Shuffle single samples or blocks of --block_size samples.')
+    parser.add_argument('--block_size', type=int, default=2048, help='Block length in samples for --shuffle_mode block.')
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE, help='Examples shuffled together per task (memory grows linearly).')
 
     args = parser.parse_args()
 
@@ -96,4 +184,5 @@ if __name__ == "__main__":
         'other': os.path.join(args.input_dir, 'other')
     }
 
-    generate_shuffled_noise(input_dirs, args.output_dir, args.num_examples)
+    generate_shuffled_noise(input_dirs, args.output_dir, args.num_examples, audio_format=args.audio_format, pcm_store_dir=args.pcm_store_dir,
+                            num_workers=args.num_workers, seed=args.seed, shuffle_mode=args.shuffle_mode, block_size=args.block_size, batch_size=args.batch_size)
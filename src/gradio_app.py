@@ -3,15 +3,17 @@ import torch
 import torch.nn as nn
 import gradio as gr
 from train import start_training_wrapper, stop_training_wrapper, resume_training_wrapper
-from separate_stems import perform_separation
-from model import load_model
-import torchaudio.transforms as T
+from separate_stems import (
+    RECONSTRUCTION_MODES, find_stem_checkpoints, load_inference_model, mono, reconstruct_audio, separate_chunks, separation_features
+)
+from separation_service import get_separation_service
 import logging
 import soundfile as sf
-import mir_eval
+from evaluation import bss_metrics
 from prepare_dataset import organize_and_prepare_dataset_gradio
 from generate_other_noise import generate_shuffled_noise_gradio
 from hyperparameter_optimization import objective_optuna, start_optuna_optimization
+from multifidelity_search import run_search
 import warnings
 
 warnings.filterwarnings("ignore", message="Lazy modules are a new feature under heavy development")
@@ -47,43 +49,72 @@ def read_audio(file_path, suppress_messages=False):
         logger.error(f"Error decoding audio file {file_path}: {e}")
     return None, None
 
+def _as_source_rows(audio):
+    # (time,) / (time, channels) / (1, time, channels) -> one flat row per source
+    audio = torch.as_tensor(audio, dtype=torch.float32)
+    return audio.reshape(1, -1) if audio.dim() <= 2 else audio.reshape(audio.size(0), -1)
+
 def calculate_metrics(true_audio, predicted_audio, sample_rate):
-    sdr, sir, sar, _ = mir_eval.separation.bss_eval_sources(true_audio, predicted_audio)
-    return sdr, sir, sar
+    references = torch.cat([_as_source_rows(audio) for audio in true_audio])
+    estimates = torch.cat([_as_source_rows(audio) for audio in predicted_audio])
+    length = min(references.size(1), estimates.size(1))
+    references, estimates = references[:, :length], estimates[:, :length]
+    if references.size(0) == 1 and estimates.size(0) > 1:
+        # a single (mixture) reference: score each estimate on its own instead of against a singular source set
+        metrics = bss_metrics(references.expand(estimates.size(0), -1).unsqueeze(1), estimates.unsqueeze(1))
+        metrics = {name: value.squeeze(1) for name, value in metrics.items()}
+    else:
+        metrics = bss_metrics(references, estimates)
+    return metrics['sdr'].tolist(), metrics['sir'].tolist(), metrics['sar'].tolist()
 
-def perform_separation_wrapper(checkpoint_dir, file_path, n_mels, target_length, n_fft, num_stems, cache_dir, suppress_reading_messages):
-    logger.info("Starting separation...")
-    result_paths = perform_separation(checkpoint_dir, file_path, n_mels, target_length, n_fft, num_stems, cache_dir, suppress_reading_messages)
+def perform_separation_wrapper(checkpoint_dir, file_path, n_mels, target_length, n_fft, num_stems, cache_dir, suppress_reading_messages, reconstruction="griffinlim", progress=gr.Progress()):
+    if not suppress_reading_messages:
+        logger.info(f"Starting separation of {file_path}...")
+    # warm models, micro-batching and result caching live in the shared service; this call only waits on its job
+    try:
+        service = get_separation_service(checkpoint_dir, n_mels, target_length, n_fft, num_stems, cache_dir)
+        job = service.submit(file_path, reconstruction)
+    except (OSError, RuntimeError, ValueError) as e:
+        raise gr.Error(str(e))
+    for fraction, message in job.events():
+        progress(fraction, desc=message)
+    if job.error is not None:
+        raise gr.Error(f"Separation failed: {job.error}")
     logger.info("Separation completed.")
-    return result_paths
+    return job.result_paths
 
 def get_checkpoints(checkpoint_dir="./checkpoints"):
     if not os.path.exists(checkpoint_dir):
         return []
     return [os.path.join(checkpoint_dir, f) for f in os.listdir(checkpoint_dir) if f.endswith(".pt")]
 
-def evaluate_model(input_audio_path, checkpoint_dir, n_mels, target_length, n_fft, num_stems, cache_dir, suppress_reading_messages):
+def evaluate_model(input_audio_path, checkpoint_dir, n_mels, target_length, n_fft, num_stems, cache_dir, suppress_reading_messages, reference_files=""):
     input_audio, sr = read_audio(input_audio_path, suppress_messages=suppress_reading_messages)
     if input_audio is None:
         return "Error: Input audio could not be read", "", ""
 
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    output_audio = []
+    reference_paths = [path.strip() for path in (reference_files or "").split(",") if path.strip()]
+    if reference_paths:
+        reference_audio = [read_audio(path, suppress_messages=suppress_reading_messages)[0] for path in reference_paths]
+        if any(audio is None for audio in reference_audio):
+            return "Error: Reference stem could not be read", "", ""
+    else:
+        logger.warning("No reference stems given; scoring every stem against the mixture.")
+        reference_audio = [input_audio]
 
-    for stem in range(num_stems):
-        checkpoint_path = os.path.join(checkpoint_dir, f'checkpoint_stem_{stem}.pt')
-        model = load_model(checkpoint_path, 1, 64, n_mels, target_length, 1, device)  # 1 stem per model
-        model.eval()
+    checkpoints = find_stem_checkpoints(checkpoint_dir, num_stems)
+    if not checkpoints:
+        return f"Error: No checkpoints found in {checkpoint_dir}", "", ""
 
-        with torch.no_grad():
-            input_mel = T.MelSpectrogram(sample_rate=sr, n_mels=n_mels, n_fft=n_fft)(input_audio.float()).unsqueeze(0).to(device)
-            output_mel = model(input_mel).cpu()
-            inverse_mel_transform = T.InverseMelScale(n_stft=n_fft // 2 + 1, n_mels=n_mels)
-            griffin_lim_transform = T.GriffinLim(n_fft=n_fft, n_iter=32)
-            audio = griffin_lim_transform(inverse_mel_transform(output_mel.squeeze(0))).numpy()
-            output_audio.append(audio)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    n_mels, target_length, n_fft = int(n_mels), int(target_length), int(n_fft)
+    audio = mono(input_audio.squeeze(0))
+    chunks, num_frames = separation_features(audio, sr, n_mels, n_fft, target_length)
+    models = [load_inference_model(path, n_mels, target_length, device) for path in checkpoints]  # 1 stem per model
+    output_audio = [reconstruct_audio(output, num_frames, audio.size(0), sr, n_mels, n_fft, mixture=audio)
+                    for output in separate_chunks(models, chunks, device)]
 
-    sdr, sir, sar = calculate_metrics(input_audio.numpy(), output_audio, sr)
+    sdr, sir, sar = calculate_metrics(reference_audio, output_audio, sr)
 
     return sdr, sir, sar
 
@@ -112,7 +143,7 @@ with gr.Blocks() as demo:
         loss_function_d = gr.Dropdown(label="Discriminator Loss Function", choices=["MSELoss", "L1Loss", "SmoothL1Loss", "BCEWithLogitsLoss", "WassersteinLoss"], value="WassersteinLoss")
         optimizer_name_g = gr.Dropdown(label="Generator Optimizer", choices=["SGD", "Momentum", "Adagrad", "RMSProp", "Adadelta", "Adam"], value="SGD")
         optimizer_name_d = gr.Dropdown(label="Discriminator Optimizer", choices=["SGD", "Momentum", "Adagrad", "RMSProp", "Adadelta", "Adam"], value="RMSProp")
-        perceptual_loss_flag = gr.Checkbox(label="Use Perceptual Loss", value=True)
+        perceptual_loss_flag = gr.Dropdown(label="Perceptual Loss", choices=["off", "multires", "vgg16"], value="multires")
         clip_value = gr.Number(label="Gradient Clipping Value", value=1)
         scheduler_step_size = gr.Number(label="Scheduler Step Size", value=10)
         scheduler_gamma = gr.Number(label="Scheduler Gamma", value=0.9)
@@ -130,7 +161,7 @@ with gr.Blocks() as demo:
         perceptual_loss_weight = gr.Number(label="Perceptual Loss Weight", value=0.1)
         suppress_detailed_logs = gr.Checkbox(label="Suppress Detailed Logs", value=False)
         use_cache = gr.Checkbox(label="Use Cache", value=True)
-        optimization_method = gr.Dropdown(label="Optimization Method", choices=["None", "Optuna"], value="Optuna")
+        optimization_method = gr.Dropdown(label="Optimization Method", choices=["None", "Optuna", "Hyperband", "PBT"], value="Optuna")
         optuna_trials = gr.Number(label="Optuna Trials", value=1)
         channel_multiplier = gr.Number(label="Channel Multiplier", value=1.0)  # Add channel_multiplier input
         start_training_button = gr.Button("Start Training")
@@ -185,6 +216,8 @@ with gr.Blocks() as demo:
             log_training_parameters(gradio_params)
             if optimization_method == "Optuna":
                 return start_optuna_optimization(optuna_trials, gradio_params)
+            elif optimization_method in ("Hyperband", "PBT"):
+                return run_search(optimization_method.lower(), gradio_params)
             else:
                 return start_training_wrapper(data_dir, val_dir, batch_size, num_epochs, learning_rate_g, learning_rate_d, use_cuda, checkpoint_dir, save_interval,
                                               accumulation_steps, num_stems, num_workers, cache_dir, loss_function_g, loss_function_d, optimizer_name_g, optimizer_name_d,
@@ -226,12 +259,14 @@ with gr.Blocks() as demo:
         num_stems = gr.Number(label="Number of Stems", value=7)
         cache_dir = gr.Textbox(label="Cache Directory", value="./cache")
         suppress_reading_messages = gr.Checkbox(label="Suppress Reading Messages", value=False)
+        reconstruction = gr.Dropdown(label="Reconstruction", choices=list(RECONSTRUCTION_MODES), value="griffinlim")
         perform_separation_button = gr.Button("Perform Separation")
         result = gr.Files(label="Separated Stems")
         perform_separation_button.click(
             perform_separation_wrapper,
-            inputs=[checkpoint_dir, file_path, n_mels, target_length, n_fft, num_stems, cache_dir, suppress_reading_messages],
-            outputs=result
+            inputs=[checkpoint_dir, file_path, n_mels, target_length, n_fft, num_stems, cache_dir, suppress_reading_messages, reconstruction],
+            outputs=result,
+            concurrency_limit=16
         )
 
     with gr.Tab("Evaluation"):
@@ -243,6 +278,7 @@ with gr.Blocks() as demo:
         eval_n_fft = gr.Number(label="Number of FFT", value=2048)
         eval_num_stems = gr.Number(label="Number of Stems", value=7)
         eval_cache_dir = gr.Textbox(label="Cache Directory", value="./cache")
+        eval_reference_files = gr.Textbox(label="Reference Stem Files (comma separated, in stem order; empty scores against the mixture)")
         suppress_reading_messages = gr.Checkbox(label="Suppress Reading Messages", value=False)
         eval_button = gr.Button("Evaluate")
         sdr_output = gr.Textbox(label="Signal-to-Distortion Ratio (SDR)")
@@ -250,7 +286,7 @@ with gr.Blocks() as demo:
         sar_output = gr.Textbox(label="Signal-to-Artifacts Ratio (SAR)")
         eval_button.click(
             evaluate_model,
-            inputs=[eval_file_path, eval_checkpoint_dir, eval_n_mels, eval_target_length, eval_n_fft, eval_num_stems, eval_cache_dir, suppress_reading_messages],
+            inputs=[eval_file_path, eval_checkpoint_dir, eval_n_mels, eval_target_length, eval_n_fft, eval_num_stems, eval_cache_dir, suppress_reading_messages, eval_reference_files],
             outputs=[sdr_output, sir_output, sar_output]
         )
 
@@ -281,4 +317,6 @@ with gr.Blocks() as demo:
         )
 
 if __name__ == "__main__":
+    # separation requests wait in the service's own bounded queue; the Gradio queue only bounds open connections
+    demo.queue(max_size=64)
     demo.launch(share=False)
@@ -1,5 +1,10 @@
+import os
+import logging
+import multiprocessing
 import optuna
-from training_loop import start_training
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from training_loop import train_single_stem, prepare_datasets
 import torch.nn as nn
 from loss_functions import wasserstein_loss
 from multiprocessing import Value
@@ -25,63 +30,169 @@ def calculate_accumulation_steps(effective_batch_size):
         accumulation_steps += 1
     return accumulation_steps
 
-def objective_optuna(trial, gradio_params):
+LOSS_FUNCTIONS = {
+    "MSELoss": nn.MSELoss,
+    "L1Loss": nn.L1Loss,
+    "SmoothL1Loss": nn.SmoothL1Loss,
+    "BCEWithLogitsLoss": nn.BCEWithLogitsLoss,
+}
+
+def _loss_function(name, default):
+    if name == "WassersteinLoss":
+        return wasserstein_loss
+    return LOSS_FUNCTIONS.get(name, default)()
+
+@lru_cache(maxsize=4)
+def _prepared_data(data_dir, val_dir, cache_dir, device_str, suppress_reading_messages, segments_per_track):
+    # detection and datasets are built once per worker process and shared by all of its trials
+    return prepare_datasets(data_dir, val_dir, cache_dir, torch.device(device_str), suppress_reading_messages, segments_per_track)
+
+def prepared_data(gradio_params, device_str):
+    """(sample_rate, n_mels, n_fft, target_length, train_dataset, val_dataset), built once per process and device."""
+    return _prepared_data(
+        gradio_params["data_dir"], gradio_params["val_dir"], gradio_params["cache_dir"], device_str,
+        gradio_params["suppress_reading_messages"], int(gradio_params.get("segments_per_track", 10))
+    )
+
+def base_trial_params(gradio_params, device_str, checkpoint_dir):
+    """training_params/model_params for train_single_stem from the Gradio settings; searches override the tuned keys."""
     # Respect the system call batch size
-    effective_batch_size = gradio_params["batch_size"]
-    accumulation_steps = calculate_accumulation_steps(effective_batch_size)
+    effective_batch_size = int(gradio_params["batch_size"])
+    training_params = {
+        'device_str': device_str,
+        'batch_size': effective_batch_size,
+        'num_epochs': int(gradio_params.get("optuna_epochs", 5)),
+        'initial_lr_g': gradio_params.get("learning_rate_g", 1e-3),
+        'initial_lr_d': gradio_params.get("learning_rate_d", 1e-4),
+        'checkpoint_dir': checkpoint_dir,
+        'save_interval': int(gradio_params["save_interval"]),
+        'accumulation_steps': calculate_accumulation_steps(effective_batch_size),
+        'num_workers': gradio_params["num_workers"],
+        'cache_dir': gradio_params["cache_dir"],
+        'scheduler_step_size': gradio_params["scheduler_step_size"],
+        'scheduler_gamma': gradio_params["scheduler_gamma"],
+        'tensorboard_flag': gradio_params["tensorboard_flag"],
+        'add_noise': gradio_params["add_noise"],
+        'noise_amount': gradio_params["noise_amount"],
+        'early_stopping_patience': int(gradio_params["early_stopping_patience"]),
+        'disable_early_stopping': gradio_params["disable_early_stopping"],
+        'weight_decay': gradio_params["weight_decay"],
+        'suppress_warnings': gradio_params["suppress_warnings"],
+        'suppress_reading_messages': gradio_params["suppress_reading_messages"],
+        'discriminator_update_interval': int(gradio_params["discriminator_update_interval"]),
+        'label_smoothing_real': gradio_params["label_smoothing_real"],
+        'label_smoothing_fake': gradio_params["label_smoothing_fake"],
+        'suppress_detailed_logs': gradio_params["suppress_detailed_logs"],
+        'use_cache': gradio_params["use_cache"],
+        'keep_last_checkpoints': 1,
+    }
+    model_params = {
+        'optimizer_name_g': "Adam",
+        'optimizer_name_d': "Adam",
+        'loss_function_g': _loss_function(gradio_params.get("loss_function_g"), nn.L1Loss),
+        'loss_function_d': _loss_function(gradio_params.get("loss_function_d", "WassersteinLoss"), nn.L1Loss),
+        'perceptual_loss_flag': gradio_params.get("perceptual_loss_flag", True),
+        'perceptual_loss_weight': gradio_params.get("perceptual_loss_weight", 0.1),
+        'clip_value': gradio_params.get("clip_value", 1.0),
+        'tensorboard_flag': gradio_params["tensorboard_flag"],
+        'channel_multiplier': gradio_params.get("channel_multiplier", 1.0),
+    }
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return training_params, model_params
+
+def objective_optuna(trial, gradio_params, device_str=None):
+    """
+    Train one stem with the trial's hyperparameters and return its best mean validation loss.
+
+    The validation loss of every epoch is reported to the trial, so the study's pruner can
+    stop unpromising trials after a few epochs.
+    """
+    device_str = device_str or ('cuda' if gradio_params["use_cuda"] and torch.cuda.is_available() else 'cpu')
 
     learning_rate_g = trial.suggest_float('learning_rate_g', 1e-5, 1e-1, log=True)
     learning_rate_d = trial.suggest_float('learning_rate_d', 1e-5, 1e-1, log=True)
     perceptual_loss_weight = trial.suggest_float('perceptual_loss_weight', 0.0, 1.0)
     clip_value = trial.suggest_float('clip_value', 0.5, 1.5)
 
-    stop_flag = Value('i', 0)  # Shared flag for stopping processes
-
-    start_training(
-        data_dir=gradio_params["data_dir"],
-        val_dir=gradio_params["val_dir"],
-        batch_size=effective_batch_size,  # Actual batch size from gradio_params
-        num_epochs=5,  # Test with only 5 epochs
-        initial_lr_g=learning_rate_g,
-        initial_lr_d=learning_rate_d,
-        use_cuda=gradio_params["use_cuda"],
-        checkpoint_dir=gradio_params["checkpoint_dir"],
-        save_interval=gradio_params["save_interval"],
-        accumulation_steps=accumulation_steps,
-        num_stems=gradio_params["num_stems"],
-        num_workers=gradio_params["num_workers"],
-        cache_dir=gradio_params["cache_dir"],
-        use_cache=gradio_params["use_cache"],  # Added use_cache parameter
-        loss_function_g=nn.L1Loss(),
-        loss_function_d=wasserstein_loss,
-        optimizer_name_g="Adam",
-        optimizer_name_d="Adam",
-        perceptual_loss_flag=True,
-        perceptual_loss_weight=perceptual_loss_weight,
-        clip_value=clip_value,
-        scheduler_step_size=gradio_params["scheduler_step_size"],
-        scheduler_gamma=gradio_params["scheduler_gamma"],
-        tensorboard_flag=gradio_params["tensorboard_flag"],
-        add_noise=gradio_params["add_noise"],
-        noise_amount=gradio_params["noise_amount"],
-        early_stopping_patience=gradio_params["early_stopping_patience"],
-        disable_early_stopping=gradio_params["disable_early_stopping"],
-        weight_decay=gradio_params["weight_decay"],
-        suppress_warnings=gradio_params["suppress_warnings"],
-        suppress_reading_messages=gradio_params["suppress_reading_messages"],
-        discriminator_update_interval=gradio_params["discriminator_update_interval"],
-        label_smoothing_real=gradio_params["label_smoothing_real"],
-        label_smoothing_fake=gradio_params["label_smoothing_fake"],
-        suppress_detailed_logs=gradio_params["suppress_detailed_logs"],
-        stop_flag=stop_flag
+    sample_rate, n_mels, n_fft, target_length, train_dataset, val_dataset = prepared_data(gradio_params, device_str)
+    training_params, model_params = base_trial_params(
+        gradio_params, device_str, os.path.join(gradio_params["checkpoint_dir"], 'optuna', f'trial_{trial.number}')
+    )
+    training_params.update(initial_lr_g=learning_rate_g, initial_lr_d=learning_rate_d)
+    model_params.update(perceptual_loss_weight=perceptual_loss_weight, clip_value=clip_value)
+
+    pruned = []
+
+    def report(epoch, val_loss):
+        trial.report(val_loss, epoch)
+        if trial.should_prune():
+            pruned.append(epoch)
+            return True
+        return False
+
+    best_val_loss = train_single_stem(
+        gradio_params.get("optuna_stem", "vocals"), train_dataset, val_dataset, training_params, model_params,
+        sample_rate, n_mels, n_fft, target_length, Value('i', 0),
+        suppress_reading_messages=gradio_params["suppress_reading_messages"], epoch_callback=report
     )
+    if pruned:
+        raise optuna.TrialPruned(f"Pruned after epoch {pruned[0] + 1}")
+    if best_val_loss is None:
+        raise optuna.TrialPruned("Training stopped")
+    return best_val_loss
+
+def _make_pruner():
+    return optuna.pruners.MedianPruner(n_startup_trials=2, n_warmup_steps=1)
+
+def _optimize_worker(study_name, storage, n_trials, gradio_params, device_str):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    study = optuna.load_study(study_name=study_name, storage=storage, pruner=_make_pruner())
+    study.optimize(lambda trial: objective_optuna(trial, gradio_params, device_str), n_trials=n_trials)
+    return n_trials
+
+def _worker_devices(n_jobs, use_cuda):
+    # one device per worker, round-robin over the visible GPUs
+    if use_cuda and torch.cuda.is_available():
+        return [f'cuda:{i % torch.cuda.device_count()}' for i in range(n_jobs)]
+    return ['cpu'] * n_jobs
 
-    return 0.0
+def start_optuna_optimization(n_trials, gradio_params, n_jobs=None, storage=None, study_name="kan_stem_optuna"):
+    """
+    Run n_trials across n_jobs worker processes sharing one SQLite-backed study.
+
+    n_jobs defaults to the number of visible GPUs (1 without CUDA). The feature cache is
+    built once up front, so workers only open it. Because the study lives in the storage,
+    rerunning with the same study_name continues it.
+    """
+    n_trials = int(n_trials)
+    use_cuda = gradio_params["use_cuda"] and torch.cuda.is_available()
+    n_jobs = int(n_jobs or (torch.cuda.device_count() if use_cuda else 1))
+    os.makedirs(gradio_params["checkpoint_dir"], exist_ok=True)
+    storage = storage or f"sqlite:///{os.path.abspath(os.path.join(gradio_params['checkpoint_dir'], 'optuna.db'))}"
+
+    # build the shared feature cache before any worker touches it
+    prepare_datasets(gradio_params["data_dir"], gradio_params["val_dir"], gradio_params["cache_dir"], torch.device('cpu'),
+                     gradio_params["suppress_reading_messages"], int(gradio_params.get("segments_per_track", 10)))
+
+    study = optuna.create_study(direction='minimize', study_name=study_name, storage=storage, load_if_exists=True, pruner=_make_pruner())
+    devices = _worker_devices(n_jobs, use_cuda)
+    if n_jobs <= 1:
+        study.optimize(lambda trial: objective_optuna(trial, gradio_params, devices[0]), n_trials=n_trials)
+    else:
+        shares = [n_trials // n_jobs + (1 if i < n_trials % n_jobs else 0) for i in range(n_jobs)]
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(_optimize_worker, study_name, storage, share, gradio_params, device)
+                       for share, device in zip(shares, devices) if share > 0]
+            for future in futures:
+                future.result()
 
-def start_optuna_optimization(n_trials, gradio_params):
-    study = optuna.create_study(direction='minimize')
-    study.optimize(lambda trial: objective_optuna(trial, gradio_params), n_trials=n_trials)
-    return "Optuna optimization completed"
+    study = optuna.load_study(study_name=study_name, storage=storage)
+    completed = [t for t in study.trials if t.state == optuna.trial.TrialState.COMPLETE]
+    pruned = [t for t in study.trials if t.state == optuna.trial.TrialState.PRUNED]
+    if not completed:
+        return f"Optuna optimization finished without a completed trial ({len(pruned)} pruned)"
+    return (f"Optuna optimization completed: {len(completed)} completed, {len(pruned)} pruned. "
+            f"Best validation loss {study.best_value:.4f} with {study.best_params}")
 
 def trial_dirname_creator(trial):
     """Creates a short and unique directory name for each trial."""
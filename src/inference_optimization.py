@@ -0,0 +1,157 @@
+import copy
+import logging
+from typing import Dict, Optional
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+_FOLDABLE_NORMS = (nn.BatchNorm1d, nn.BatchNorm2d, nn.InstanceNorm1d, nn.InstanceNorm2d)
+
+
+def _can_fold(norm: nn.Module) -> bool:
+    # only norms that use fixed running statistics at inference are affine maps
+    return isinstance(norm, _FOLDABLE_NORMS) and norm.track_running_stats and norm.running_mean is not None
+
+
+def fold_norm_into_conv(conv: nn.Module, norm: nn.Module) -> nn.Module:
+    """Return a copy of conv whose weight and bias absorb the (eval-mode) normalization that follows it."""
+    fused = copy.deepcopy(conv)
+    scale = norm.weight.detach() if norm.affine else torch.ones_like(norm.running_var)
+    shift = norm.bias.detach() if norm.affine else torch.zeros_like(norm.running_mean)
+    factor = scale / torch.sqrt(norm.running_var + norm.eps)
+
+    weight = conv.weight.detach()
+    # ConvTranspose keeps output channels on dim 1, Conv/Linear on dim 0
+    out_dim = 1 if isinstance(conv, (nn.ConvTranspose1d, nn.ConvTranspose2d)) else 0
+    view = [1] * weight.dim()
+    view[out_dim] = -1
+    bias = conv.bias.detach() if conv.bias is not None else torch.zeros_like(norm.running_mean)
+
+    fused.weight = nn.Parameter(weight * factor.view(view).to(weight.dtype), requires_grad=False)
+    fused.bias = nn.Parameter(((bias - norm.running_mean) * factor + shift).to(weight.dtype), requires_grad=False)
+    return fused
+
+
+def fold_norms(module: nn.Module) -> int:
+    """Fold every Conv -> BatchNorm (or running-stats InstanceNorm) pair inside nn.Sequential containers, in place."""
+    folded = 0
+    for child in module.children():
+        folded += fold_norms(child)
+    if isinstance(module, nn.Sequential):
+        names = list(module._modules)
+        for first, second in zip(names, names[1:]):
+            conv, norm = module._modules[first], module._modules[second]
+            if isinstance(conv, (nn.Conv1d, nn.Conv2d, nn.ConvTranspose1d, nn.ConvTranspose2d)) and _can_fold(norm):
+                module._modules[first] = fold_norm_into_conv(conv, norm)
+                module._modules[second] = nn.Identity()
+                folded += 1
+    return folded
+
+
+def strip_identities(module: nn.Module):
+    """Drop the nn.Identity placeholders left in nn.Sequential containers by folding."""
+    for child in module.children():
+        strip_identities(child)
+    if isinstance(module, nn.Sequential):
+        kept = [(name, child) for name, child in module._modules.items() if not isinstance(child, nn.Identity)]
+        if kept and len(kept) != len(module._modules):
+            module._modules.clear()
+            module._modules.update(kept)
+
+
+def disable_checkpointing(module: nn.Module) -> int:
+    disabled = 0
+    for child in module.modules():
+        if getattr(child, 'use_checkpointing', False):
+            child.use_checkpointing = False
+            disabled += 1
+    return disabled
+
+
+def fuse_activations(module: nn.Module) -> int:
+    """Run element-wise activations in place so they reuse the preceding layer's output buffer."""
+    fused = 0
+    for child in module.modules():
+        if isinstance(child, (nn.ReLU, nn.LeakyReLU, nn.ReLU6, nn.SiLU, nn.Hardswish)) and not child.inplace:
+            child.inplace = True
+            fused += 1
+    return fused
+
+
+class InferenceModel(nn.Module):
+    """Runs an optimized model in its own dtype/memory format and returns float32 outputs in the standard layout."""
+    def __init__(self, model: nn.Module, dtype: torch.dtype = torch.float32, channels_last: bool = False):
+        super().__init__()
+        self.model = model
+        self.dtype = dtype
+        self.channels_last = channels_last
+        self.optimization_report: Dict[str, object] = {}
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.to(self.dtype)
+        if self.channels_last and x.dim() == 4:
+            x = x.contiguous(memory_format=torch.channels_last)
+        y = self.model(x)
+        return y.float().contiguous()
+
+
+def compare_outputs(reference: nn.Module, candidate: nn.Module, example_input: torch.Tensor, rtol: float, atol: float) -> Dict[str, object]:
+    with torch.no_grad():
+        expected = reference(example_input).float()
+        actual = candidate(example_input).float()
+    max_abs = (expected - actual).abs().max().item()
+    scale = expected.abs().max().item()
+    max_rel = max_abs / max(scale, 1e-12)
+    return {'max_abs_error': max_abs, 'max_rel_error': max_rel, 'passed': max_abs <= atol + rtol * scale}
+
+
+def optimize_for_inference(model: nn.Module, example_input: Optional[torch.Tensor] = None, dtype: Optional[torch.dtype] = None,
+                           channels_last: bool = False, rtol: float = None, atol: float = 1e-3) -> InferenceModel:
+    """
+    Return an inference-only copy of model.
+
+    Conv -> BatchNorm pairs are folded into the convolution, activation checkpointing is
+    switched off, activations run in place and the copy is optionally cast to dtype
+    (torch.float16 / torch.bfloat16) and channels-last. When example_input is given, the
+    optimized copy is checked against the original (tolerance atol + rtol * max|output|;
+    rtol defaults to 1e-4 in float32 and 1e-2 in reduced precision) and the errors are
+    logged and stored in .optimization_report. The original model's weights are left untouched.
+    """
+    reference = model.eval()
+    device = next(model.parameters()).device
+    optimized = copy.deepcopy(model).eval()
+    for param in optimized.parameters():
+        param.requires_grad_(False)
+
+    report = {
+        'folded_norms': fold_norms(optimized),
+        'checkpointing_disabled': disable_checkpointing(optimized),
+        'inplace_activations': fuse_activations(optimized),
+    }
+    strip_identities(optimized)
+
+    dtype = dtype or torch.float32
+    if device.type == 'cpu' and dtype == torch.float16:
+        logger.warning("float16 convolutions are slow or unsupported on CPU; keeping float32.")
+        dtype = torch.float32
+    optimized = optimized.to(dtype)
+    if channels_last:
+        optimized = optimized.to(memory_format=torch.channels_last)
+
+    wrapped = InferenceModel(optimized, dtype=dtype, channels_last=channels_last).eval()
+    report.update({'dtype': str(dtype), 'channels_last': channels_last})
+
+    if example_input is not None:
+        if rtol is None:
+            rtol = 1e-4 if dtype == torch.float32 else 1e-2
+        report.update(compare_outputs(reference, wrapped, example_input.to(device), rtol=rtol, atol=atol))
+        message = f"optimize_for_inference: max abs error {report['max_abs_error']:.3e}, max rel error {report['max_rel_error']:.3e} ({report})"
+        if report['passed']:
+            logger.info(message)
+        else:
+            logger.warning(message + " exceeds tolerance")
+
+    wrapped.optimization_report = report
+    return wrapped
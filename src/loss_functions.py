@@ -1,4 +1,5 @@
 import torch
+import torchaudio.functional as AF
 import warnings
 
 warnings.filterwarnings("ignore", message="Lazy modules are a new feature under heavy development")
@@ -20,3 +21,95 @@ def smooth_l1_loss(y_pred, y_true):
 
 def bce_with_logits_loss(y_pred, y_true):
     return torch.nn.functional.binary_cross_entropy_with_logits(y_pred, y_true)
+
+PERCEPTUAL_LOSS_BACKENDS = ('multires', 'vgg16')
+
+def resolve_perceptual_backend(perceptual_loss_flag):
+    """Map perceptual_loss_flag (bool or backend name) to a backend name, or None when disabled."""
+    if perceptual_loss_flag is None or perceptual_loss_flag is False:
+        return None
+    if perceptual_loss_flag is True:
+        return 'multires'
+    backend = str(perceptual_loss_flag).lower()
+    if backend in ('', 'off', 'none', 'false'):
+        return None
+    if backend not in PERCEPTUAL_LOSS_BACKENDS:
+        raise ValueError(f"Unknown perceptual loss backend: {perceptual_loss_flag}. Expected one of {PERCEPTUAL_LOSS_BACKENDS}")
+    return backend
+
+class MultiResolutionSpectralLoss(torch.nn.Module):
+    """
+    Weight-free perceptual loss on spectrogram-shaped tensors.
+
+    Compares magnitudes at several time-frequency resolutions (average pooling by
+    each scale) with spectral convergence, log-magnitude L1 and a spectral-flux
+    term that emphasises onsets. Coarse scales capture envelope and timbre, fine
+    scales capture detail.
+
+    The model's features are power spectrograms in dB (T.AmplitudeToDB), so with
+    db_input=True (the default) both tensors are converted back to magnitudes
+    before comparison; max_db bounds the conversion for untrained outputs.
+    """
+    def __init__(self, scales=(1, 2, 4, 8), convergence_weight=1.0, log_weight=1.0, flux_weight=0.5, eps=1e-5,
+                 db_input=True, max_db=120.0):
+        super().__init__()
+        self.scales = scales
+        self.convergence_weight = convergence_weight
+        self.log_weight = log_weight
+        self.flux_weight = flux_weight
+        self.eps = eps
+        self.db_input = db_input
+        self.max_db = max_db
+
+    def _magnitude(self, x):
+        x = self._as_4d(x).float()
+        if self.db_input:
+            return AF.DB_to_amplitude(x.clamp(max=self.max_db), ref=1.0, power=0.5)
+        return x.abs()
+
+    @staticmethod
+    def _as_4d(x):
+        if x.dim() == 2:
+            return x[None, None]
+        if x.dim() == 3:
+            return x.unsqueeze(1)
+        return x
+
+    def forward(self, y_true, y_pred, key=None):
+        # key is accepted for interface parity with the cached feature backends
+        y_true = self._magnitude(y_true)
+        y_pred = self._magnitude(y_pred)
+        loss = 0.0
+        for scale in self.scales:
+            if scale > 1:
+                kernel = (min(scale, y_true.size(-2)), min(scale, y_true.size(-1)))
+                true_s = torch.nn.functional.avg_pool2d(y_true, kernel, ceil_mode=True)
+                pred_s = torch.nn.functional.avg_pool2d(y_pred, kernel, ceil_mode=True)
+            else:
+                true_s, pred_s = y_true, y_pred
+            convergence = torch.linalg.vector_norm(true_s - pred_s) / torch.linalg.vector_norm(true_s).clamp_min(self.eps)
+            log_magnitude = torch.nn.functional.l1_loss(torch.log(pred_s + self.eps), torch.log(true_s + self.eps))
+            flux = torch.nn.functional.l1_loss(pred_s.diff(dim=-1), true_s.diff(dim=-1)) if true_s.size(-1) > 1 else 0.0
+            loss += self.convergence_weight * convergence + self.log_weight * log_magnitude + self.flux_weight * flux
+        return loss / len(self.scales)
+
+def build_perceptual_loss(perceptual_loss_flag, device, cache_dir=None):
+    """
+    Create the perceptual loss selected by perceptual_loss_flag, or None when disabled.
+
+    True selects the lightweight 'multires' backend; 'vgg16' keeps the ImageNet VGG16
+    feature loss (torchvision, downloads weights on first use) with target features
+    cached under cache_dir.
+    """
+    backend = resolve_perceptual_backend(perceptual_loss_flag)
+    if backend is None:
+        return None
+    if backend == 'multires':
+        return MultiResolutionSpectralLoss().to(device)
+
+    from torchvision.models import vgg16, VGG16_Weights
+    from utils import PerceptualLoss, PerceptualFeatureCache
+    feature_extractor = vgg16(weights=VGG16_Weights.IMAGENET1K_V1).features.to(device).eval()
+    for param in feature_extractor.parameters():
+        param.requires_grad = False
+    return PerceptualLoss(feature_extractor, feature_cache=PerceptualFeatureCache(cache_dir))
@@ -6,11 +6,17 @@ from torch.utils.checkpoint import checkpoint
 import logging
 import h5py
 import math
+import pickle
 import gc
 from typing import Dict
+from flat_checkpoint import FLAT_CHECKPOINT_SUFFIX, open_flat_checkpoint, materialize
+from quantization import QUANTIZED_FORMAT, load_quantized_model
 
 logger = logging.getLogger(__name__)
 
+# log-mel spectrograms of the mix and of its harmonic and percussive parts, as built by utils.StemSeparationDataset
+FEATURE_CHANNELS = 3
+
 def purge_vram():
     torch.cuda.empty_cache()
     gc.collect()
@@ -139,6 +145,8 @@ class MemoryEfficientStemSeparationModel(nn.Module):
             self.conv_block(64, 32, kernel_size=3, stride=1, padding=1)
         ])
         self.final_conv = nn.Conv2d(32, out_channels, kernel_size=1)
+        # activation checkpointing only pays off when gradients are computed (see inference_optimization)
+        self.use_checkpointing = True
 
     @staticmethod
     def conv_block(in_channels, out_channels, kernel_size, stride, padding):
@@ -150,19 +158,25 @@ class MemoryEfficientStemSeparationModel(nn.Module):
 
     def _forward_encoder(self, x: torch.Tensor) -> torch.Tensor:
         for encoder_layer in self.encoder:
-            x = checkpoint(encoder_layer, x, use_reentrant=False)
+            if self.use_checkpointing and torch.is_grad_enabled():
+                x = checkpoint(encoder_layer, x, use_reentrant=False)
+            else:
+                x = encoder_layer(x)
         return x
 
     def _forward_decoder(self, x: torch.Tensor) -> torch.Tensor:
         for decoder_layer in self.decoder:
-            x = checkpoint(decoder_layer, x, use_reentrant=False)
+            if self.use_checkpointing and torch.is_grad_enabled():
+                x = checkpoint(decoder_layer, x, use_reentrant=False)
+            else:
+                x = decoder_layer(x)
         return x
 
     def forward(self, x):
         if x.dim() == 3:
             x = x.unsqueeze(1)
-        elif x.dim() == 4 and x.size(1) != 3:
-            raise ValueError(f"Expected input with 3 channels but got {x.size(1)} channels")
+        elif x.dim() == 4 and x.size(1) != FEATURE_CHANNELS:
+            raise ValueError(f"Expected input with {FEATURE_CHANNELS} channels but got {x.size(1)} channels")
 
         x = self._forward_encoder(x)
         x = F.interpolate(x, size=(self.n_mels, self.target_length), mode='bilinear', align_corners=False)
@@ -209,6 +223,42 @@ class KANDiscriminator(nn.Module):
         x = torch.sigmoid(self.fc1(x))
         return x
 
+class PatchKANDiscriminator(nn.Module):
+    """
+    PatchGAN-style discriminator with a parameter count fixed at construction.
+
+    Strided 4x4 convolutions downsample the spectrogram, a 1x1 convolution scores every
+    receptive-field patch and the patch logits are averaged, so the output shape (batch, 1)
+    and the parameters do not depend on n_mels or target_length. Takes the same arguments
+    as KANDiscriminator; n_mels and target_length are accepted for compatibility only.
+    """
+    def __init__(self, in_channels=3, out_channels=64, n_mels=127, target_length=44036, device="cuda", channel_multiplier=1.0, num_downsamples=3):
+        super(PatchKANDiscriminator, self).__init__()
+        self.device = device
+
+        layers = []
+        channels = in_channels
+        for i in range(num_downsamples):
+            next_channels = int(out_channels * (2 ** i) * channel_multiplier)
+            layers += [
+                nn.Conv2d(channels, next_channels, kernel_size=4, stride=2, padding=1, bias=i == 0),
+                nn.Identity() if i == 0 else nn.InstanceNorm2d(next_channels, affine=True),
+                nn.LeakyReLU(0.2, inplace=True),
+            ]
+            channels = next_channels
+        self.features = nn.Sequential(*layers)
+        self.patch_head = nn.Conv2d(channels, 1, kernel_size=1)
+
+    def patch_logits(self, x: torch.Tensor) -> torch.Tensor:
+        if x.dim() == 3:
+            x = x.unsqueeze(1)  # Add channel dimension if needed
+        if x.dim() != 4:
+            raise ValueError(f"Invalid input shape. Expected 3 or 4 dimensions but got {x.dim()}")
+        return self.patch_head(self.features(x))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.sigmoid(self.patch_logits(x).mean(dim=(2, 3)))
+
 def load_from_cache(cache_file_path: str, device: torch.device) -> Dict[str, torch.Tensor]:
     try:
         with h5py.File(cache_file_path, 'r') as f:
@@ -236,9 +286,29 @@ def reassemble_with_zero_gaps(data: torch.Tensor, zero_durations: torch.Tensor,
         current_index += segment_length
     return torch.cat(reassembled, dim=-1)
 
-def load_model(checkpoint_path: str, in_channels: int, out_channels: int, n_mels: int, target_length: int, device: str = "cuda") -> nn.Module:
+def load_model(checkpoint_path: str, in_channels: int, out_channels: int, n_mels: int, target_length: int, device: str = "cuda", stem: str = None) -> nn.Module:
+    if checkpoint_path.endswith(FLAT_CHECKPOINT_SUFFIX):
+        # memory-mapped weights assigned into a model built on the meta device (no pickle, no init)
+        state_dict = open_flat_checkpoint(checkpoint_path).state_dict(stem)
+        model = materialize(lambda: MemoryEfficientStemSeparationModel(in_channels, out_channels, n_mels, target_length), state_dict, device)
+        model.eval()
+        return model
+
+    try:
+        # tensors and plain containers only: unpickling arbitrary objects could run code from the file
+        state_dict = torch.load(checkpoint_path, map_location='cpu', weights_only=True)
+    except pickle.UnpicklingError as e:
+        raise ValueError(f"{checkpoint_path} holds more than model weights (e.g. a full training-state checkpoint with RNG "
+                         f"and optimizer state); export its weights with flat_checkpoint.py and load that instead") from e
+    if state_dict.get('quantization') == QUANTIZED_FORMAT:
+        # int8 artifact from quantization.py; quantized kernels run on the CPU only
+        if str(device) != 'cpu':
+            logger.warning(f"Quantized model {checkpoint_path} runs on the CPU, ignoring device {device}")
+        return load_quantized_model(state_dict, lambda: MemoryEfficientStemSeparationModel(in_channels, out_channels, n_mels, target_length))
+    if 'model_state_dict' in state_dict:  # full training-state checkpoint (checkpointing.CheckpointManager)
+        state_dict = state_dict['model_state_dict']
     model = MemoryEfficientStemSeparationModel(in_channels, out_channels, n_mels, target_length).to(device)
-    model.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    model.load_state_dict(state_dict)
     model.eval()
     return model
 
@@ -1,6 +1,6 @@
 import torch
 import torch.optim as optim
-from model import MemoryEfficientStemSeparationModel, KANDiscriminator
+from model import FEATURE_CHANNELS, MemoryEfficientStemSeparationModel, KANDiscriminator, PatchKANDiscriminator
 from utils import get_optimizer
 from torch.cuda.amp import GradScaler
 import warnings
@@ -9,14 +9,20 @@ warnings.filterwarnings("ignore", message="Lazy modules are a new feature under
 warnings.filterwarnings("ignore", message="oneDNN custom operations are on. You may see slightly different numerical results due to floating-point round-off errors from different computation orders.")
 
 def create_model_and_optimizer(device, n_mels, target_length, initial_lr_g, initial_lr_d, 
-                               optimizer_name_g, optimizer_name_d, weight_decay):
+                               optimizer_name_g, optimizer_name_d, weight_decay, discriminator_type='patch'):
     # Create the generator model
-    model = MemoryEfficientStemSeparationModel(in_channels=1, out_channels=1, n_mels=n_mels, 
+    model = MemoryEfficientStemSeparationModel(in_channels=FEATURE_CHANNELS, out_channels=FEATURE_CHANNELS, n_mels=n_mels, 
                          target_length=target_length).to(device)
 
-    # Create the discriminator model
-    discriminator = KANDiscriminator(in_channels=1, out_channels=32, n_mels=n_mels, 
-                                     target_length=target_length, device=device).to(device)
+    # Create the discriminator model ('patch' has a fixed parameter count; 'dense' sizes its Linear head on first use)
+    if discriminator_type == 'patch':
+        discriminator_cls = PatchKANDiscriminator
+    elif discriminator_type == 'dense':
+        discriminator_cls = KANDiscriminator
+    else:
+        raise ValueError(f"Unknown discriminator type: {discriminator_type}")
+    discriminator = discriminator_cls(in_channels=FEATURE_CHANNELS, out_channels=32, n_mels=n_mels, 
+                                      target_length=target_length, device=device).to(device)
 
     # Create the optimizers
     optimizer_g = get_optimizer(optimizer_name_g, model.parameters(), initial_lr_g, weight_decay)
@@ -30,7 +36,7 @@ def create_model_and_optimizer(device, n_mels, target_length, initial_lr_g, init
 
 def initialize_model(device, n_mels, target_length):
     """Initializes the generator model only (no discriminator)."""
-    model = MemoryEfficientStemSeparationModel(in_channels=1, out_channels=1, n_mels=n_mels, 
+    model = MemoryEfficientStemSeparationModel(in_channels=FEATURE_CHANNELS, out_channels=FEATURE_CHANNELS, n_mels=n_mels, 
                          target_length=target_length).to(device)
     return model
 
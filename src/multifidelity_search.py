@@ -0,0 +1,240 @@
+import os
+import json
+import math
+import shutil
+import logging
+from multiprocessing import Value
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import torch
+
+from training_loop import train_single_stem
+from checkpointing import list_full_checkpoints, load_checkpoint
+from hyperparameter_optimization import base_trial_params, prepared_data
+
+logger = logging.getLogger(__name__)
+
+# name -> (kind, low, high); kind is 'log', 'float' or 'int'
+SEARCH_SPACE = {
+    'initial_lr_g': ('log', 1e-5, 1e-1),
+    'initial_lr_d': ('log', 1e-5, 1e-1),
+    'discriminator_update_interval': ('int', 1, 10),
+    'label_smoothing_real': ('float', 0.7, 1.0),
+    'label_smoothing_fake': ('float', 0.0, 0.3),
+    'perceptual_loss_weight': ('float', 0.0, 1.0),
+}
+# keys that live in model_params rather than training_params
+_MODEL_PARAM_KEYS = {'perceptual_loss_weight', 'clip_value'}
+
+
+def sample_config(space: Dict[str, Tuple[str, float, float]], rng: np.random.Generator) -> Dict[str, Any]:
+    config = {}
+    for name, (kind, low, high) in space.items():
+        if kind == 'log':
+            config[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+        elif kind == 'int':
+            config[name] = int(rng.integers(low, high + 1))
+        else:
+            config[name] = float(rng.uniform(low, high))
+    return config
+
+
+def perturb_config(config: Dict[str, Any], space: Dict[str, Tuple[str, float, float]], rng: np.random.Generator,
+                   factors: Tuple[float, float] = (0.8, 1.25)) -> Dict[str, Any]:
+    """PBT explore step: scale every value by a randomly chosen factor and clip it back into the space."""
+    perturbed = dict(config)
+    for name, (kind, low, high) in space.items():
+        value = config[name] * factors[rng.integers(len(factors))]
+        if kind == 'int':
+            value = int(round(value))
+            if value == config[name]:
+                # small integers would never move under multiplicative perturbation
+                value += int(rng.choice([-1, 1]))
+        perturbed[name] = type(config[name])(min(max(value, low), high))
+    return perturbed
+
+
+class TrialRunner:
+    """
+    Trains configurations of one stem with train_single_stem, warm-starting from checkpoints.
+
+    Every trial gets its own directory and writes a full-state checkpoint after each epoch
+    (keeping only the latest). run() continues a trial from its latest checkpoint, or from an
+    explicit warm_start checkpoint (PBT exploit), up to a total epoch budget, so promoting a
+    trial to a larger budget only trains the additional epochs. Learning rates from the
+    config are written into the restored optimizer state, so perturbed rates take effect.
+    The last validation loss of each trial is kept in its directory next to the checkpoint,
+    so a restarted search still knows the result of trials it does not need to train again.
+    """
+    def __init__(self, gradio_params: Dict[str, Any], work_dir: str, stem_name: str = 'vocals', device_str: str = None):
+        self.gradio_params = gradio_params
+        self.work_dir = work_dir
+        self.stem_name = stem_name
+        self.device_str = device_str or ('cuda' if gradio_params["use_cuda"] and torch.cuda.is_available() else 'cpu')
+        self.data = prepared_data(gradio_params, self.device_str)
+        self.epochs_trained = 0
+        os.makedirs(work_dir, exist_ok=True)
+
+    def trial_dir(self, trial_id: str) -> str:
+        return os.path.join(self.work_dir, trial_id)
+
+    def _loss_path(self, trial_id: str) -> str:
+        return os.path.join(self.trial_dir(trial_id), 'last_loss.json')
+
+    def save_last_loss(self, trial_id: str, epoch: int, loss: float):
+        os.makedirs(self.trial_dir(trial_id), exist_ok=True)
+        tmp_path = f"{self._loss_path(trial_id)}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'epoch': epoch, 'loss': loss}, f)
+        os.replace(tmp_path, self._loss_path(trial_id))
+
+    def last_loss(self, trial_id: str, epoch: int) -> float:
+        """Validation loss recorded for trial_id after epoch, or inf if there is none."""
+        try:
+            with open(self._loss_path(trial_id)) as f:
+                recorded = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return float('inf')
+        return recorded['loss'] if recorded.get('epoch') == epoch else float('inf')
+
+    def latest_checkpoint(self, trial_id: str) -> Optional[str]:
+        checkpoints = list_full_checkpoints(self.trial_dir(trial_id), prefix=f'state_stem_{self.stem_name}')
+        return checkpoints[-1] if checkpoints else None
+
+    def run(self, trial_id: str, config: Dict[str, Any], total_epochs: int, warm_start: str = None) -> float:
+        """Train trial_id up to total_epochs and return its validation loss after the last epoch."""
+        sample_rate, n_mels, n_fft, target_length, train_dataset, val_dataset = self.data
+        training_params, model_params = base_trial_params(self.gradio_params, self.device_str, self.trial_dir(trial_id))
+        for name, value in config.items():
+            (model_params if name in _MODEL_PARAM_KEYS else training_params)[name] = value
+        training_params.update(num_epochs=total_epochs, save_interval=1, keep_last_checkpoints=1, disable_early_stopping=True,
+                               early_stopping_patience=total_epochs + 1)
+
+        resume_state = None
+        checkpoint_path = warm_start or self.latest_checkpoint(trial_id)
+        if checkpoint_path is not None:
+            resume_state = load_checkpoint(checkpoint_path, map_location=self.device_str)
+            for key, lr in (('optimizer_g_state_dict', training_params['initial_lr_g']), ('optimizer_d_state_dict', training_params['initial_lr_d'])):
+                for group in resume_state[key]['param_groups']:
+                    group['lr'] = lr
+            if resume_state['epoch'] >= total_epochs:
+                logger.info(f"Trial {trial_id} already trained for {resume_state['epoch']} epochs")
+                return self.last_loss(trial_id, resume_state['epoch'])
+        start_epoch = resume_state['epoch'] if resume_state else 0
+
+        losses = []
+
+        def record(epoch, val_loss):
+            losses.append(val_loss)
+            return False
+
+        train_single_stem(
+            self.stem_name, train_dataset, val_dataset, training_params, model_params,
+            sample_rate, n_mels, n_fft, target_length, Value('i', 0),
+            suppress_reading_messages=self.gradio_params["suppress_reading_messages"], resume_state=resume_state,
+            epoch_callback=record
+        )
+        self.epochs_trained += len(losses)
+        loss = losses[-1] if losses else float('inf')
+        if losses:
+            self.save_last_loss(trial_id, start_epoch + len(losses), loss)
+        logger.info(f"Trial {trial_id}: epochs {start_epoch}->{total_epochs}, validation loss {loss:.4f}")
+        return loss
+
+
+def successive_halving(runner: TrialRunner, configs: Dict[str, Dict[str, Any]], min_epochs: int, max_epochs: int, eta: int = 3) -> Dict[str, Dict[str, Any]]:
+    """
+    Train every config for min_epochs, keep the best 1/eta, multiply the budget by eta and repeat.
+
+    Survivors continue from their own checkpoints. Returns {trial_id: {'config', 'loss', 'epochs'}}
+    with each trial's last result.
+    """
+    results = {}
+    alive = list(configs)
+    budget = min_epochs
+    while alive:
+        for trial_id in alive:
+            loss = runner.run(trial_id, configs[trial_id], budget)
+            results[trial_id] = {'config': configs[trial_id], 'loss': loss, 'epochs': budget}
+        if budget >= max_epochs or len(alive) == 1:
+            break
+        alive = sorted(alive, key=lambda t: results[t]['loss'])[:max(1, len(alive) // eta)]
+        budget = min(budget * eta, max_epochs)
+        logger.info(f"Promoting {alive} to {budget} epochs")
+    return results
+
+
+def hyperband(runner: TrialRunner, space: Dict[str, Tuple[str, float, float]], max_epochs: int, eta: int = 3,
+              min_epochs: int = 1, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """Hyperband: successive-halving brackets from many cheap trials to a few full-budget ones."""
+    rng = np.random.default_rng(seed)
+    s_max = int(math.log(max_epochs / min_epochs, eta) + 1e-9)
+    results = {}
+    for s in range(s_max, -1, -1):
+        num_configs = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        bracket_min_epochs = max(min_epochs, int(round(max_epochs / eta ** s)))
+        configs = {f"hb{s}_{i}": sample_config(space, rng) for i in range(num_configs)}
+        logger.info(f"Hyperband bracket {s}: {num_configs} configs from {bracket_min_epochs} epochs")
+        results.update(successive_halving(runner, configs, bracket_min_epochs, max_epochs, eta))
+    return results
+
+
+def population_based_training(runner: TrialRunner, space: Dict[str, Tuple[str, float, float]], population_size: int = 8,
+                              epochs_per_round: int = 2, rounds: int = 5, exploit_fraction: float = 0.25,
+                              seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    PBT: train a population in rounds; after each round the worst exploit_fraction copy the
+    checkpoint of a random member of the best exploit_fraction and perturb its config. Winners
+    never include a loser of the same round, and their configs are taken as they were before
+    any loser was updated.
+    """
+    rng = np.random.default_rng(seed)
+    population = {f"pbt_{i}": sample_config(space, rng) for i in range(population_size)}
+    warm_starts = {}
+    results = {}
+    for round_index in range(rounds):
+        budget = (round_index + 1) * epochs_per_round
+        for trial_id, config in population.items():
+            warm_start = warm_starts.pop(trial_id, None)
+            loss = runner.run(trial_id, config, budget, warm_start=warm_start)
+            if warm_start is not None:
+                os.remove(warm_start)
+            results[trial_id] = {'config': dict(config), 'loss': loss, 'epochs': budget}
+
+        ranked = sorted(population, key=lambda t: results[t]['loss'])
+        cutoff = max(1, int(len(ranked) * exploit_fraction))
+        losers = ranked[-cutoff:]
+        winners = [trial_id for trial_id in ranked[:cutoff] if trial_id not in losers]
+        configs = {trial_id: dict(config) for trial_id, config in population.items()}
+        for loser in losers if winners else []:
+            winner = winners[rng.integers(len(winners))]
+            source = runner.latest_checkpoint(winner)
+            if source is None:
+                continue
+            # copy: the winner's own retention would delete the file once it trains on
+            target = os.path.join(runner.trial_dir(loser), f"exploit_from_{winner}.pt")
+            shutil.copyfile(source, target)
+            warm_starts[loser] = target
+            population[loser] = perturb_config(configs[winner], space, rng)
+            logger.info(f"PBT round {round_index + 1}: {loser} <- {winner} with {population[loser]}")
+    return results
+
+
+def run_search(method: str, gradio_params: Dict[str, Any], max_epochs: int = 27, eta: int = 3, population_size: int = 8,
+               epochs_per_round: int = 2, rounds: int = 5, seed: int = 0) -> str:
+    """Run 'hyperband' or 'pbt' for gradio_params['optuna_stem'] and write search_results.json in the work directory."""
+    work_dir = os.path.join(gradio_params["checkpoint_dir"], f"{method}_search")
+    runner = TrialRunner(gradio_params, work_dir, stem_name=gradio_params.get("optuna_stem", "vocals"))
+    if method == 'hyperband':
+        results = hyperband(runner, SEARCH_SPACE, max_epochs, eta, seed=seed)
+    elif method == 'pbt':
+        results = population_based_training(runner, SEARCH_SPACE, population_size, epochs_per_round, rounds, seed=seed)
+    else:
+        raise ValueError(f"Unknown search method: {method}")
+
+    best_id = min(results, key=lambda t: results[t]['loss'])
+    with open(os.path.join(work_dir, 'search_results.json'), 'w') as f:
+        json.dump({'best': best_id, 'epochs_trained': runner.epochs_trained, 'trials': results}, f, indent=2)
+    return (f"{method} search finished after {runner.epochs_trained} training epochs. Best trial {best_id}: "
+            f"validation loss {results[best_id]['loss']:.4f} with {results[best_id]['config']}")
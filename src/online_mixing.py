@@ -0,0 +1,234 @@
+import os
+import queue
+import logging
+import threading
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchaudio.transforms as T
+
+from audio_io import AUDIO_EXTENSIONS
+from pcm_store import open_pcm_store
+
+logger = logging.getLogger(__name__)
+
+HPSS_KERNEL_SIZE = 31  # librosa.decompose.hpss default
+
+
+def _median_filter(x: torch.Tensor, kernel_size: int, dim: int) -> torch.Tensor:
+    # centered running median of a (batch, freq, time) tensor along dim, edges replicated
+    x = x.transpose(dim, -1)
+    padded = F.pad(x, (kernel_size // 2, kernel_size // 2), mode='replicate')
+    return padded.unfold(-1, kernel_size, 1).median(dim=-1).values.transpose(dim, -1)
+
+
+def hpss_power(power: torch.Tensor, kernel_size: int = HPSS_KERNEL_SIZE, eps: float = 1e-10) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Harmonic and percussive parts of a batch of power spectrograms (batch, freq, time).
+
+    Median filtering of the magnitudes across time (harmonic) and across frequency
+    (percussive) with soft masks of power 2, as librosa.effects.hpss does, but applied to
+    the feature STFT on the device instead of resynthesizing and re-analysing waveforms.
+    """
+    magnitude = power.sqrt()
+    harmonic = _median_filter(magnitude, kernel_size, dim=-1) ** 2
+    percussive = _median_filter(magnitude, kernel_size, dim=-2) ** 2
+    total = (harmonic + percussive).clamp_min(eps)
+    return power * (harmonic / total) ** 2, power * (percussive / total) ** 2
+
+
+def find_stem_files(data_dir: str, stems: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Source files per stem: '<data_dir>/<stem>/*' when that directory exists (the organized
+    stems prepare_dataset reads), else the rendered '<stem>_<id>.<ext>' files in data_dir.
+    """
+    stem_files = {}
+    for stem in stems:
+        stem_dir = os.path.join(data_dir, stem)
+        if os.path.isdir(stem_dir):
+            files = [os.path.join(stem_dir, f) for f in os.listdir(stem_dir) if f.endswith(AUDIO_EXTENSIONS)]
+        else:
+            files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.startswith(f"{stem}_") and f.endswith(AUDIO_EXTENSIONS)]
+        if files:
+            stem_files[stem] = sorted(files)
+    return stem_files
+
+
+class OnlineMixingSource:
+    """
+    Endless supply of freshly mixed training batches drawn from a decoded PCM store.
+
+    For every batch a background thread picks, per example and stem, a random source file,
+    offset, gain and (for stems other than the target) whether to drop the stem, and gathers
+    the segments from the memory-mapped store into a pinned (batch, stems, samples) buffer.
+    The consumer moves the buffer to the device, mixes with one batched multiply-sum and
+    computes the features there, so no mixture is ever written to disk or cached.
+
+    Batches come out as {'input', 'target', 'file_paths', 'online'} with input/target of
+    shape (batch, 3, n_mels, target_length): the log-mel spectrograms of the signal and of
+    its harmonic and percussive parts, the channel layout StemSeparationDataset caches. HPSS
+    runs on the STFT of the features (see hpss_power), which approximates the cached
+    pipeline's librosa HPSS of the waveform rather than reproducing it bit for bit.
+    Epoch e is drawn from a generator seeded with (seed, e), so a resumed run sees the same
+    mixtures it would have seen without the interruption.
+    """
+    def __init__(
+        self, stem_files: Dict[str, List[str]], target_stem: str, pcm_store_dir: str, sample_rate: int,
+        n_mels: int, n_fft: int, target_length: int, batch_size: int, device: torch.device,
+        steps_per_epoch: int = 1000, gain_db: Tuple[float, float] = (-9.0, 3.0), stem_dropout: float = 0.1,
+        seed: int = 0, prefetch: int = 4
+    ):
+        if target_stem not in stem_files:
+            raise ValueError(f"No source files for target stem {target_stem}")
+        self.stems = list(stem_files)
+        self.target_index = self.stems.index(target_stem)
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.steps_per_epoch = steps_per_epoch
+        self.gain_db = gain_db
+        self.stem_dropout = stem_dropout
+        self.seed = seed
+        self.prefetch = prefetch
+        self.target_length = target_length
+
+        hop_length = n_fft // 4
+        # centered STFT: target_length frames need (target_length - 1) hops
+        self.segment_samples = (target_length - 1) * hop_length
+        # the two halves of T.MelSpectrogram, so HPSS can run on the linear power spectrogram in between
+        self.spectrogram = T.Spectrogram(n_fft=n_fft, win_length=None, hop_length=hop_length, power=2.0).to(self.device)
+        self.mel_scale = T.MelScale(n_mels=n_mels, sample_rate=sample_rate, n_stft=n_fft // 2 + 1).to(self.device)
+        self.amplitude_to_db = T.AmplitudeToDB().to(self.device)
+
+        store = open_pcm_store(pcm_store_dir, sample_rate)
+        store.ingest_all([path for files in stem_files.values() for path in files])
+        # mono memory maps; sources shorter than a segment are zero padded on gather
+        self.sources = [[store.read(path, mono=True)[0] for path in stem_files[stem]] for stem in self.stems]
+        logger.info(f"Online mixing from {sum(len(s) for s in self.sources)} sources over stems {self.stems}; "
+                    f"target {target_stem}, {self.segment_samples} samples per example")
+
+        pin = self.device.type == 'cuda'
+        # rotating pinned buffers; an event per buffer keeps the producer from refilling one still being copied
+        self._buffers = [torch.empty(batch_size, len(self.stems), self.segment_samples, pin_memory=pin) for _ in range(prefetch + 2)]
+        self._events = [None] * len(self._buffers)
+
+    def __len__(self) -> int:
+        return self.steps_per_epoch
+
+    def _gather(self, rng: np.random.Generator, buffer: torch.Tensor) -> np.ndarray:
+        host = buffer.numpy()
+        for s, sources in enumerate(self.sources):
+            for b in range(self.batch_size):
+                source = sources[rng.integers(len(sources))]
+                if len(source) > self.segment_samples:
+                    offset = rng.integers(len(source) - self.segment_samples)
+                    host[b, s] = source[offset:offset + self.segment_samples]
+                else:
+                    host[b, s, :len(source)] = source
+                    host[b, s, len(source):] = 0
+
+        gains = 10 ** (rng.uniform(*self.gain_db, size=(self.batch_size, len(self.stems))) / 20)
+        dropped = rng.random((self.batch_size, len(self.stems))) < self.stem_dropout
+        dropped[:, self.target_index] = False
+        gains[dropped] = 0
+        return gains.astype(np.float32)
+
+    @staticmethod
+    def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, epoch: int, out: queue.Queue, stop: threading.Event):
+        rng = np.random.default_rng([self.seed, epoch])
+        try:
+            for step in range(self.steps_per_epoch):
+                slot = step % len(self._buffers)
+                if self._events[slot] is not None:
+                    self._events[slot].synchronize()
+                gains = self._gather(rng, self._buffers[slot])
+                if not self._put(out, (slot, gains), stop):
+                    return
+        except Exception as e:
+            logger.error(f"Online mixing producer failed: {e}", exc_info=True)
+        self._put(out, None, stop)
+
+    def _features(self, audio: torch.Tensor) -> torch.Tensor:
+        power = self.spectrogram(audio)[..., :self.target_length]
+        harmonic, percussive = hpss_power(power)
+        return torch.stack([self.amplitude_to_db(self.mel_scale(p)) for p in (power, harmonic, percussive)], dim=1)
+
+    def epoch(self, epoch: int) -> Iterator[Dict[str, object]]:
+        out = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(epoch, out, stop), daemon=True, name='online-mixing')
+        producer.start()
+        try:
+            while True:
+                item = out.get()
+                if item is None:
+                    return
+                slot, gains = item
+                stems = self._buffers[slot].to(self.device, non_blocking=True)
+                if self.device.type == 'cuda':
+                    self._events[slot] = torch.cuda.Event()
+                    self._events[slot].record()
+                gains = torch.from_numpy(gains).to(self.device, non_blocking=True).unsqueeze(-1)
+
+                with torch.no_grad():
+                    stems = stems * gains
+                    mixture = stems.sum(dim=1)
+                    # peak-normalize the mixture like prepare_dataset does, and scale the target with it
+                    scale = mixture.abs().amax(dim=-1, keepdim=True).clamp_min(1e-8)
+                    inputs = self._features(mixture / scale)
+                    targets = self._features(stems[:, self.target_index] / scale)
+
+                yield {
+                    'input': inputs,
+                    'target': targets,
+                    'file_paths': [f"online_{epoch}"] * self.batch_size,
+                    'online': True,
+                }
+        finally:
+            stop.set()
+            producer.join()
+
+    def __iter__(self):
+        return self.epoch(0)
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure how fast online mixing produces training batches.")
+    parser.add_argument('data_dir', help="organized stem directories or rendered '<stem>_<id>' files")
+    parser.add_argument('pcm_store_dir')
+    parser.add_argument('--target_stem', default='vocals')
+    parser.add_argument('--stems', nargs='+', default=['vocals', 'drums', 'bass', 'kick', 'keys', 'guitar'])
+    parser.add_argument('--sample_rate', type=int, default=44100)
+    parser.add_argument('--n_mels', type=int, default=32)
+    parser.add_argument('--n_fft', type=int, default=1024)
+    parser.add_argument('--target_length', type=int, default=256)
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--steps', type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    source = OnlineMixingSource(
+        find_stem_files(args.data_dir, args.stems), args.target_stem, args.pcm_store_dir, args.sample_rate,
+        args.n_mels, args.n_fft, args.target_length, args.batch_size, device, steps_per_epoch=args.steps
+    )
+    start = time.perf_counter()
+    for batch in source:
+        pass
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    logger.info(f"{args.steps / elapsed:.1f} batches/s ({args.steps * args.batch_size / elapsed:.1f} examples/s) on {device}")
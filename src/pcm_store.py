@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import librosa
+
+from audio_io import read_audio
+
+logger = logging.getLogger(__name__)
+
+
+class PCMStore:
+    """
+    Decode-once store of float32 PCM, memory-mapped by every reader.
+
+    Each source file is decoded (and resampled to sample_rate, unless that is None) once into
+    '<key>.f32', a raw (frames, channels) float32 array, next to '<key>.json' holding its
+    metadata: source path, mtime and size (to detect changes), source and stored sample rate,
+    frames, channels and loudness (RMS, dBFS). Per-entry metadata files keep concurrent
+    writers from different processes out of each other's way; index() collects them.
+    """
+    def __init__(self, root: str, sample_rate: Optional[int] = None):
+        self.root = root
+        self.sample_rate = int(sample_rate) if sample_rate else None
+        os.makedirs(root, exist_ok=True)
+
+    def _key(self, source_path: str) -> str:
+        digest = hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()
+        return f"{digest}_{self.sample_rate or 'native'}"
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def entry(self, source_path: str) -> Optional[Dict[str, Any]]:
+        """Metadata of source_path if it is stored and up to date, else None."""
+        meta_path = self._meta_path(self._key(source_path))
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        stat = os.stat(source_path)
+        if meta['mtime'] != stat.st_mtime or meta['size'] != stat.st_size:
+            return None
+        return meta
+
+    def ingest(self, source_path: str) -> Dict[str, Any]:
+        """Decode source_path into the store unless an up-to-date copy exists; returns its metadata."""
+        meta = self.entry(source_path)
+        if meta is not None:
+            return meta
+
+        key = self._key(source_path)
+        data, source_sample_rate = read_audio(source_path, dtype='float32', mmap=False)
+        data = np.asarray(data, dtype=np.float32)
+        if data.ndim == 1:
+            data = data[:, None]
+        sample_rate = self.sample_rate or source_sample_rate
+        if sample_rate != source_sample_rate:
+            data = librosa.resample(data.T, orig_sr=source_sample_rate, target_sr=sample_rate).T.astype(np.float32)
+
+        data_path = os.path.join(self.root, f"{key}.f32")
+        temp_path = f"{data_path}.partial"
+        np.ascontiguousarray(data).tofile(temp_path)
+        os.replace(temp_path, data_path)
+
+        stat = os.stat(source_path)
+        rms = float(np.sqrt(np.mean(np.square(data, dtype=np.float64)))) if data.size else 0.0
+        meta = {
+            'source': os.path.abspath(source_path),
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'source_sample_rate': int(source_sample_rate),
+            'sample_rate': int(sample_rate),
+            'frames': int(data.shape[0]),
+            'channels': int(data.shape[1]),
+            'loudness_db': 20 * np.log10(max(rms, 1e-10)),
+            'data': os.path.basename(data_path),
+        }
+        # metadata last: an entry is only visible once its data is complete
+        meta_path = self._meta_path(key)
+        with open(f"{meta_path}.partial", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.partial", meta_path)
+        return meta
+
+    def ingest_all(self, source_paths: Iterable[str], num_workers: int = None) -> int:
+        """Decode every missing or stale source across a process pool; returns how many were decoded."""
+        missing = [path for path in source_paths if self.entry(path) is None]
+        if not missing:
+            return 0
+        logger.info(f"Decoding {len(missing)} file(s) into the PCM store at {self.root}")
+        num_workers = num_workers or os.cpu_count() or 1
+        if num_workers <= 1:
+            for path in missing:
+                _ingest_task((self.root, self.sample_rate, path))
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                list(executor.map(_ingest_task, [(self.root, self.sample_rate, path) for path in missing], chunksize=4))
+        return len(missing)
+
+    def info(self, source_path: str) -> Dict[str, Any]:
+        return self.ingest(source_path)
+
+    def read(self, source_path: str, mono: bool = False) -> Tuple[np.ndarray, int]:
+        """
+        (data, sample_rate) for source_path, decoding it on first use.
+
+        data is a read-only memory map of shape (frames, channels), or (frames,) with mono=True
+        (channels averaged, which does materialize a copy for multichannel sources).
+        """
+        meta = self.ingest(source_path)
+        data = np.memmap(os.path.join(self.root, meta['data']), dtype=np.float32, mode='r', shape=(meta['frames'], meta['channels']))
+        if mono:
+            data = data[:, 0] if meta['channels'] == 1 else data.mean(axis=1)
+        return data, meta['sample_rate']
+
+    def index(self) -> List[Dict[str, Any]]:
+        """Metadata of every entry in the store."""
+        entries = []
+        for file_name in sorted(os.listdir(self.root)):
+            if file_name.endswith('.json'):
+                with open(os.path.join(self.root, file_name)) as f:
+                    entries.append(json.load(f))
+        return entries
+
+
+def _ingest_task(args):
+    root, sample_rate, source_path = args
+    try:
+        return PCMStore(root, sample_rate).ingest(source_path)
+    except Exception as e:
+        logger.error(f"Error decoding {source_path} into the PCM store: {e}")
+        return None
+
+
+@lru_cache(maxsize=8)
+def open_pcm_store(root: str, sample_rate: Optional[int] = None) -> PCMStore:
+    """Shared PCMStore per (root, sample_rate) within a process."""
+    return PCMStore(root, sample_rate)
+
+
+if __name__ == "__main__":
+    import argparse
+    from audio_io import AUDIO_EXTENSIONS
+
+    parser = argparse.ArgumentParser(description="Decode audio files once into a memory-mapped float32 PCM store.")
+    parser.add_argument('input_dir', help="directory searched recursively for audio files")
+    parser.add_argument('store_dir')
+    parser.add_argument('--sample_rate', type=int, default=None, help="resample to this rate (default: keep each file's rate)")
+    parser.add_argument('--num_workers', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    paths = [os.path.join(root, f) for root, _, files in os.walk(args.input_dir) for f in files if f.endswith(AUDIO_EXTENSIONS)]
+    store = PCMStore(args.store_dir, args.sample_rate)
+    decoded = store.ingest_all(paths, args.num_workers)
+    logger.info(f"Decoded {decoded} new file(s); {len(store.index())} file(s) in {args.store_dir}")
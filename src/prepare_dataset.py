@@ -1,9 +1,10 @@
 import os
 import random
-import soundfile as sf
 import numpy as np
-from pydub import AudioSegment
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from audio_io import AudioWriter, audio_extension, read_audio
+from pcm_store import open_pcm_store
 
 warnings.filterwarnings("ignore", message="Lazy modules are a new feature under heavy development")
 warnings.filterwarnings("ignore", message="oneDNN custom operations are on. You may see slightly different numerical results due to floating-point round-off errors from different computation orders.")
@@ -22,80 +23,142 @@ def ensure_mono(waveform):
         waveform = np.mean(waveform, axis=1)
     return waveform
 
-def save_as_ogg(waveform, sample_rate, file_path):
-    temp_wav_path = file_path.replace('.ogg', '.wav')
-    sf.write(temp_wav_path, waveform, sample_rate)
-    audio = AudioSegment.from_wav(temp_wav_path)
-    audio.export(file_path, format='ogg')
-    os.remove(temp_wav_path)
-
-def combine_and_shuffle_stems(input_dir, output_dir, num_examples=100, target_length=60):
+_writers = {}
+
+def _get_writer(audio_format, encode_threads):
+    # one encoder pool per worker process, reused across the examples it generates
+    key = (audio_format, encode_threads)
+    if key not in _writers:
+        _writers[key] = AudioWriter(audio_format, num_threads=encode_threads)
+    return _writers[key]
+
+def _example_path(output_dir, name, index, audio_format='ogg'):
+    return os.path.join(output_dir, f'{name}_{index+1:04d}{audio_extension(audio_format)}')
+
+def _pick_files(file_lists, index, seed):
+    if seed is None:
+        return {stem_name: files[index % len(files)] for stem_name, files in file_lists.items()}
+    # one generator per example, so the pairing does not depend on worker scheduling or resume point
+    rng = np.random.default_rng([seed, index])
+    return {stem_name: files[rng.integers(len(files))] for stem_name, files in file_lists.items()}
+
+def read_source(file_path, pcm_store_dir=None):
+    """Mono float32 waveform and sample rate, memory-mapped from the PCM store when one is given."""
+    if pcm_store_dir:
+        return open_pcm_store(pcm_store_dir).read(file_path, mono=True)
+    waveform, sample_rate = read_audio(file_path, dtype='float32')
+    return ensure_mono(waveform), sample_rate
+
+def generate_example(index, input_dir, output_dir, file_lists, target_length, seed=None, audio_format='ogg', encode_threads=4, pcm_store_dir=None):
+    """Build, normalize and write one mixture and its stems; the mixture is written last and marks the example complete."""
+    writer = _get_writer(audio_format, encode_threads)
+    failures = writer.failures
+    combined_waveform = None
+    sample_rate = None
+
+    for stem_name, file in _pick_files(file_lists, index, seed).items():
+        file_path = os.path.join(input_dir, stem_name, file)
+        try:
+            waveform, sample_rate = read_source(file_path, pcm_store_dir)
+        except Exception as e:
+            print(f"Error reading file {file_path}: {e}")
+            continue
+
+        normalized_waveform = normalize_length(waveform, sample_rate, target_length)
+        writer.submit(normalized_waveform, sample_rate, _example_path(output_dir, stem_name, index, audio_format))
+
+        if combined_waveform is None:
+            combined_waveform = np.zeros(len(normalized_waveform), dtype=np.float32)
+        combined_waveform[:len(normalized_waveform)] += normalized_waveform
+
+    if combined_waveform is None:
+        writer.wait()
+        return None
+
+    peak = np.max(np.abs(combined_waveform))
+    if peak > 0:
+        combined_waveform /= peak
+    writer.wait()
+    if writer.failures != failures:
+        print(f"Skipping the mixture of example {index + 1}: a stem failed to write")
+        return None
+    writer.submit(combined_waveform, sample_rate, _example_path(output_dir, 'example', index, audio_format))
+    writer.wait()
+    return index if writer.failures == failures else None
+
+def _generate_example_task(args):
+    return generate_example(*args)
+
+def completed_examples(output_dir, num_examples, audio_format='ogg'):
+    """Indices whose mixture file already exists (and is therefore complete)."""
+    return {i for i in range(num_examples) if os.path.exists(_example_path(output_dir, 'example', i, audio_format))}
+
+def combine_and_shuffle_stems(input_dir, output_dir, num_examples=100, target_length=60, num_workers=None, seed=None, audio_format='ogg', encode_threads=4, pcm_store_dir=None):
+    """
+    Stream examples to disk from a process pool, one example per task.
+
+    Memory use is bounded by one example per worker regardless of num_examples. With seed
+    set, stems are drawn at random from a per-example generator (otherwise example i uses
+    file i % len(files) of each stem). Examples already present in output_dir are skipped,
+    so an interrupted run resumes where it stopped.
+
+    Files are encoded in-process with libsndfile as audio_format ('ogg', 'flac', 'wav' or
+    'npy' for raw float32 the cache builder reads without decoding), encode_threads per worker.
+    With pcm_store_dir, every source stem is decoded once into that PCM store up front and
+    examples read it memory-mapped, instead of decoding a stem for every example it is in.
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
     stem_dirs = [d for d in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, d))]
     file_lists = {}
     for stem_dir in stem_dirs:
-        files = [f for f in os.listdir(os.path.join(input_dir, stem_dir)) if f.endswith(('.wav', '.ogg', '.flac'))]
-        file_lists[stem_dir] = files
+        files = sorted(f for f in os.listdir(os.path.join(input_dir, stem_dir)) if f.endswith(('.wav', '.ogg', '.flac')))
+        if files:
+            file_lists[stem_dir] = files
+
+    if not file_lists:
+        print(f"No audio files found in the stem directories of {input_dir}")
+        return 0
 
     min_files = min(len(files) for files in file_lists.values())
     print(f"Found at least {min_files} audio files in each stem directory")
-    
-    data = []
-    targets = {}
-
-    for i in range(num_examples):
-        combined_waveform = None
-        max_length = target_length * 44100  # Assuming a sample rate of 44100 Hz
-
-        for stem_name, files in file_lists.items():
-            if i < len(files):
-                file_idx = i
-            else:
-                file_idx = i % len(files)
-            
-            file = files[file_idx]
-            file_path = os.path.join(input_dir, stem_name, file)
-            try:
-                waveform, sample_rate = sf.read(file_path, dtype='float32')
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-                continue
-
-            waveform = ensure_mono(waveform)
-            normalized_waveform = normalize_length(waveform, sample_rate, target_length)
-            
-            if stem_name not in targets:
-                targets[stem_name] = []
-            targets[stem_name].append(normalized_waveform)
-
-            if combined_waveform is None:
-                combined_waveform = np.zeros(max_length, dtype=np.float32)
-            
-            combined_waveform[:len(normalized_waveform)] += normalized_waveform
-        
-        combined_waveform = combined_waveform / np.max(np.abs(combined_waveform))
-
-        data.append(combined_waveform)
-
-        print(f"Generated example {i+1}")
-
-    data = np.array(data)
-
-    for idx, example in enumerate(data):
-        file_path = os.path.join(output_dir, f'example_{idx+1:04d}.ogg')
-        save_as_ogg(example, sample_rate, file_path)
-
-    for stem_name, target_examples in targets.items():
-        for idx, example in enumerate(target_examples):
-            file_path = os.path.join(output_dir, f'{stem_name}_{idx+1:04d}.ogg')
-            save_as_ogg(example, sample_rate, file_path)
+
+    done = completed_examples(output_dir, num_examples, audio_format)
+    if done:
+        print(f"Resuming: {len(done)} of {num_examples} examples already in {output_dir}")
+    num_workers = num_workers or os.cpu_count() or 1
+    if pcm_store_dir:
+        open_pcm_store(pcm_store_dir).ingest_all(
+            [os.path.join(input_dir, stem_name, f) for stem_name, files in file_lists.items() for f in files], num_workers)
+
+    tasks = [(i, input_dir, output_dir, file_lists, target_length, seed, audio_format, encode_threads, pcm_store_dir) for i in range(num_examples) if i not in done]
+    generated = 0
+    if num_workers <= 1:
+        results = map(_generate_example_task, tasks)
+        generated = _report_progress(results, len(done), num_examples)
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = executor.map(_generate_example_task, tasks, chunksize=max(1, min(16, len(tasks) // (num_workers * 4))))
+            generated = _report_progress(results, len(done), num_examples)
 
     print(f"Saved data and targets to {output_dir}")
+    return generated
+
+def _report_progress(results, already_done, num_examples):
+    generated = 0
+    for index in results:
+        if index is None:
+            continue
+        generated += 1
+        print(f"Generated example {index+1} ({already_done + generated}/{num_examples})")
+    return generated
     
-def organize_and_prepare_dataset(input_dir, output_dir, num_examples):
-    combine_and_shuffle_stems(input_dir, output_dir, num_examples)
+def organize_and_prepare_dataset(input_dir, output_dir, num_examples, num_workers=None, seed=None, audio_format='ogg', pcm_store_dir=None):
+    combine_and_shuffle_stems(input_dir, output_dir, int(num_examples), num_workers=num_workers, seed=seed, audio_format=audio_format, pcm_store_dir=pcm_store_dir)
     return f"Dataset prepared with {num_examples} examples in {output_dir}"
 
 def organize_and_prepare_dataset_gradio(input_dir, output_dir, num_examples):
@@ -109,7 +172,11 @@ if __name__ == "__main__":
     parser.add_argument('--input_dir', type=str, required=True, help='Directory containing stem directories.')
     parser.add_argument('--output_dir', type=str, required=True, help='Output directory for processed dataset.')  
     parser.add_argument('--num_examples', type=int, required=True, help='Number of examples to generate.')
+    parser.add_argument('--num_workers', type=int, default=None, help='Worker processes (default: one per CPU).')
+    parser.add_argument('--seed', type=int, default=None, help='Draw stems at random with this seed instead of pairing file i of every stem.')
+    parser.add_argument('--audio_format', type=str, default='ogg', choices=['ogg', 'flac', 'wav', 'npy'], help='Output encoding (npy: raw float32 PCM).')
+    parser.add_argument('--pcm_store_dir', type=str, default=None, help='Decode source stems once into this memory-mapped PCM store.')
 
     args = parser.parse_args()
 
-    organize_and_prepare_dataset(args.input_dir, args.output_dir, args.num_examples)
+    organize_and_prepare_dataset(args.input_dir, args.output_dir, args.num_examples, num_workers=args.num_workers, seed=args.seed, audio_format=args.audio_format, pcm_store_dir=args.pcm_store_dir)
@@ -0,0 +1,189 @@
+import os
+import copy
+import math
+import glob
+import time
+import logging
+from typing import Any, Callable, Dict, List
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.ao.quantization import QConfig, QuantWrapper, get_default_qconfig, prepare, convert
+from torch.ao.quantization.observer import FixedQParamsObserver
+
+from inference_optimization import fold_norms, strip_identities, disable_checkpointing
+from utils import compute_sdr, load_from_cache
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_FORMAT = 'int8'
+
+# modules that may sit inside a statically quantized conv block
+_STATIC_QUANTIZABLE = (nn.Conv1d, nn.Conv2d, nn.ReLU, nn.LeakyReLU, nn.Identity)
+
+
+def select_engine() -> str:
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            return engine
+    raise RuntimeError(f"No supported quantized engine in {engines}")
+
+
+def _wrap_convolutions(module: nn.Module, qconfig) -> int:
+    wrapped = 0
+    for name, child in list(module.named_children()):
+        is_conv_block = isinstance(child, nn.Sequential) and len(child) > 0 and isinstance(child[0], (nn.Conv1d, nn.Conv2d)) \
+            and all(isinstance(m, _STATIC_QUANTIZABLE) for m in child)
+        if isinstance(child, (nn.Conv1d, nn.Conv2d)) or is_conv_block:
+            child = QuantWrapper(child)
+            child.qconfig = qconfig
+            setattr(module, name, child)
+            wrapped += 1
+        else:
+            wrapped += _wrap_convolutions(child, qconfig)
+    return wrapped
+
+
+def _structure_qconfig(engine: str) -> QConfig:
+    """
+    qconfig for rebuilding the quantized modules of a saved artifact: the activation qparams
+    are overwritten by its state dict, so activations get fixed placeholder qparams instead
+    of observers that would be converted without ever seeing data.
+    """
+    activation = FixedQParamsObserver.with_args(scale=1.0, zero_point=0, dtype=torch.quint8, quant_min=0, quant_max=255)
+    return QConfig(activation=activation, weight=get_default_qconfig(engine).weight)
+
+
+def prepare_quantization(model: nn.Module, engine: str, qconfig: QConfig = None) -> nn.Module:
+    """
+    CPU copy of model ready for calibration: norms folded, every conv block wrapped in
+    quantize/dequantize stubs with observers (the engine's default qconfig unless qconfig
+    is given). The stem generator is all conv blocks, so nothing is left in float.
+    """
+    model = copy.deepcopy(model).cpu().float().eval()
+    fold_norms(model)
+    strip_identities(model)
+    disable_checkpointing(model)
+
+    wrapped = _wrap_convolutions(model, qconfig or get_default_qconfig(engine))
+    logger.info(f"Quantizing {wrapped} conv block(s) statically ({engine})")
+    return prepare(model, inplace=True)
+
+
+def model_segments(spec: torch.Tensor, target_length: int, max_segments: int = None) -> torch.Tensor:
+    """
+    Cut a cached (1, C, n_mels, frames) spectrogram along time into a batch of model inputs
+    of shape (num_segments, C, n_mels, target_length), at most max_segments of them; the
+    last segment is padded with the spectrogram's floor value.
+    """
+    spec = spec.reshape(-1, *spec.shape[-2:])
+    num_segments = max(1, math.ceil(spec.size(-1) / target_length))
+    if max_segments is not None:
+        num_segments = min(num_segments, max_segments)
+    spec = spec[..., :num_segments * target_length]
+    spec = F.pad(spec, (0, num_segments * target_length - spec.size(-1)), value=float(spec.min()))
+    return spec.unflatten(-1, (num_segments, target_length)).permute(2, 0, 1, 3).contiguous()
+
+
+def calibration_inputs(cache_dir: str, n_mels: int, target_length: int, n_fft: int, max_files: int = 8, max_segments: int = 16) -> List[torch.Tensor]:
+    """
+    Model inputs from the HDF5 cache (as written by StemSeparationDataset): one batch of up to
+    max_segments target_length windows per cached file.
+    """
+    pattern = os.path.join(cache_dir, f"input_*_{n_mels}_{target_length}_{n_fft}.h5")
+    paths = sorted(glob.glob(pattern))[:max_files]
+    if not paths:
+        raise ValueError(f"No cached inputs matching {pattern} for calibration")
+    return [model_segments(load_from_cache(path, torch.device('cpu'))['input'], target_length, max_segments) for path in paths]
+
+
+def quantize_model(model: nn.Module, calibration_data: List[torch.Tensor], engine: str = None) -> nn.Module:
+    engine = engine or select_engine()
+    torch.backends.quantized.engine = engine
+    prepared = prepare_quantization(model, engine)
+    with torch.no_grad():
+        for x in calibration_data:
+            prepared(x)
+    quantized = convert(prepared, inplace=True)
+    quantized.quantization_engine = engine
+    return quantized
+
+
+def measure_sdr_drift(float_model: nn.Module, quantized_model: nn.Module, data: List[torch.Tensor]) -> Dict[str, float]:
+    """SDR (dB) of the quantized outputs against the float outputs; higher is closer."""
+    float_model = float_model.cpu().float().eval()
+    sdrs = []
+    with torch.no_grad():
+        for x in data:
+            sdrs.append(compute_sdr(float_model(x), quantized_model(x)))
+    sdrs = torch.cat(sdrs)
+    return {'sdr_mean_db': sdrs.mean().item(), 'sdr_min_db': sdrs.min().item()}
+
+
+def measure_throughput(model: nn.Module, data: List[torch.Tensor], repeats: int = 3) -> float:
+    """Inputs per second on the CPU."""
+    with torch.no_grad():
+        model(data[0])
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for x in data:
+                model(x)
+    return repeats * len(data) / (time.perf_counter() - start)
+
+
+def save_quantized_model(quantized_model: nn.Module, path: str, model_config: Dict[str, Any], report: Dict[str, float] = None):
+    # tensors (quantized ones included) and plain types only, so model.load_model can read it with weights_only=True
+    torch.save({
+        'quantization': QUANTIZED_FORMAT,
+        'engine': quantized_model.quantization_engine,
+        'model_config': model_config,
+        'state_dict': quantized_model.state_dict(),
+        'report': {key: float(value) for key, value in (report or {}).items()},
+    }, path)
+    logger.info(f"Saved quantized model to {path}")
+
+
+def load_quantized_model(artifact: Dict[str, Any], model_factory: Callable[[], nn.Module]) -> nn.Module:
+    """Rebuild the quantized module structure around a fresh float model and load the int8 state into it."""
+    engine = artifact['engine']
+    if engine not in torch.backends.quantized.supported_engines:
+        engine = select_engine()
+        logger.warning(f"Quantized engine {artifact['engine']} unavailable, using {engine}")
+    torch.backends.quantized.engine = engine
+    model = convert(prepare_quantization(model_factory(), engine, _structure_qconfig(engine)), inplace=True)
+    model.load_state_dict(artifact['state_dict'])
+    model.quantization_engine = engine
+    return model.eval()
+
+
+if __name__ == "__main__":
+    import argparse
+    from model import FEATURE_CHANNELS, load_model
+
+    parser = argparse.ArgumentParser(description="Post-training INT8 quantization of a stem model for CPU serving.")
+    parser.add_argument('checkpoint', help="float checkpoint (.pt or .flat)")
+    parser.add_argument('out_path', help="quantized artifact, loadable with model.load_model")
+    parser.add_argument('--cache_dir', required=True)
+    parser.add_argument('--n_mels', type=int, required=True)
+    parser.add_argument('--target_length', type=int, required=True)
+    parser.add_argument('--n_fft', type=int, required=True)
+    parser.add_argument('--stem', default=None, help="model name inside a multi-stem .flat file")
+    parser.add_argument('--calibration_files', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    float_model = load_model(args.checkpoint, FEATURE_CHANNELS, FEATURE_CHANNELS, args.n_mels, args.target_length, device='cpu', stem=args.stem)
+    data = calibration_inputs(args.cache_dir, args.n_mels, args.target_length, args.n_fft, max_files=args.calibration_files)
+    calibration, evaluation = data[:max(1, len(data) // 2)], data[len(data) // 2:] or data
+
+    quantized = quantize_model(float_model, calibration)
+    report = measure_sdr_drift(float_model, quantized, evaluation)
+    report['float_inputs_per_s'] = measure_throughput(float_model, evaluation)
+    report['int8_inputs_per_s'] = measure_throughput(quantized, evaluation)
+    logger.info(f"SDR vs float: mean {report['sdr_mean_db']:.2f} dB, min {report['sdr_min_db']:.2f} dB; "
+                f"throughput {report['float_inputs_per_s']:.2f} -> {report['int8_inputs_per_s']:.2f} inputs/s")
+
+    model_config = {'in_channels': FEATURE_CHANNELS, 'out_channels': FEATURE_CHANNELS, 'n_mels': args.n_mels, 'target_length': args.target_length}
+    save_quantized_model(quantized, args.out_path, model_config, report)
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=64)
+def _fingerprint(path: str, mtime: float, size: int) -> str:
+    return file_sha256(path)
+
+
+def checkpoint_fingerprint(checkpoint_path: str) -> str:
+    """sha256 of a checkpoint file, hashed once per (path, mtime, size) in this process."""
+    stat = os.stat(checkpoint_path)
+    return _fingerprint(os.path.abspath(checkpoint_path), stat.st_mtime, stat.st_size)
+
+
+def result_key(audio_hash: str, checkpoint_hashes: Sequence[str], n_mels: int, n_fft: int, reconstruction: str) -> str:
+    """Content address of one separation: the same audio through the same models and settings gives the same key."""
+    payload = json.dumps([audio_hash, list(checkpoint_hashes), int(n_mels), int(n_fft), reconstruction])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of separation results, bounded to max_bytes.
+
+    Every request writes into its own staging directory (staging_dir()), so concurrent requests
+    never touch each other's files; put() then renames the finished directory into place as
+    '<root>/<key[:2]>/<key>' with a manifest of its files. If another request stored the same
+    key first, the staged copy is dropped and the stored one returned. get() refreshes the
+    manifest's mtime, which is the recency eviction goes by: after each put() the least
+    recently used entries are deleted until the cache fits max_bytes.
+    """
+    def __init__(self, root: str, max_bytes: int = 10 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self._staging_root = os.path.join(root, 'staging')
+        self._evict_lock = threading.Lock()
+        os.makedirs(self._staging_root, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Result paths stored under key (marking the entry as used), or None."""
+        manifest_path = os.path.join(self._entry_dir(key), MANIFEST_FILE)
+        try:
+            with open(manifest_path) as f:
+                files = json.load(f)['files']
+            os.utime(manifest_path)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        paths = [os.path.join(self._entry_dir(key), name) for name in files]
+        return paths if all(os.path.exists(path) for path in paths) else None
+
+    def staging_dir(self, request_id: str = None) -> str:
+        path = os.path.join(self._staging_root, request_id or uuid.uuid4().hex)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def put(self, key: str, staging_dir: str, files: Sequence[str]) -> List[str]:
+        """Store the named files of a finished staging directory under key; returns their cached paths."""
+        with open(os.path.join(staging_dir, MANIFEST_FILE), 'w') as f:
+            json.dump({'files': list(files), 'created': time.time()}, f)
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # stored concurrently by an identical request (or a stale entry without a manifest)
+            if self.get(key) is None:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.rename(staging_dir, entry_dir)
+            else:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        self.evict(keep=key)
+        return [os.path.join(entry_dir, name) for name in files]
+
+    def discard(self, staging_dir: str):
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def evict(self, keep: str = None) -> int:
+        """Delete least recently used entries (never keep) until the cache fits max_bytes; returns how many went."""
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for prefix in os.listdir(self.root):
+                prefix_dir = os.path.join(self.root, prefix)
+                if prefix_dir == self._staging_root or not os.path.isdir(prefix_dir):
+                    continue
+                for key in os.listdir(prefix_dir):
+                    entry_dir = os.path.join(prefix_dir, key)
+                    try:
+                        used = os.path.getmtime(os.path.join(entry_dir, MANIFEST_FILE))
+                        size = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+                    except OSError:
+                        continue
+                    entries.append((used, size, key, entry_dir))
+                    total += size
+
+            evicted = 0
+            for used, size, key, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                evicted += 1
+            if evicted:
+                logger.info(f"Evicted {evicted} cached separation(s); {total / 1024 ** 2:.1f} MiB left in {self.root}")
+            return evicted
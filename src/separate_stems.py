@@ -1,14 +1,22 @@
 import os
+import math
 import torch
 import torchaudio
+import librosa
 import logging
 import soundfile as sf
+import torch.nn.functional as F
+from functools import lru_cache
 from torchaudio import transforms as T
-from model import load_model
-import librosa
+from model import FEATURE_CHANNELS, load_model
+from flat_checkpoint import FLAT_CHECKPOINT_SUFFIX
+from inference_optimization import optimize_for_inference
+from result_cache import ResultCache, checkpoint_fingerprint, file_sha256, result_key
 
 logger = logging.getLogger(__name__)
 
+RECONSTRUCTION_MODES = ('griffinlim', 'mixture_phase')
+
 def read_audio(file_path, suppress_messages=False):
     try:
         if not suppress_messages:
@@ -30,7 +38,119 @@ def write_audio(file_path, data, samplerate):
     except Exception as e:
         logger.error(f"Error writing audio file {file_path}: {e}")
 
-def perform_separation(checkpoints, file_path, n_mels, target_length, n_fft, cache_dir, suppress_reading_messages):
+def load_inference_model(checkpoint_path, n_mels, target_length, device):
+    model = load_model(checkpoint_path, FEATURE_CHANNELS, FEATURE_CHANNELS, n_mels, target_length, device)
+    if getattr(model, 'quantization_engine', None) is not None:
+        return model  # int8 artifact, already optimized for CPU inference
+    use_cuda = device.type == 'cuda'
+    return optimize_for_inference(
+        model,
+        example_input=torch.randn(1, FEATURE_CHANNELS, n_mels, target_length, device=device),
+        dtype=torch.float16 if use_cuda else None,
+        channels_last=use_cuda
+    )
+
+@lru_cache(maxsize=8)
+def _transforms(sample_rate, n_mels, n_fft, griffin_lim_iters=32):
+    hop_length = n_fft // 4
+    mel_spectrogram = T.MelSpectrogram(sample_rate=sample_rate, n_mels=n_mels, n_fft=n_fft, hop_length=hop_length, power=2.0)
+    inverse_mel = T.InverseMelScale(n_stft=n_fft // 2 + 1, n_mels=n_mels, sample_rate=sample_rate)
+    griffin_lim = T.GriffinLim(n_fft=n_fft, n_iter=griffin_lim_iters, hop_length=hop_length, power=2.0)
+    return mel_spectrogram, T.AmplitudeToDB(), inverse_mel, griffin_lim
+
+def find_stem_checkpoints(checkpoint_dir, num_stems=None):
+    """Per-stem models in checkpoint_dir: the model_final_stem_* files training writes, else every .pt/.flat file."""
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    files = sorted(os.listdir(checkpoint_dir))
+    checkpoints = [f for f in files if f.startswith('model_final_stem_')]
+    if not checkpoints:
+        checkpoints = [f for f in files if f.endswith(('.pt', FLAT_CHECKPOINT_SUFFIX))]
+    checkpoints = [os.path.join(checkpoint_dir, f) for f in checkpoints]
+    return checkpoints[:int(num_stems)] if num_stems else checkpoints
+
+def mono(audio):
+    waveform = torch.as_tensor(audio, dtype=torch.float32)
+    return waveform.mean(dim=1) if waveform.dim() == 2 else waveform
+
+def reconstruction_id(reconstruction, griffin_lim_iters=32):
+    """Label of a reconstruction setting for result cache keys; Griffin-Lim output depends on its iteration count."""
+    return f"griffinlim{griffin_lim_iters}" if reconstruction == 'griffinlim' else reconstruction
+
+def separation_features(audio, sample_rate, n_mels, n_fft, target_length):
+    """
+    Model input of a (samples,) or (samples, channels) waveform, cut into model-sized chunks.
+
+    The channels are the training features of utils.StemSeparationDataset: the log-mel
+    spectrograms of the waveform and of its harmonic and percussive parts (librosa HPSS).
+    Returns (chunks, num_frames): chunks of shape (num_chunks, FEATURE_CHANNELS, n_mels,
+    target_length) are consecutive windows of the spectrograms, the last one padded with
+    each channel's floor value.
+    """
+    waveform = mono(audio)
+    mel_spectrogram, amplitude_to_db, _, _ = _transforms(sample_rate, n_mels, n_fft)
+    harmonic, percussive = librosa.effects.hpss(waveform.numpy())
+    with torch.no_grad():
+        spec = torch.stack([amplitude_to_db(mel_spectrogram(torch.as_tensor(signal, dtype=torch.float32)))
+                            for signal in (waveform, harmonic, percussive)])
+    num_frames = spec.size(-1)
+    num_chunks = max(1, math.ceil(num_frames / target_length))
+    floor = spec.amin(dim=(1, 2), keepdim=True).expand(-1, n_mels, num_chunks * target_length - num_frames)
+    spec = torch.cat([spec, floor], dim=-1)
+    chunks = spec.reshape(FEATURE_CHANNELS, n_mels, num_chunks, target_length).permute(2, 0, 1, 3).contiguous()
+    return chunks, num_frames
+
+def separate_chunks(models, chunks, device, max_batch=32):
+    """Run every model over the chunks, max_batch chunks per forward pass; one output per model, on the CPU."""
+    outputs = []
+    with torch.no_grad():
+        for model in models:
+            parts = [model(batch.to(device, non_blocking=True)).float().cpu() for batch in chunks.split(max_batch)]
+            outputs.append(torch.cat(parts))
+    return outputs
+
+def reconstruct_audio(chunks, num_frames, num_samples, sample_rate, n_mels, n_fft, griffin_lim_iters=32, reconstruction='griffinlim', mixture=None):
+    """
+    Waveform of num_samples from the log-mel channel (0) of output chunks: back to power, inverse mel scale, then
+    Griffin-Lim phase estimation ('griffinlim') or the phase of the mixture's STFT
+    ('mixture_phase', which needs the mono mixture waveform and skips the iterations).
+    """
+    if reconstruction not in RECONSTRUCTION_MODES:
+        raise ValueError(f"Unknown reconstruction mode: {reconstruction}. Choose from {RECONSTRUCTION_MODES}")
+    _, _, inverse_mel, griffin_lim = _transforms(sample_rate, n_mels, n_fft, griffin_lim_iters)
+    spec = chunks[:, 0].permute(1, 0, 2).reshape(n_mels, -1)[:, :num_frames].float()
+    with torch.no_grad():
+        power = inverse_mel(torchaudio.functional.DB_to_amplitude(spec, ref=1.0, power=1.0))
+        if reconstruction == 'mixture_phase':
+            if mixture is None:
+                raise ValueError("mixture_phase reconstruction needs the mixture waveform")
+            window = torch.hann_window(n_fft)
+            mixture_stft = torch.stft(torch.as_tensor(mixture, dtype=torch.float32), n_fft, hop_length=n_fft // 4, window=window, return_complex=True)
+            magnitude = power.clamp_min(0).sqrt()[:, :mixture_stft.size(-1)]
+            phase = torch.polar(torch.ones_like(magnitude), mixture_stft[:, :magnitude.size(-1)].angle())
+            audio = torch.istft(magnitude * phase, n_fft, hop_length=n_fft // 4, window=window, length=num_samples)
+        else:
+            audio = griffin_lim(power)
+    audio = F.pad(audio, (0, max(0, num_samples - audio.size(-1))))[:num_samples]
+    return audio.numpy()
+
+def perform_separation(checkpoints, file_path, n_mels, target_length, n_fft, cache_dir, suppress_reading_messages,
+                       reconstruction='griffinlim', cache_max_bytes=10 * 1024 ** 3):
+    """
+    Separate file_path with one model per checkpoint and return the stem paths.
+
+    Results live in a content-addressed ResultCache under cache_dir/separations, keyed by the
+    input audio, checkpoint contents, n_mels, n_fft and reconstruction mode: a repeated request
+    returns the stored stems without running the models, and concurrent requests write into
+    their own staging directories instead of a shared separated_stem_{i}.wav.
+    """
+    cache = ResultCache(os.path.join(cache_dir, 'separations'), cache_max_bytes)
+    key = result_key(file_sha256(file_path), [checkpoint_fingerprint(path) for path in checkpoints], n_mels, n_fft, reconstruction_id(reconstruction))
+    cached = cache.get(key)
+    if cached is not None:
+        logger.info(f"Using cached separation of {file_path}")
+        return cached
+
     logger.info("Loading model for separation...")
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
@@ -39,41 +159,20 @@ def perform_separation(checkpoints, file_path, n_mels, target_length, n_fft, cac
         logger.error(f"Error reading input audio from {file_path}")
         return []
 
-    output_audio = []
-
-    for checkpoint_path in checkpoints:
-        model = load_model(checkpoint_path, 1, 64, n_mels, target_length, 1, device)
-        model.eval()
-        
-        with torch.no_grad():
-            mel_spectrogram = T.MelSpectrogram(
-                sample_rate=sr, n_mels=n_mels, n_fft=n_fft, hop_length=n_fft // 4
-            )(input_audio.float()).unsqueeze(0).to(device)
-            
-            # Calculate harmonic and percussive content and stack into 4D spectrogram
-            spectrogram_np = mel_spectrogram.cpu().detach().numpy()
-            harmonic, percussive = librosa.decompose.hpss(spectrogram_np)
-            harmonic_t = torch.from_numpy(harmonic).to(device)
-            percussive_t = torch.from_numpy(percussive).to(device)
-            
-            input_mel = torch.stack([mel_spectrogram, harmonic_t, percussive_t], dim=-1)
-            
-            output_mel = model(input_mel).cpu()
-            inverse_mel_transform = T.InverseMelScale(n_stft=n_fft // 2 + 1, n_mels=n_mels)
-            griffin_lim_transform = T.GriffinLim(n_fft=n_fft, n_iter=32)
-            audio = griffin_lim_transform(inverse_mel_transform(output_mel.squeeze(0))).numpy()
-            output_audio.append(audio)
-
-    result_paths = []
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-    
+    audio = mono(input_audio.squeeze(0))
+    chunks, num_frames = separation_features(audio, sr, n_mels, n_fft, target_length)
+    models = [load_inference_model(checkpoint_path, n_mels, target_length, device) for checkpoint_path in checkpoints]
+    outputs = separate_chunks(models, chunks, device)
+    output_audio = [reconstruct_audio(output, num_frames, audio.size(0), sr, n_mels, n_fft, reconstruction=reconstruction, mixture=audio)
+                    for output in outputs]
+
+    staging_dir = cache.staging_dir()
+    file_names = []
     for i, audio in enumerate(output_audio):
-        result_path = os.path.join(cache_dir, f"separated_stem_{i}.wav")
-        write_audio(result_path, torch.tensor(audio), sr)
-        result_paths.append(result_path)
+        file_names.append(f"separated_stem_{i}.wav")
+        write_audio(os.path.join(staging_dir, file_names[-1]), torch.tensor(audio), sr)
 
-    return result_paths
+    return cache.put(key, staging_dir, file_names)
 
 if __name__ == '__main__':
     # Example usage of perform_separation
@@ -0,0 +1,302 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import torch
+
+from audio_io import read_audio, write_audio
+from result_cache import ResultCache, checkpoint_fingerprint, file_sha256, result_key
+from separate_stems import (
+    RECONSTRUCTION_MODES, find_stem_checkpoints, load_inference_model, mono, reconstruct_audio, reconstruction_id,
+    separate_chunks, separation_features
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SeparationJob:
+    """
+    One separation request: status ('queued', 'running', 'done', 'failed'), progress in [0, 1],
+    a message, and the result paths once done. Every update wakes the threads waiting in
+    wait() or iterating events().
+    """
+    def __init__(self, job_id: str, file_path: str, key: str, reconstruction: str = 'griffinlim'):
+        self.id = job_id
+        self.file_path = file_path
+        self.key = key
+        self.reconstruction = reconstruction
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.result_paths: List[str] = []
+        self.error: Optional[str] = None
+        self.submitted = time.monotonic()
+        self.finished: Optional[float] = None
+        self._version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def update(self, progress: float = None, message: str = None, status: str = None):
+        with self._changed:
+            if progress is not None:
+                self.progress = progress
+            if message is not None:
+                self.message = message
+            if status is not None:
+                self.status = status
+            self._version += 1
+            self._changed.notify_all()
+
+    def complete(self, result_paths: List[str]):
+        self.result_paths = result_paths
+        self.finished = time.monotonic()
+        self.update(1.0, 'Done', 'done')
+
+    def fail(self, error: str):
+        self.error = error
+        self.finished = time.monotonic()
+        self.update(message=f"Failed: {error}", status='failed')
+
+    def wait(self, timeout: float = None) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self.done, timeout)
+
+    def events(self, timeout: float = None) -> Iterator[Tuple[float, str]]:
+        """Yield (progress, message) on every update until the job is done (or timeout seconds pass without one)."""
+        seen = -1
+        while True:
+            with self._changed:
+                if not self._changed.wait_for(lambda: self._version != seen, timeout):
+                    return
+                seen = self._version
+                progress, message, done = self.progress, self.message, self.done
+            yield progress, message
+            if done:
+                return
+
+
+class _Prepared:
+    __slots__ = ('job', 'chunks', 'num_frames', 'mixture', 'sample_rate')
+
+    def __init__(self, job, chunks, num_frames, mixture, sample_rate):
+        self.job = job
+        self.chunks = chunks
+        self.num_frames = num_frames
+        self.mixture = mixture
+        self.sample_rate = sample_rate
+
+
+class SeparationService:
+    """
+    Separation job service for concurrent users.
+
+    Requests enter a bounded queue (submit() raises RuntimeError when it is full rather than
+    letting latency grow without limit). Decode and feature threads turn each job into log-mel
+    chunks; one model worker per device holds its models warm and collects the chunks of
+    whatever jobs arrive within batch_window seconds, up to max_batch_chunks, into a single
+    forward pass per stem model. Reconstruction and encoding run on the thread pool, each job
+    writing into its own staging directory.
+
+    Finished stems go into a ResultCache in output_dir (at most cache_bytes), keyed by the
+    input audio hash, the checkpoint hashes, n_mels, n_fft and reconstruction mode. Submitting
+    a request that is already cached returns a finished job immediately, and one identical to
+    a request in flight joins that job instead of computing it twice.
+    """
+    def __init__(
+        self, checkpoints: Sequence[str], n_mels: int, target_length: int, n_fft: int, output_dir: str,
+        devices: Sequence[str] = None, max_queue: int = 16, num_workers: int = 4, max_batch_chunks: int = 32,
+        batch_window: float = 0.05, cache_bytes: int = 10 * 1024 ** 3, griffin_lim_iters: int = 32
+    ):
+        if not checkpoints:
+            raise ValueError("No checkpoints to separate with")
+        self.checkpoints = list(checkpoints)
+        self.n_mels = int(n_mels)
+        self.target_length = int(target_length)
+        self.n_fft = int(n_fft)
+        self.output_dir = output_dir
+        self.max_batch_chunks = max_batch_chunks
+        self.batch_window = batch_window
+        self.griffin_lim_iters = griffin_lim_iters
+        self._num_workers = num_workers
+        self.cache = ResultCache(output_dir, cache_bytes)
+        self.checkpoint_hashes = [checkpoint_fingerprint(path) for path in self.checkpoints]
+
+        devices = devices or ['cuda' if torch.cuda.is_available() else 'cpu']
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._jobs = queue.Queue(maxsize=max_queue)
+        self._prepared = queue.Queue(maxsize=max(2, num_workers))
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='separation-reconstruct')
+
+        self._threads = []
+        for device in devices:
+            device = torch.device(device)
+            models = [load_inference_model(path, self.n_mels, self.target_length, device) for path in self.checkpoints]
+            self._threads.append(threading.Thread(target=self._model_worker, args=(device, models), daemon=True, name=f'separation-model-{device}'))
+        for i in range(num_workers):
+            self._threads.append(threading.Thread(target=self._prepare_worker, daemon=True, name=f'separation-prepare-{i}'))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Separation service ready: {len(self.checkpoints)} model(s) warm on {list(devices)}, queue size {max_queue}")
+
+    def submit(self, file_path: str, reconstruction: str = 'griffinlim') -> SeparationJob:
+        if reconstruction not in RECONSTRUCTION_MODES:
+            raise ValueError(f"Unknown reconstruction mode: {reconstruction}. Choose from {RECONSTRUCTION_MODES}")
+        key = result_key(file_sha256(file_path), self.checkpoint_hashes, self.n_mels, self.n_fft,
+                         reconstruction_id(reconstruction, self.griffin_lim_iters))
+        with self._lock:
+            if key in self._inflight:
+                return self._inflight[key]
+            job = SeparationJob(uuid.uuid4().hex, file_path, key, reconstruction)
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Using cached separation of {file_path}")
+                job.complete(cached)
+                return job
+            try:
+                self._jobs.put_nowait(job)
+            except queue.Full:
+                raise RuntimeError(f"The separation queue is full ({self._jobs.maxsize} jobs waiting); try again shortly")
+            self._inflight[key] = job
+        logger.info(f"Queued separation job {job.id} for {file_path} ({self._jobs.qsize()} waiting)")
+        return job
+
+    def separate(self, file_path: str, timeout: float = None) -> List[str]:
+        """Submit file_path and block until its stems are written; returns their paths."""
+        job = self.submit(file_path)
+        if not job.wait(timeout):
+            raise TimeoutError(f"Separation of {file_path} did not finish within {timeout} s")
+        if job.error is not None:
+            raise RuntimeError(job.error)
+        return job.result_paths
+
+    def _fail(self, job: SeparationJob, error: Exception):
+        logger.error(f"Separation job {job.id} failed: {error}", exc_info=True)
+        with self._lock:
+            self._inflight.pop(job.key, None)
+        job.fail(str(error))
+
+    def _prepare_worker(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                job.update(0.05, 'Decoding audio', 'running')
+                audio, sample_rate = read_audio(job.file_path, dtype='float32')
+                job.update(0.15, 'Computing features')
+                audio = mono(audio)
+                chunks, num_frames = separation_features(audio, sample_rate, self.n_mels, self.n_fft, self.target_length)
+                job.update(0.25, 'Waiting for a model worker')
+                self._prepared.put(_Prepared(job, chunks, num_frames, audio, sample_rate))
+            except Exception as e:
+                self._fail(job, e)
+
+    def _collect_batch(self, first: _Prepared) -> List[_Prepared]:
+        batch, size = [first], first.chunks.size(0)
+        deadline = time.monotonic() + self.batch_window
+        while size < self.max_batch_chunks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._prepared.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._prepared.put(None)
+                break
+            batch.append(item)
+            size += item.chunks.size(0)
+        return batch
+
+    def _model_worker(self, device: torch.device, models: List[torch.nn.Module]):
+        while True:
+            first = self._prepared.get()
+            if first is None:
+                self._prepared.put(None)  # let the other model workers see it too
+                return
+            batch = self._collect_batch(first)
+            for item in batch:
+                item.job.update(0.3, f"Separating ({len(batch)} request(s) in this batch)")
+            try:
+                outputs = separate_chunks(models, torch.cat([item.chunks for item in batch]), device, self.max_batch_chunks)
+            except Exception as e:
+                for item in batch:
+                    self._fail(item.job, e)
+                continue
+
+            offset = 0
+            for item in batch:
+                count = item.chunks.size(0)
+                self._executor.submit(self._reconstruct, item, [output[offset:offset + count] for output in outputs])
+                offset += count
+
+    def _reconstruct(self, item: _Prepared, stem_chunks: List[torch.Tensor]):
+        job = item.job
+        staging_dir = self.cache.staging_dir(job.id)
+        try:
+            file_names = []
+            for i, chunks in enumerate(stem_chunks):
+                job.update(0.6 + 0.4 * i / len(stem_chunks), f"Reconstructing stem {i + 1}/{len(stem_chunks)}")
+                audio = reconstruct_audio(chunks, item.num_frames, len(item.mixture), item.sample_rate, self.n_mels, self.n_fft,
+                                          self.griffin_lim_iters, job.reconstruction, item.mixture)
+                file_names.append(f"separated_stem_{i}.wav")
+                write_audio(audio, item.sample_rate, os.path.join(staging_dir, file_names[-1]))
+            result_paths = self.cache.put(job.key, staging_dir, file_names)
+        except Exception as e:
+            self.cache.discard(staging_dir)
+            self._fail(job, e)
+            return
+
+        with self._lock:
+            self._inflight.pop(job.key, None)
+        job.complete(result_paths)
+        logger.info(f"Separation job {job.id} finished in {job.finished - job.submitted:.1f} s")
+
+    def close(self):
+        for _ in range(self._num_workers):
+            self._jobs.put(None)
+        self._prepared.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._executor.shutdown(wait=True)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_separation_service(checkpoint_dir: str, n_mels: int, target_length: int, n_fft: int, num_stems: int = None,
+                           cache_dir: str = './cache', **kwargs) -> SeparationService:
+    """
+    Shared service for the checkpoints in checkpoint_dir, created with warm models on first use.
+
+    Services are keyed by the settings and cache_dir and remember the checkpoint hashes they
+    loaded: when the checkpoints change (e.g. retraining into the same directory) a fresh
+    service replaces the old one, which finishes its queued jobs and shuts down in the
+    background. Raises ValueError if there are no checkpoints.
+    """
+    checkpoints = find_stem_checkpoints(checkpoint_dir, num_stems)
+    if not checkpoints:
+        raise ValueError(f"No checkpoints found in {checkpoint_dir}")
+    key = (os.path.abspath(checkpoint_dir), int(n_mels), int(target_length), int(n_fft), int(num_stems or 0), os.path.abspath(cache_dir))
+    fingerprints = [checkpoint_fingerprint(path) for path in checkpoints]
+    with _services_lock:
+        stale = _services.get(key)
+        if stale is not None and stale.checkpoint_hashes == fingerprints:
+            return stale
+        service = SeparationService(checkpoints, n_mels, target_length, n_fft, os.path.join(cache_dir, 'separations'), **kwargs)
+        _services[key] = service
+    if stale is not None:
+        logger.info(f"Checkpoints in {checkpoint_dir} changed; replacing the separation service")
+        threading.Thread(target=stale.close, daemon=True, name='separation-service-close').start()
+    return service
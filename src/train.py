@@ -2,12 +2,13 @@ import os
 import torch
 import torch.optim as optim
 from multiprocessing import Value, Process
-from model_setup import create_model_and_optimizer, initialize_model
+from model_setup import create_model_and_optimizer
 from training_loop import start_training
 import logging
 from data_preprocessing import preprocess_and_cache_dataset
 from dataset import StemSeparationDataset
 from utils import log_training_parameters, detect_parameters_from_cache, detect_parameters_from_raw_data
+from checkpointing import find_latest_checkpoint, load_checkpoint
 from loss_functions import wasserstein_loss
 import torch.nn as nn
 
@@ -89,65 +90,25 @@ def stop_training_wrapper():
 
 def resume_training(checkpoint_dir, device_str):
     logger.info(f"Resuming training from checkpoint at {checkpoint_dir}")
-    checkpoint_files = [f for f in os.listdir(checkpoint_dir) if f.endswith('.pt')]
-    if not checkpoint_files:
-        return "No checkpoints found in the specified directory."
-
-    latest_checkpoint = max(checkpoint_files, key=lambda x: os.path.getctime(os.path.join(checkpoint_dir, x)))
-    checkpoint_path = os.path.join(checkpoint_dir, latest_checkpoint)
+    checkpoint_path = find_latest_checkpoint(checkpoint_dir)
+    if checkpoint_path is None:
+        return "No resumable checkpoints found in the specified directory."
 
     try:
-        checkpoint = torch.load(checkpoint_path, map_location=device_str)
+        checkpoint = load_checkpoint(checkpoint_path, map_location=device_str)
     except Exception as e:
         logger.error(f"Error loading checkpoint {checkpoint_path}: {e}", exc_info=True)
         return f"Error loading checkpoint: {e}"
 
-    # Assuming the checkpoint contains model and optimizer state
-    model = initialize_model(device_str, checkpoint['n_mels'], checkpoint['target_length'])
-    optimizer = get_optimizer(checkpoint['optimizer_name_g'], model.parameters(), checkpoint['initial_lr_g'], checkpoint['weight_decay'])
-
-    model.load_state_dict(checkpoint['model_state_dict'])
-    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-    epoch = checkpoint['epoch']
+    run_config = checkpoint.get('run_config')
+    if run_config is None:
+        return f"Checkpoint {checkpoint_path} has no run configuration and cannot be resumed."
 
-    start_training(
-        data_dir=checkpoint['data_dir'],
-        val_dir=checkpoint['val_dir'],
-        batch_size=checkpoint['batch_size'],
-        num_epochs=checkpoint['num_epochs'] - epoch,
-        initial_lr_g=checkpoint['initial_lr_g'],
-        initial_lr_d=checkpoint['initial_lr_d'],
-        use_cuda='cuda' in device_str,
-        checkpoint_dir=checkpoint['checkpoint_dir'],
-        save_interval=checkpoint['save_interval'],
-        accumulation_steps=checkpoint['accumulation_steps'],
-        num_stems=checkpoint['num_stems'],
-        num_workers=checkpoint['num_workers'],
-        cache_dir=checkpoint['cache_dir'],
-        loss_function_g=checkpoint['loss_function_g'],
-        loss_function_d=checkpoint['loss_function_d'],
-        optimizer_name_g=checkpoint['optimizer_name_g'],
-        optimizer_name_d=checkpoint['optimizer_name_d'],
-        perceptual_loss_flag=checkpoint['perceptual_loss_flag'],
-        perceptual_loss_weight=checkpoint['perceptual_loss_weight'],
-        clip_value=checkpoint['clip_value'],
-        scheduler_step_size=checkpoint['scheduler_step_size'],
-        scheduler_gamma=checkpoint['scheduler_gamma'],
-        tensorboard_flag=checkpoint['tensorboard_flag'],
-        add_noise=checkpoint['add_noise'],
-        noise_amount=checkpoint['noise_amount'],
-        early_stopping_patience=checkpoint['early_stopping_patience'],
-        disable_early_stopping=checkpoint['disable_early_stopping'],
-        weight_decay=checkpoint['weight_decay'],
-        suppress_warnings=checkpoint['suppress_warnings'],
-        suppress_reading_messages=checkpoint['suppress_reading_messages'],
-        use_cache=checkpoint['use_cache'],
-        channel_multiplier=checkpoint['channel_multiplier'],
-        segments_per_track=checkpoint.get('segments_per_track', 10),
-        stop_flag=stop_flag
-    )
+    run_config = dict(run_config)
+    run_config['use_cuda'] = 'cuda' in device_str
+    start_training(**run_config, stop_flag=stop_flag, resume_from=checkpoint)
 
-    return f"Resumed training from checkpoint: {latest_checkpoint}"
+    return f"Resumed training from checkpoint: {os.path.basename(checkpoint_path)}"
 
 def resume_training_wrapper(checkpoint_dir):
     global training_process
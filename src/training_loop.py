@@ -7,15 +7,18 @@ import os
 from torch.cuda.amp import autocast, GradScaler
 from torch.optim.lr_scheduler import ReduceLROnPlateau
 from typing import Any
-from torchvision.models import vgg16, VGG16_Weights
 from utils import (
     compute_sdr, compute_sir, compute_sar,
-    gradient_penalty, PerceptualLoss, detect_parameters_from_cache, detect_parameters_from_raw_data, 
+    GradientPenaltyScheduler, MetricsAccumulator, detect_parameters_from_cache, detect_parameters_from_raw_data, 
     StemSeparationDataset, collate_fn, log_training_parameters, 
     ensure_dir_exists, get_optimizer, integrated_dynamic_batching, purge_vram, load_from_cache,
     process_and_cache_dataset
 )
 from model_setup import create_model_and_optimizer
+from loss_functions import build_perceptual_loss
+from checkpointing import CheckpointManager, capture_rng_state, restore_rng_state, load_checkpoint
+from audio_io import find_audio_file
+from online_mixing import OnlineMixingSource, find_stem_files
 import time
 
 logger = logging.getLogger(__name__)
@@ -42,8 +45,16 @@ def train_single_stem(
     n_fft: int, 
     target_length: int, 
     stop_flag: torch.Tensor,
-    suppress_reading_messages: bool = False
+    suppress_reading_messages: bool = False,
+    resume_state: dict = None,
+    epoch_callback=None
 ):
+    """
+    Train one stem model and return its best mean validation loss (None if stopped via stop_flag).
+
+    epoch_callback(epoch, mean_val_loss), if given, is called after every validation pass;
+    returning True ends training early (used by hyperparameter search to prune trials).
+    """
     if stem_name == "input":
         logger.info(f"Skipping training for stem: {stem_name} (test input)")
         return
@@ -56,69 +67,160 @@ def train_single_stem(
     model, discriminator, optimizer_g, optimizer_d, scaler_g, scaler_d = create_model_and_optimizer(
         training_params['device_str'], n_mels, target_length,
         training_params['initial_lr_g'], training_params['initial_lr_d'], model_params['optimizer_name_g'],
-        model_params['optimizer_name_d'], training_params['weight_decay']
+        model_params['optimizer_name_d'], training_params['weight_decay'],
+        discriminator_type=training_params.get('discriminator_type', 'patch')
+    )
+
+    penalty_scheduler = GradientPenaltyScheduler(
+        mode=training_params.get('gradient_penalty_mode', 'gp'),
+        weight=training_params.get('gradient_penalty_weight', 1.0),
+        interval=training_params.get('gradient_penalty_interval', 4)
     )
+    penalty_scheduler.prepare(discriminator)
 
     scheduler_g = ReduceLROnPlateau(optimizer_g, mode='min', factor=0.5, patience=10)
     scheduler_d = ReduceLROnPlateau(optimizer_d, mode='min', factor=0.5, patience=10)
 
     early_stopping_counter = 0
     best_val_loss = float('inf')
+    best_mean_val_loss = float('inf')
+
+    perceptual_loss_fn = build_perceptual_loss(
+        model_params['perceptual_loss_flag'], device,
+        cache_dir=os.path.join(dataset.cache_dir, 'perceptual_features') if training_params['use_cache'] else None
+    )
+    if perceptual_loss_fn is not None:
+        logger.info(f"Perceptual loss: {type(perceptual_loss_fn).__name__} (weight {model_params['perceptual_loss_weight']})")
+
+    online_source = None
+    if training_params.get('online_mixing'):
+        online_source = OnlineMixingSource(
+            find_stem_files(dataset.data_dir, dataset.stem_names), stem_name,
+            training_params.get('pcm_store_dir') or os.path.join(dataset.cache_dir, 'pcm'),
+            sample_rate, n_mels, n_fft, target_length, training_params['batch_size'], device,
+            steps_per_epoch=training_params.get('online_mixing_steps', 1000),
+            seed=training_params.get('online_mixing_seed', 0)
+        )
 
-    feature_extractor = vgg16(weights=VGG16_Weights.IMAGENET1K_V1).features.to(device).eval()
-    for param in feature_extractor.parameters():
-        param.requires_grad = False
+    metrics = MetricsAccumulator(device, writer, flush_interval=training_params.get('metrics_flush_interval', 50))
+    val_metrics = MetricsAccumulator(device)
+    global_step = 0
+    start_epoch, start_batch = 0, 0
 
-    for epoch in range(training_params['num_epochs']):
+    checkpoint_manager = CheckpointManager(
+        training_params['checkpoint_dir'], prefix=f'state_stem_{stem_name}',
+        keep_last=training_params.get('keep_last_checkpoints', 3)
+    )
+    checkpoint_interval_steps = training_params.get('checkpoint_interval_steps', 0)
+
+    def training_state(epoch: int, batch_index: int) -> dict:
+        # epoch/batch_index point at the next batch to train on
+        return {
+            'stem_name': stem_name,
+            'epoch': epoch,
+            'batch_index': batch_index,
+            'global_step': global_step,
+            'model_state_dict': model.state_dict(),
+            'discriminator_state_dict': discriminator.state_dict(),
+            'optimizer_g_state_dict': optimizer_g.state_dict(),
+            'optimizer_d_state_dict': optimizer_d.state_dict(),
+            'scaler_g_state_dict': scaler_g.state_dict(),
+            'scaler_d_state_dict': scaler_d.state_dict(),
+            'scheduler_g_state_dict': scheduler_g.state_dict(),
+            'scheduler_d_state_dict': scheduler_d.state_dict(),
+            'penalty_steps': penalty_scheduler.steps,
+            'early_stopping_counter': early_stopping_counter,
+            'best_val_loss': best_val_loss,
+            'best_mean_val_loss': best_mean_val_loss,
+            'rng_state': capture_rng_state(),
+            'sample_rate': sample_rate,
+            'n_mels': n_mels,
+            'n_fft': n_fft,
+            'target_length': target_length,
+            'run_config': training_params.get('run_config'),
+        }
+
+    if resume_state is not None:
+        model.load_state_dict(resume_state['model_state_dict'])
+        discriminator.load_state_dict(resume_state['discriminator_state_dict'])
+        optimizer_g.load_state_dict(resume_state['optimizer_g_state_dict'])
+        optimizer_d.load_state_dict(resume_state['optimizer_d_state_dict'])
+        scaler_g.load_state_dict(resume_state['scaler_g_state_dict'])
+        scaler_d.load_state_dict(resume_state['scaler_d_state_dict'])
+        scheduler_g.load_state_dict(resume_state['scheduler_g_state_dict'])
+        scheduler_d.load_state_dict(resume_state['scheduler_d_state_dict'])
+        penalty_scheduler.steps = resume_state['penalty_steps']
+        early_stopping_counter = resume_state['early_stopping_counter']
+        best_val_loss = resume_state['best_val_loss']
+        best_mean_val_loss = resume_state.get('best_mean_val_loss', float('inf'))
+        global_step = resume_state['global_step']
+        start_epoch, start_batch = resume_state['epoch'], resume_state['batch_index']
+        restore_rng_state(resume_state['rng_state'])
+        logger.info(f"Resuming stem {stem_name} at epoch {start_epoch + 1}, batch {start_batch} (step {global_step})")
+
+    for epoch in range(start_epoch, training_params['num_epochs']):
         if stop_flag.value == 1:
             logger.info("Training stopped.")
+            checkpoint_manager.close()
             return
 
         logger.info(f"Epoch {epoch+1}/{training_params['num_epochs']} started.")
         model.train()
         discriminator.train()
-        running_loss_g = 0.0
-        running_loss_d = 0.0
+        metrics.reset_epoch()
 
         optimizer_g.zero_grad(set_to_none=True)
         optimizer_d.zero_grad(set_to_none=True)
 
-        for i, batch in enumerate(integrated_dynamic_batching(dataset.data_dir, dataset.cache_dir, dataset.n_mels, dataset.n_fft, dataset.target_length, training_params['batch_size'], device, stem_name, dataset.file_ids, shuffle=False)):
+        if online_source is not None:
+            train_batches = online_source.epoch(epoch)
+        else:
+            train_batches = integrated_dynamic_batching(dataset.data_dir, dataset.cache_dir, dataset.n_mels, dataset.n_fft, dataset.target_length, training_params['batch_size'], device, stem_name, dataset.file_ids, shuffle=False)
+
+        for i, batch in enumerate(train_batches):
+            if epoch == start_epoch and i < start_batch:
+                continue  # already trained on before the checkpoint we resumed from
+
             if stop_flag.value == 1:
                 logger.info("Training stopped.")
+                checkpoint_manager.close()
                 return
 
-            try:
-                identifier = batch['file_paths'][0]
-                input_cache_file_name = f"input_{identifier}_{dataset.n_mels}_{dataset.target_length}_{dataset.n_fft}.h5"
-                target_cache_file_name = f"{stem_name}_{identifier}_{dataset.n_mels}_{dataset.target_length}_{dataset.n_fft}.h5"
-                input_cache_file_path = os.path.join(dataset.cache_dir, input_cache_file_name)
-                target_cache_file_path = os.path.join(dataset.cache_dir, target_cache_file_name)
-
-                if os.path.exists(input_cache_file_path) and os.path.exists(target_cache_file_path):
-                    logger.info(f"Cache files found for {identifier}. Skipping processing.")
-                else:
-                    logger.warning(f"Cache files not found for {identifier}. Processing now.")
-                    input_file_path = os.path.join(dataset.data_dir, f'example_{identifier}.ogg')
-                    dataset.process_and_cache_file(input_file_path, identifier, "input")
-
-                    target_file_path = os.path.join(dataset.data_dir, f'{stem_name}_{identifier}.ogg')
-                    dataset.process_and_cache_file(target_file_path, identifier, stem_name)
-
-                data = load_from_cache(input_cache_file_path, device)
-                inputs, zero_durations = data['input'], data['zero_durations']
-                targets = load_from_cache(target_cache_file_path, device)['input']
-
-                # Reassemble the data with zero gaps
-                inputs = reassemble_with_zero_gaps(inputs, zero_durations, segment_length=87)
-                targets = reassemble_with_zero_gaps(targets, zero_durations, segment_length=87)
-
-            except KeyError as e:
-                logger.error(f"Batch missing 'file_paths' key: {e}")
-                continue
-            except Exception as e:
-                logger.error(f"Error loading data for {identifier}: {e}")
-                continue
+            if batch.get('online'):
+                # mixed and featurized on the fly by OnlineMixingSource; nothing to load from the cache
+                inputs, targets, target_cache_file_name = batch['input'], batch['target'], None
+            else:
+                try:
+                    identifier = batch['file_paths'][0]
+                    input_cache_file_name = f"input_{identifier}_{dataset.n_mels}_{dataset.target_length}_{dataset.n_fft}.h5"
+                    target_cache_file_name = f"{stem_name}_{identifier}_{dataset.n_mels}_{dataset.target_length}_{dataset.n_fft}.h5"
+                    input_cache_file_path = os.path.join(dataset.cache_dir, input_cache_file_name)
+                    target_cache_file_path = os.path.join(dataset.cache_dir, target_cache_file_name)
+
+                    if os.path.exists(input_cache_file_path) and os.path.exists(target_cache_file_path):
+                        logger.info(f"Cache files found for {identifier}. Skipping processing.")
+                    else:
+                        logger.warning(f"Cache files not found for {identifier}. Processing now.")
+                        input_file_path = find_audio_file(dataset.data_dir, f'example_{identifier}')
+                        dataset.process_and_cache_file(input_file_path, identifier, "input")
+
+                        target_file_path = find_audio_file(dataset.data_dir, f'{stem_name}_{identifier}')
+                        dataset.process_and_cache_file(target_file_path, identifier, stem_name)
+
+                    data = load_from_cache(input_cache_file_path, device)
+                    inputs, zero_durations = data['input'], data['zero_durations']
+                    targets = load_from_cache(target_cache_file_path, device)['input']
+
+                    # Reassemble the data with zero gaps
+                    inputs = reassemble_with_zero_gaps(inputs, zero_durations, segment_length=87)
+                    targets = reassemble_with_zero_gaps(targets, zero_durations, segment_length=87)
+
+                except KeyError as e:
+                    logger.error(f"Batch missing 'file_paths' key: {e}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Error loading data for {identifier}: {e}")
+                    continue
 
             if not isinstance(inputs, torch.Tensor):
                 logger.error(f"Expected inputs to be a tensor, but got {type(inputs)} instead.")
@@ -128,8 +230,9 @@ def train_single_stem(
                 outputs = model(inputs)
                 loss_g = model_params['loss_function_g'](outputs, targets)
 
-                if model_params['perceptual_loss_flag'] and (i % 5 == 0):
-                    perceptual_loss = model_params['perceptual_loss_weight'] * PerceptualLoss(feature_extractor)(outputs, targets)
+                if perceptual_loss_fn is not None and (i % 5 == 0):
+                    perceptual_key = os.path.splitext(target_cache_file_name)[0] if target_cache_file_name else None
+                    perceptual_loss = model_params['perceptual_loss_weight'] * perceptual_loss_fn(targets, outputs, key=perceptual_key)
                     loss_g += perceptual_loss
 
             scaler_g.scale(loss_g).backward()
@@ -145,10 +248,11 @@ def train_single_stem(
 
                     loss_d_real = model_params['loss_function_d'](real_out, torch.ones_like(real_out) * training_params['label_smoothing_real'])
                     loss_d_fake = model_params['loss_function_d'](fake_out, torch.zeros_like(fake_out) * training_params['label_smoothing_fake'])
-                    gp = gradient_penalty(discriminator, targets, outputs.detach(), device)
+                    gp = penalty_scheduler(discriminator, targets, outputs.detach())
                     loss_d = (loss_d_real + loss_d_fake) / 2 + gp
 
                 scaler_d.scale(loss_d).backward()
+                metrics.add('Loss/Discriminator', loss_d)
 
             if (i + 1) % training_params['accumulation_steps'] == 0:
                 scaler_g.step(optimizer_g)
@@ -158,14 +262,22 @@ def train_single_stem(
                 optimizer_g.zero_grad(set_to_none=True)
                 optimizer_d.zero_grad(set_to_none=True)
 
-            running_loss_g += loss_g.item()
-            running_loss_d += loss_d.item() if 'loss_d' in locals() else 0
+            metrics.add('Loss/Generator', loss_g)
+            global_step += 1
+            metrics.step(global_step, samples=inputs.size(0), frames=inputs.size(0) * inputs.size(-1))
+
+            if checkpoint_interval_steps and global_step % checkpoint_interval_steps == 0:
+                checkpoint_manager.save(training_state(epoch, i + 1), global_step)
 
             if (i + 1) % 100 == 0:
                 purge_vram()
 
+        metrics.flush(global_step)
+        epoch_means = metrics.means()
+        logger.info(f"Epoch {epoch+1} training losses: " + ", ".join(f"{name} {value:.4f}" for name, value in epoch_means.items()))
+
         model.eval()
-        val_loss = 0.0
+        val_metrics.reset_epoch()
         with torch.no_grad():
             for batch in integrated_dynamic_batching(val_dataset.data_dir, val_dataset.cache_dir, val_dataset.n_mels, val_dataset.n_fft, val_dataset.target_length, training_params['batch_size'], device, stem_name, val_dataset.file_ids, shuffle=False):
                 try:
@@ -179,10 +291,10 @@ def train_single_stem(
                         logger.info(f"Cache files found for {identifier}. Skipping processing.")
                     else:
                         logger.warning(f"Cache files not found for {identifier}. Processing now.")
-                        input_file_path = os.path.join(dataset.data_dir, f'example_{identifier}.ogg')
+                        input_file_path = find_audio_file(dataset.data_dir, f'example_{identifier}')
                         dataset.process_and_cache_file(input_file_path, identifier, "input")
 
-                        target_file_path = os.path.join(dataset.data_dir, f'{stem_name}_{identifier}.ogg')
+                        target_file_path = find_audio_file(dataset.data_dir, f'{stem_name}_{identifier}')
                         dataset.process_and_cache_file(target_file_path, identifier, stem_name)
 
                     data = load_from_cache(input_cache_file_path, device)
@@ -208,8 +320,10 @@ def train_single_stem(
                     outputs = model(inputs)
                     loss = model_params['loss_function_g'](outputs, targets)
                 
-                val_loss += loss.item()
+                val_metrics.add('Loss/Validation', loss)
 
+        val_loss = val_metrics.totals().get('Loss/Validation', 0.0)
+        mean_val_loss = val_metrics.means().get('Loss/Validation', float('inf'))
         if model_params['tensorboard_flag']:
             writer.add_scalar('Loss/Validation', val_loss / len(val_dataset), epoch + 1)
 
@@ -218,18 +332,22 @@ def train_single_stem(
             early_stopping_counter = 0
         else:
             early_stopping_counter += 1
+        best_mean_val_loss = min(best_mean_val_loss, mean_val_loss)
+
+        if epoch_callback is not None and epoch_callback(epoch, mean_val_loss):
+            logger.info(f"Training of stem {stem_name} stopped by callback after epoch {epoch+1}.")
+            break
 
         if early_stopping_counter >= training_params['early_stopping_patience']:
             logger.info('Early stopping triggered.')
             break
 
         if (epoch + 1) % training_params['save_interval'] == 0:
-            checkpoint_path = os.path.join(training_params['checkpoint_dir'], f'checkpoint_stem_{stem_name}_epoch_{epoch+1}.pt')
-            torch.save(model.state_dict(), checkpoint_path)
-            logger.info(f'Saved checkpoint: {checkpoint_path}')
+            checkpoint_manager.save(training_state(epoch + 1, 0), global_step)
 
         purge_vram()
 
+    checkpoint_manager.close()
     final_model_path = f"{training_params['checkpoint_dir']}/model_final_stem_{stem_name}.pt"
     torch.save(model.state_dict(), final_model_path)
     logger.info(f"Training completed for stem {stem_name}. Final model saved at {final_model_path}")
@@ -237,6 +355,47 @@ def train_single_stem(
     if model_params['tensorboard_flag']:
         writer.close()
 
+    return best_mean_val_loss
+
+def prepare_datasets(
+    data_dir: str, val_dir: str, cache_dir: str, device: torch.device, suppress_reading_messages: bool = False,
+    segments_per_track: int = 10, pcm_store_dir: str = None
+):
+    """Detect audio parameters (building the feature cache on first use) and open the training and validation datasets."""
+    try:
+        sample_rate, n_mels, n_fft = detect_parameters_from_cache(cache_dir)
+    except ValueError:
+        sample_rate, n_mels, n_fft = detect_parameters_from_raw_data(data_dir, pcm_store_dir=pcm_store_dir)
+        process_and_cache_dataset(
+            data_dir=data_dir,
+            cache_dir=cache_dir,
+            n_mels=n_mels,
+            n_fft=n_fft,
+            device=device,
+            suppress_reading_messages=suppress_reading_messages,
+            pcm_store_dir=pcm_store_dir
+        )
+        sample_rate, n_mels, n_fft = detect_parameters_from_cache(cache_dir)
+
+    target_length = sample_rate // 2
+
+    datasets = [
+        StemSeparationDataset(
+            data_dir=directory,
+            n_mels=n_mels,
+            target_length=target_length,
+            n_fft=n_fft,
+            cache_dir=cache_dir,
+            suppress_reading_messages=suppress_reading_messages,
+            device=device,
+            use_cache=True,
+            segments_per_track=segments_per_track,
+            pcm_store_dir=pcm_store_dir
+        )
+        for directory in (data_dir, val_dir)
+    ]
+    return sample_rate, n_mels, n_fft, target_length, datasets[0], datasets[1]
+
 def start_training(
     data_dir: str, val_dir: str, batch_size: int, num_epochs: int, initial_lr_g: float, initial_lr_d: float, 
     use_cuda: bool, checkpoint_dir: str, save_interval: int, accumulation_steps: int, num_stems: int, 
@@ -246,8 +405,14 @@ def start_training(
     add_noise: bool, noise_amount: float, early_stopping_patience: int, 
     disable_early_stopping: bool, weight_decay: float, suppress_warnings: bool, suppress_reading_messages: bool, 
     discriminator_update_interval: int, label_smoothing_real: float, label_smoothing_fake: float, 
-    suppress_detailed_logs: bool, stop_flag: torch.Tensor, use_cache: bool, channel_multiplier: float, segments_per_track: int = 10
+    suppress_detailed_logs: bool, stop_flag: torch.Tensor, use_cache: bool, channel_multiplier: float, segments_per_track: int = 10,
+    metrics_flush_interval: int = 50, gradient_penalty_mode: str = 'gp', gradient_penalty_weight: float = 1.0,
+    gradient_penalty_interval: int = 4, discriminator_type: str = 'patch', checkpoint_interval_steps: int = 0,
+    keep_last_checkpoints: int = 3, resume_from=None, pcm_store_dir: str = None, online_mixing: bool = False,
+    online_mixing_steps: int = 1000, online_mixing_seed: int = 0
 ):
+    # everything needed to restart this run from a checkpoint (see train.resume_training)
+    run_config = {key: value for key, value in locals().items() if key not in ('stop_flag', 'resume_from')}
     device = torch.device('cuda' if use_cuda and torch.cuda.is_available() else 'cpu')
     training_params = {
         'device_str': str(device),
@@ -275,7 +440,19 @@ def start_training(
         'label_smoothing_fake': label_smoothing_fake,
         'suppress_detailed_logs': suppress_detailed_logs,
         'segments_per_track': segments_per_track,
-        'use_cache': use_cache
+        'use_cache': use_cache,
+        'metrics_flush_interval': metrics_flush_interval,
+        'gradient_penalty_mode': gradient_penalty_mode,
+        'gradient_penalty_weight': gradient_penalty_weight,
+        'gradient_penalty_interval': gradient_penalty_interval,
+        'discriminator_type': discriminator_type,
+        'checkpoint_interval_steps': checkpoint_interval_steps,
+        'keep_last_checkpoints': keep_last_checkpoints,
+        'pcm_store_dir': pcm_store_dir,
+        'online_mixing': online_mixing,
+        'online_mixing_steps': online_mixing_steps,
+        'online_mixing_seed': online_mixing_seed,
+        'run_config': run_config
     }
     model_params = {
         'optimizer_name_g': optimizer_name_g,
@@ -291,46 +468,17 @@ def start_training(
 
     log_training_parameters(training_params)
 
-    try:
-        sample_rate, n_mels, n_fft = detect_parameters_from_cache(cache_dir)
-    except ValueError:
-        sample_rate, n_mels, n_fft = detect_parameters_from_raw_data(data_dir)
-        process_and_cache_dataset(
-            data_dir=data_dir,
-            cache_dir=cache_dir,
-            n_mels=n_mels,
-            n_fft=n_fft,
-            device=device,
-            suppress_reading_messages=suppress_reading_messages
-        )
-        sample_rate, n_mels, n_fft = detect_parameters_from_cache(cache_dir)
-
-    target_length = sample_rate // 2
-
-    train_dataset = StemSeparationDataset(
-        data_dir=data_dir,
-        n_mels=n_mels,
-        target_length=target_length,
-        n_fft=n_fft,
-        cache_dir=cache_dir,
-        suppress_reading_messages=suppress_reading_messages,
-        device=device,
-        use_cache=True,
-        segments_per_track=segments_per_track
-    )
-    val_dataset = StemSeparationDataset(
-        data_dir=val_dir,
-        n_mels=n_mels,
-        target_length=target_length,
-        n_fft=n_fft,
-        cache_dir=cache_dir,
-        suppress_reading_messages=suppress_reading_messages,
-        device=device,
-        use_cache=True,
-        segments_per_track=segments_per_track
+    sample_rate, n_mels, n_fft, target_length, train_dataset, val_dataset = prepare_datasets(
+        data_dir, val_dir, cache_dir, device, suppress_reading_messages, segments_per_track, pcm_store_dir
     )
 
-    for stem_name in ['vocals', 'drums', 'bass', 'kick', 'keys', 'guitar']:
+    # resume_from: path of a full-state checkpoint or an already loaded one
+    resume_state = load_checkpoint(resume_from, map_location=device) if isinstance(resume_from, str) else resume_from
+    stems = ['vocals', 'drums', 'bass', 'kick', 'keys', 'guitar']
+    if resume_state is not None:
+        stems = stems[stems.index(resume_state['stem_name']):]
+
+    for stem_name in stems:
         if stop_flag.value == 1:
             logger.info("Training stopped.")
             return
@@ -342,8 +490,10 @@ def start_training(
 
         train_single_stem(
             stem_name, train_dataset, val_dataset, training_params, model_params, 
-            sample_rate, n_mels, n_fft, target_length, stop_flag, suppress_reading_messages
+            sample_rate, n_mels, n_fft, target_length, stop_flag, suppress_reading_messages,
+            resume_state=resume_state if resume_state is not None and resume_state['stem_name'] == stem_name else None
         )
+        resume_state = None
 
         end_time = time.time()
         epoch_duration = end_time - start_time
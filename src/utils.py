@@ -2,17 +2,19 @@ import os
 import torch
 import torch.nn.functional as F
 import logging
-import soundfile as sf
 import h5py
 import numpy as np
 import librosa
 from typing import Dict, Tuple, Union, List, Any
+from collections import OrderedDict, deque
+import time
 from torch.utils.data import Dataset, DataLoader
 import torchaudio
 import torchaudio.transforms as T
 import torch.optim as optim
 import torch.nn as nn
-from pydub import AudioSegment
+from audio_io import AUDIO_EXTENSIONS, read_audio, audio_info, find_audio_file
+from pcm_store import open_pcm_store
 
 logger = logging.getLogger(__name__)
 
@@ -41,15 +43,16 @@ def detect_parameters_from_cache(cache_dir: str, default_n_mels: int = 32, defau
     n_fft = min(default_n_fft, int(avg_sample_rate * 0.025))
     return avg_sample_rate, n_mels, n_fft
 
-def detect_parameters_from_raw_data(data_dir: str, default_n_mels: int = 32, default_n_fft: int = 1024) -> Tuple[int, int, int]:
+def detect_parameters_from_raw_data(data_dir: str, default_n_mels: int = 32, default_n_fft: int = 1024, pcm_store_dir: str = None) -> Tuple[int, int, int]:
+    pcm_store = open_pcm_store(pcm_store_dir) if pcm_store_dir else None
     sample_rates = []
     for root, _, files in os.walk(data_dir):
         for file_name in files:
-            if file_name.endswith('.ogg'):
+            if file_name.endswith(AUDIO_EXTENSIONS):
                 file_path = os.path.join(root, file_name)
                 try:
-                    info = sf.info(file_path)
-                    sample_rates.append(info.samplerate)
+                    entry = pcm_store.entry(file_path) if pcm_store else None
+                    sample_rates.append(entry['source_sample_rate'] if entry else audio_info(file_path)['sample_rate'])
                 except Exception as e:
                     logger.error(f"Error analyzing audio file {file_path}: {e}")
 
@@ -87,7 +90,8 @@ class StemSeparationDataset(Dataset):
         self, data_dir: str, n_mels: int, target_length: int, n_fft: int, cache_dir: str,
         device: torch.device, suppress_warnings: bool = False,
         suppress_reading_messages: bool = False, num_workers: int = 1, stem_names: List[str] = None,
-        stop_flag: Any = None, use_cache: bool = True, device_prep: torch.device = None, segments_per_track: int = 10
+        stop_flag: Any = None, use_cache: bool = True, device_prep: torch.device = None, segments_per_track: int = 10,
+        pcm_store_dir: str = None
     ):
         self.data_dir = data_dir
         self.n_mels = n_mels
@@ -107,7 +111,9 @@ class StemSeparationDataset(Dataset):
         try:
             self.sample_rate, _, _ = detect_parameters_from_cache(cache_dir)
         except ValueError:
-            self.sample_rate, _, _ = detect_parameters_from_raw_data(data_dir)
+            self.sample_rate, _, _ = detect_parameters_from_raw_data(data_dir, pcm_store_dir=pcm_store_dir)
+        # decoded, resampled PCM shared by every reader of the same source files
+        self.pcm_store = open_pcm_store(pcm_store_dir, self.sample_rate) if pcm_store_dir else None
 
         self.mel_spectrogram = T.MelSpectrogram(
             sample_rate=self.sample_rate, n_fft=n_fft, n_mels=n_mels,
@@ -122,10 +128,10 @@ class StemSeparationDataset(Dataset):
     def _get_file_ids(self):
         file_ids = []
         for input_file in os.listdir(self.data_dir):
-            if input_file.startswith('example_') and input_file.endswith('.ogg'):
-                identifier = input_file.split('_')[1].split('.')[0]
+            if input_file.startswith('example_') and input_file.endswith(AUDIO_EXTENSIONS):
+                identifier, extension = os.path.splitext(input_file[len('example_'):])
                 target_files = {
-                    stem: f"{stem}_{identifier}.ogg" for stem in self.stem_names
+                    stem: f"{stem}_{identifier}{extension}" for stem in self.stem_names
                 }
                 file_ids.append({
                     'identifier': identifier,
@@ -146,9 +152,13 @@ class StemSeparationDataset(Dataset):
                 return torch.from_numpy(f['audio'][:]).to(self.device)
 
         logger.info(f"Processing file: {file_path}")
-        data, sr = sf.read(file_path)
-        if data.ndim == 2:
-            data = data.mean(axis=1)
+        if self.pcm_store is not None:
+            data, sr = self.pcm_store.read(file_path, mono=True)
+            data = np.asarray(data, dtype=np.float64)
+        else:
+            data, sr = read_audio(file_path, dtype='float64')
+            if data.ndim == 2:
+                data = data.mean(axis=1)
         if sr != self.sample_rate:
             data = librosa.resample(data, orig_sr=sr, target_sr=self.sample_rate)
 
@@ -261,7 +271,7 @@ def log_tensor_dimensions(tensor: torch.Tensor, message: str):
 
 def process_and_cache_dataset(
     data_dir: str, cache_dir: str, n_mels: int, n_fft: int,
-    device: torch.device, suppress_reading_messages: bool
+    device: torch.device, suppress_reading_messages: bool, pcm_store_dir: str = None
 ):
     dataset = StemSeparationDataset(
         data_dir=data_dir,
@@ -272,9 +282,18 @@ def process_and_cache_dataset(
         suppress_reading_messages=suppress_reading_messages,
         device=device,
         use_cache=True,
-        segments_per_track=10
+        segments_per_track=10,
+        pcm_store_dir=pcm_store_dir
     )
 
+    if dataset.pcm_store is not None:
+        # decode and resample every source once, in parallel, before the sequential feature pass
+        dataset.pcm_store.ingest_all([
+            os.path.join(data_dir, name) for file_id in dataset.file_ids
+            for name in [file_id['input_file'], *file_id['target_files'].values()]
+            if os.path.exists(os.path.join(data_dir, name))
+        ])
+
     for i in range(len(dataset)):
         file_id = dataset.file_ids[i]
         if file_id is not None:
@@ -325,10 +344,10 @@ def integrated_dynamic_batching(data_dir: str, cache_dir: str, n_mels: int, n_ff
                 logger.info(f"Cache files found for {identifier}. Skipping processing.")
             else:
                 logger.warning(f"Cache files not found for {identifier}. Processing now.")
-                input_file_path = os.path.join(data_dir, f'example_{identifier}.ogg')
+                input_file_path = find_audio_file(data_dir, f'example_{identifier}')
                 process_and_cache_file(input_file_path, identifier, "input")
 
-                target_file_path = os.path.join(data_dir, f'{stem_name}_{identifier}.ogg')
+                target_file_path = find_audio_file(data_dir, f'{stem_name}_{identifier}')
                 process_and_cache_file(target_file_path, identifier, stem_name)
 
             data = load_from_cache(input_cache_file_path, device)
@@ -363,9 +382,13 @@ def compute_sar(true: torch.Tensor, pred: torch.Tensor) -> torch.Tensor:
     sar = 10 * torch.log10(s_noise / (s_artif + 1e-8))
     return sar
 
+def _per_sample_uniform(reference: torch.Tensor) -> torch.Tensor:
+    # one U(0, 1) draw per sample, generated directly on the reference device
+    return torch.rand((reference.size(0),) + (1,) * (reference.dim() - 1), device=reference.device, dtype=reference.dtype)
+
 def gradient_penalty(discriminator: nn.Module, real_data: torch.Tensor, fake_data: torch.Tensor, device: torch.device, lambda_gp: float = 10) -> torch.Tensor:
     batch_size = real_data.size(0)
-    alpha = torch.rand(batch_size, 1, 1, 1).to(device)
+    alpha = _per_sample_uniform(real_data)
     interpolated = alpha * real_data + ((1 - alpha) * fake_data)
     interpolated.requires_grad_(True)
 
@@ -378,25 +401,291 @@ def gradient_penalty(discriminator: nn.Module, real_data: torch.Tensor, fake_dat
         retain_graph=True
     )[0]
 
-    gradients = gradients.view(batch_size, -1)
+    gradients = gradients.reshape(batch_size, -1)
     gradient_norm = gradients.norm(2, dim=1)
     penalty = ((gradient_norm - 1) ** 2).mean()
     return penalty
 
+def r1_penalty(discriminator: nn.Module, real_data: torch.Tensor) -> torch.Tensor:
+    """R1 regularizer: mean squared gradient norm of D at the real samples."""
+    real_data = real_data.detach().requires_grad_(True)
+    d_real = discriminator(real_data)
+    gradients = torch.autograd.grad(outputs=d_real.sum(), inputs=real_data, create_graph=True)[0]
+    return gradients.reshape(real_data.size(0), -1).pow(2).sum(dim=1).mean()
+
+def finite_difference_penalty(discriminator: nn.Module, real_data: torch.Tensor, fake_data: torch.Tensor, epsilon: float = 1e-2) -> torch.Tensor:
+    """
+    Double-backward-free Lipschitz penalty.
+
+    Estimates the directional derivative of D along the real-fake direction (the direction
+    the WGAN-GP gradient is expected to follow) at a random interpolate with a central
+    difference, and penalizes slopes above 1. Costs two extra D forwards and an ordinary backward.
+    """
+    batch_size = real_data.size(0)
+    real_data, fake_data = real_data.detach(), fake_data.detach()
+    alpha = _per_sample_uniform(real_data)
+    interpolated = alpha * real_data + (1 - alpha) * fake_data
+    direction = (real_data - fake_data).reshape(batch_size, -1)
+    direction = (direction / direction.norm(dim=1, keepdim=True).clamp_min(1e-12)).view_as(real_data)
+
+    d_plus = discriminator(interpolated + epsilon * direction).reshape(batch_size, -1).mean(dim=1)
+    d_minus = discriminator(interpolated - epsilon * direction).reshape(batch_size, -1).mean(dim=1)
+    slope = (d_plus - d_minus).abs() / (2 * epsilon)
+    return F.relu(slope - 1).pow(2).mean()
+
+def apply_spectral_norm(module: nn.Module) -> nn.Module:
+    """Wrap every Conv/Linear weight of module in spectral normalization (in place)."""
+    for child in module.modules():
+        if isinstance(child, (nn.Conv1d, nn.Conv2d, nn.Linear)) and not nn.utils.parametrize.is_parametrized(child, 'weight'):
+            nn.utils.parametrizations.spectral_norm(child)
+    return module
+
+class GradientPenaltyScheduler:
+    """
+    Discriminator regularization for the GAN path.
+
+    mode:
+        'gp'                WGAN-GP on real/fake interpolates (double backward)
+        'r1'                R1 on real samples (double backward)
+        'finite_difference' Lipschitz penalty by central differences, no double backward
+        'spectral_norm'     spectral normalization of D's weights, no penalty term
+        'none'              no regularization
+    Penalties are lazy: they are evaluated on every interval-th discriminator step and
+    multiplied by interval so the expected regularization strength is unchanged.
+    """
+    MODES = ('gp', 'r1', 'finite_difference', 'spectral_norm', 'none')
+
+    def __init__(self, mode: str = 'gp', weight: float = 1.0, interval: int = 4, epsilon: float = 1e-2):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown gradient penalty mode: {mode}. Expected one of {self.MODES}")
+        self.mode = mode
+        self.weight = weight
+        self.interval = max(1, int(interval))
+        self.epsilon = epsilon
+        self.steps = 0
+
+    def prepare(self, discriminator: nn.Module) -> nn.Module:
+        if self.mode == 'spectral_norm':
+            apply_spectral_norm(discriminator)
+        return discriminator
+
+    def __call__(self, discriminator: nn.Module, real_data: torch.Tensor, fake_data: torch.Tensor) -> Union[torch.Tensor, float]:
+        self.steps += 1
+        if self.mode in ('spectral_norm', 'none') or self.weight == 0 or (self.steps - 1) % self.interval != 0:
+            return 0.0
+        if self.mode == 'gp':
+            penalty = gradient_penalty(discriminator, real_data, fake_data.detach(), real_data.device)
+        elif self.mode == 'r1':
+            penalty = 0.5 * r1_penalty(discriminator, real_data)
+        else:
+            penalty = finite_difference_penalty(discriminator, real_data, fake_data, epsilon=self.epsilon)
+        return self.weight * self.interval * penalty
+
+# relu1_2, relu2_2, relu3_3, relu4_3 of torchvision's vgg16().features
+VGG16_PERCEPTUAL_LAYERS = {3: 1.0, 8: 1.0, 15: 1.0, 22: 1.0}
+
+class PerceptualFeatureCache:
+    """
+    LRU cache of target-side perceptual feature maps, keyed by segment.
+
+    Entries are kept on the device they were computed on, up to max_bytes, and
+    optionally mirrored to cache_dir so later stems/runs skip the target forward
+    pass entirely. Features are stored in dtype (float16 by default, None keeps
+    the original precision).
+    """
+    def __init__(self, cache_dir: str = None, max_bytes: int = 1024 ** 3, dtype: torch.dtype = torch.float16):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self._entries = OrderedDict()
+        self._bytes = 0
+        if cache_dir is not None:
+            ensure_dir_exists(cache_dir)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pt")
+
+    @staticmethod
+    def _nbytes(features: List[torch.Tensor]) -> int:
+        return sum(f.numel() * f.element_size() for f in features)
+
+    def _remember(self, key: str, features: List[torch.Tensor]):
+        if key in self._entries:
+            self._bytes -= self._nbytes(self._entries.pop(key))
+        self._entries[key] = features
+        self._bytes += self._nbytes(features)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._nbytes(evicted)
+
+    def get(self, key: str, device: torch.device) -> Union[List[torch.Tensor], None]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            try:
+                features = torch.load(self._path(key), map_location=device)
+            except Exception as e:
+                logger.warning(f"Discarding unreadable perceptual feature cache {self._path(key)}: {e}")
+                return None
+            self._remember(key, features)
+            return features
+        return None
+
+    def put(self, key: str, features: List[torch.Tensor]):
+        features = [f.detach().to(self.dtype) if self.dtype is not None else f.detach() for f in features]
+        self._remember(key, features)
+        if self.cache_dir is not None and not os.path.exists(self._path(key)):
+            try:
+                torch.save([f.cpu() for f in features], self._path(key))
+            except Exception as e:
+                logger.warning(f"Could not write perceptual feature cache {self._path(key)}: {e}")
+
 class PerceptualLoss(nn.Module):
-    def __init__(self, feature_extractor: nn.Module, layer_weights: List[float] = None):
+    """
+    Weighted L1 distance between intermediate feature maps of a frozen nn.Sequential extractor.
+
+    Only the layers in layer_weights (module index -> weight) are tapped and the
+    extractor is truncated after the deepest one. When a feature_cache is given and
+    forward() is called with a key, target features are computed once under
+    no_grad and reused, so each call costs one extractor pass on y_pred.
+    """
+    def __init__(self, feature_extractor: nn.Module, layer_weights: Union[Dict[int, float], List[float]] = None,
+                 feature_cache: PerceptualFeatureCache = None):
         super(PerceptualLoss, self).__init__()
-        self.feature_extractor = feature_extractor
-        self.layer_weights = layer_weights if layer_weights is not None else [1.0] * len(self.feature_extractor)
+        if layer_weights is None:
+            layer_weights = VGG16_PERCEPTUAL_LAYERS
+        elif not isinstance(layer_weights, dict):
+            layer_weights = dict(enumerate(layer_weights))
+        self.layer_weights = {index: weight for index, weight in sorted(layer_weights.items()) if weight != 0}
+        if not self.layer_weights:
+            raise ValueError("PerceptualLoss needs at least one layer with a non-zero weight")
+
+        self.feature_extractor = feature_extractor[:max(self.layer_weights) + 1]
+        for index, layer in enumerate(self.feature_extractor):
+            # an in-place op right after a tapped layer would overwrite the tapped features
+            if index - 1 in self.layer_weights and getattr(layer, 'inplace', False):
+                layer.inplace = False
+        self.feature_cache = feature_cache
+        self.cache_tag = "L" + "-".join(str(index) for index in self.layer_weights)
+
+    def extract(self, x: torch.Tensor) -> List[torch.Tensor]:
+        features = []
+        for index, layer in enumerate(self.feature_extractor):
+            x = layer(x)
+            if index in self.layer_weights:
+                features.append(x)
+        return features
+
+    def forward(self, y_true: torch.Tensor, y_pred: torch.Tensor, key: str = None) -> torch.Tensor:
+        use_cache = key is not None and self.feature_cache is not None
+        cache_key = f"{key}_{self.cache_tag}" if use_cache else None
+
+        features_pred = self.extract(y_pred)
+        features_true = self.feature_cache.get(cache_key, y_pred.device) if use_cache else None
+        if features_true is None or any(t.shape != p.shape for t, p in zip(features_true, features_pred)):
+            with torch.no_grad():
+                features_true = self.extract(y_true)
+            if use_cache:
+                self.feature_cache.put(cache_key, features_true)
 
-    def forward(self, y_true: torch.Tensor, y_pred: torch.Tensor) -> torch.Tensor:
         loss = 0.0
-        features_true = self.feature_extractor(y_true)
-        features_pred = self.feature_extractor(y_pred)
-        for weight, feature_true, feature_pred in zip(self.layer_weights, features_true, features_pred):
-            loss += weight * F.l1_loss(feature_true, feature_pred)
+        for weight, feature_true, feature_pred in zip(self.layer_weights.values(), features_true, features_pred):
+            loss += weight * F.l1_loss(feature_pred, feature_true.to(feature_pred.dtype))
         return loss
 
+class MetricsAccumulator:
+    """
+    Scalar training metrics accumulated on-device without host synchronization.
+
+    add() only issues device-side additions. Every flush_interval calls to step() the
+    interval means are copied to pinned host memory with a non-blocking copy and written
+    to the SummaryWriter once that copy has completed (checked with a CUDA event, never
+    waited on), together with samples/s and frames/s measured on the host. Reading epoch
+    totals with totals()/means() is the only point that synchronizes.
+    """
+    def __init__(self, device: torch.device, writer: Any = None, flush_interval: int = 50):
+        self.device = torch.device(device)
+        self.writer = writer
+        self.flush_interval = max(1, int(flush_interval))
+        self._interval_sums: Dict[str, torch.Tensor] = {}
+        self._interval_counts: Dict[str, int] = {}
+        self._epoch_sums: Dict[str, torch.Tensor] = {}
+        self._epoch_counts: Dict[str, int] = {}
+        self._pending = deque()
+        self._steps_since_flush = 0
+        self._samples = 0
+        self._frames = 0
+        self._last_flush = time.perf_counter()
+
+    def add(self, name: str, value: torch.Tensor):
+        value = value.detach().float().reshape(())
+        for sums, counts in ((self._interval_sums, self._interval_counts), (self._epoch_sums, self._epoch_counts)):
+            if name not in sums:
+                sums[name] = torch.zeros((), device=self.device)
+                counts[name] = 0
+            sums[name].add_(value)
+            counts[name] += 1
+
+    def step(self, global_step: int, samples: int = 0, frames: int = 0):
+        self._samples += samples
+        self._frames += frames
+        self._steps_since_flush += 1
+        self._write_completed()
+        if self._steps_since_flush >= self.flush_interval:
+            self.flush(global_step)
+
+    def flush(self, global_step: int):
+        now = time.perf_counter()
+        elapsed = max(now - self._last_flush, 1e-9)
+        throughput = {'Throughput/samples_per_s': self._samples / elapsed, 'Throughput/frames_per_s': self._frames / elapsed}
+        self._last_flush, self._samples, self._frames, self._steps_since_flush = now, 0, 0, 0
+
+        names = [name for name, count in self._interval_counts.items() if count > 0]
+        host, event = None, None
+        if names:
+            means = torch.stack([self._interval_sums[name] / self._interval_counts[name] for name in names])
+            host = torch.empty(means.shape, dtype=means.dtype, pin_memory=means.is_cuda)
+            host.copy_(means, non_blocking=True)
+            if means.is_cuda:
+                event = torch.cuda.Event()
+                event.record()
+            for name in names:
+                self._interval_sums[name].zero_()
+                self._interval_counts[name] = 0
+        self._pending.append((global_step, names, host, event, throughput))
+        self._write_completed()
+
+    def _write_completed(self, block: bool = False):
+        while self._pending:
+            global_step, names, host, event, throughput = self._pending[0]
+            if event is not None:
+                if not block and not event.query():
+                    break
+                event.synchronize()
+            self._pending.popleft()
+            if self.writer is None:
+                continue
+            if host is not None:
+                for name, value in zip(names, host.tolist()):
+                    self.writer.add_scalar(name, value, global_step)
+            for name, value in throughput.items():
+                self.writer.add_scalar(name, value, global_step)
+
+    def totals(self) -> Dict[str, float]:
+        self._write_completed(block=True)
+        names = list(self._epoch_sums)
+        if not names:
+            return {}
+        return dict(zip(names, torch.stack([self._epoch_sums[name] for name in names]).tolist()))
+
+    def means(self) -> Dict[str, float]:
+        return {name: total / max(self._epoch_counts[name], 1) for name, total in self.totals().items()}
+
+    def reset_epoch(self):
+        self._epoch_sums.clear()
+        self._epoch_counts.clear()
+
 def log_training_parameters(params: Dict[str, Any]):
     logger.info("Training Parameters Selected:")
     for key, value in params.items():
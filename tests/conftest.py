@@ -0,0 +1,39 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# src/ scripts import each other as top-level modules; modules/ is imported as a package from the root
+for path in (ROOT, os.path.join(ROOT, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import pytest
+
+# smallest settings the separation pipeline runs with; keeps model and feature tests fast on CPU
+TINY_SETTINGS = {'n_mels': 16, 'target_length': 24, 'n_fft': 256}
+
+
+@pytest.fixture
+def stem_checkpoints(tmp_path):
+    """Directory with two untrained stem models saved under the names training writes."""
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("h5py")
+    from model import FEATURE_CHANNELS, MemoryEfficientStemSeparationModel
+
+    checkpoint_dir = tmp_path / 'checkpoints'
+    checkpoint_dir.mkdir()
+    torch.manual_seed(0)
+    for stem in ('drums', 'vocals'):
+        model = MemoryEfficientStemSeparationModel(FEATURE_CHANNELS, FEATURE_CHANNELS, TINY_SETTINGS['n_mels'], TINY_SETTINGS['target_length'])
+        torch.save(model.state_dict(), str(checkpoint_dir / f'model_final_stem_{stem}.pt'))
+    return str(checkpoint_dir)
+
+
+@pytest.fixture
+def short_wav(tmp_path):
+    """Half a second of stereo noise at 8 kHz."""
+    np = pytest.importorskip("numpy")
+    sf = pytest.importorskip("soundfile")
+    path = tmp_path / 'mix.wav'
+    sf.write(str(path), np.random.default_rng(0).uniform(-0.5, 0.5, (4000, 2)).astype(np.float32), 8000)
+    return str(path)
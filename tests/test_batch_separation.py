@@ -0,0 +1,68 @@
+import csv
+import os
+import shutil
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchaudio")
+pytest.importorskip("librosa")
+sf = pytest.importorskip("soundfile")
+
+from batch_separation import DONE_FILE, BatchSeparator, find_tracks
+from conftest import TINY_SETTINGS
+from separate_stems import find_stem_checkpoints
+
+
+def _separator(checkpoint_dir, output_dir):
+    return BatchSeparator(find_stem_checkpoints(checkpoint_dir), TINY_SETTINGS['n_mels'], TINY_SETTINGS['target_length'],
+                          TINY_SETTINGS['n_fft'], output_dir, device='cpu', decode_threads=2, encode_threads=2,
+                          griffin_lim_iters=2, reconstruction='mixture_phase')
+
+
+def _tracks(short_wav, tmp_path, count=3):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    for i in range(count):
+        shutil.copy(short_wav, str(input_dir / f'track_{i}.wav'))
+    return find_tracks(str(input_dir))
+
+
+def _report_rows(output_dir):
+    with open(os.path.join(output_dir, 'timings.csv')) as f:
+        return list(csv.DictReader(f))
+
+
+def test_separates_a_directory_and_resumes(stem_checkpoints, short_wav, tmp_path):
+    tracks = _tracks(short_wav, tmp_path)
+    output_dir = str(tmp_path / 'output')
+    separator = _separator(stem_checkpoints, output_dir)
+
+    summary = separator.run(tracks)
+    assert summary['separated'] == 3 and summary['failed'] == 0
+    for _, key in tracks:
+        assert os.path.exists(os.path.join(output_dir, key, DONE_FILE))
+        for stem in ('drums', 'vocals'):
+            audio, sample_rate = sf.read(os.path.join(output_dir, key, f'{stem}.wav'))
+            assert sample_rate == 8000 and audio.shape == (4000,)
+
+    assert separator.run(tracks)['skipped'] == 3
+    assert len(_report_rows(output_dir)) == 3
+
+
+def test_failed_batch_reports_each_track_once(stem_checkpoints, short_wav, tmp_path, monkeypatch):
+    tracks = _tracks(short_wav, tmp_path)
+    output_dir = str(tmp_path / 'output')
+    separator = _separator(stem_checkpoints, output_dir)
+    run_batch = BatchSeparator._run_batch
+
+    def fail_after_first(self, batch, encoder, slots, futures):
+        run_batch(self, batch[:1], encoder, slots, futures)
+        raise RuntimeError("device lost")
+
+    monkeypatch.setattr(BatchSeparator, '_run_batch', fail_after_first)
+    summary = separator.run(tracks)
+    rows = _report_rows(output_dir)
+    assert sorted(row['track'] for row in rows) == sorted(path for path, _ in tracks)
+    assert summary['separated'] + summary['failed'] == 3
+    assert summary['failed'] == sum(row['status'] == 'failed' for row in rows)
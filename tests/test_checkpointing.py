@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from checkpointing import CheckpointManager, capture_rng_state, find_latest_checkpoint, load_checkpoint, restore_rng_state
+
+
+def test_full_state_round_trip(tmp_path):
+    torch.manual_seed(0)
+    model = torch.nn.Linear(4, 2)
+    optimizer = torch.optim.Adam(model.parameters())
+    model(torch.randn(8, 4)).sum().backward()
+    optimizer.step()
+
+    manager = CheckpointManager(str(tmp_path))
+    path = manager.save({'model_state_dict': model.state_dict(), 'optimizer_state_dict': optimizer.state_dict(),
+                         'rng_state': capture_rng_state(), 'global_step': 7}, global_step=7)
+    expected = torch.rand(3)
+    manager.close()
+
+    state = load_checkpoint(path)
+    assert state['global_step'] == 7
+    restored = torch.nn.Linear(4, 2)
+    restored.load_state_dict(state['model_state_dict'])
+    for name, tensor in model.state_dict().items():
+        assert torch.equal(restored.state_dict()[name], tensor)
+    torch.optim.Adam(restored.parameters()).load_state_dict(state['optimizer_state_dict'])
+    restore_rng_state(state['rng_state'])
+    assert torch.equal(torch.rand(3), expected)
+
+
+def test_keeps_only_the_latest_checkpoints(tmp_path):
+    manager = CheckpointManager(str(tmp_path), keep_last=2)
+    for step in range(1, 5):
+        manager.save({'global_step': step}, global_step=step)
+    manager.close()
+    assert [os.path.basename(p) for p in manager.list_checkpoints()] == ['checkpoint_step_000000003.pt', 'checkpoint_step_000000004.pt']
+    assert find_latest_checkpoint(str(tmp_path)) == manager.path_for(4)
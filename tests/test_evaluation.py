@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("numpy")
+pytest.importorskip("soundfile")
+
+from evaluation import BSSStatistics, bss_metrics, si_sdr
+
+
+def _orthonormal_signals(length=4096, count=3, seed=0):
+    # zero-mean, mutually orthogonal, unit-energy signals
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.randn(length, count, generator=generator, dtype=torch.float64)
+    q, _ = torch.linalg.qr(x - x.mean(dim=0))
+    return q.T
+
+
+def test_metrics_match_closed_form_values():
+    s1, s2, noise = _orthonormal_signals()
+    references = torch.stack([s1, s2])
+    estimates = torch.stack([s1 + 0.5 * s2 + 0.1 * noise, s2])
+    metrics = bss_metrics(references, estimates)
+
+    assert metrics['sdr'][0].item() == pytest.approx(-10 * math.log10(0.25 + 0.01), abs=1e-3)
+    assert metrics['sir'][0].item() == pytest.approx(-10 * math.log10(0.25), abs=1e-3)
+    assert metrics['sar'][0].item() == pytest.approx(10 * math.log10(1.25 / 0.01), abs=1e-3)
+    assert metrics['si_sdr'][0].item() == pytest.approx(-10 * math.log10(0.26), abs=1e-3)
+    assert metrics['sdr'][1].item() > 90
+
+
+def test_si_sdr_is_scale_invariant_and_matches_the_streamed_statistics():
+    s1, s2, _ = _orthonormal_signals(seed=1)
+    estimate = s1 + 0.3 * s2
+    expected = -10 * math.log10(0.09)
+    assert si_sdr(s1, estimate).item() == pytest.approx(expected, abs=1e-3)
+    assert si_sdr(s1, 7 * estimate).item() == pytest.approx(expected, abs=1e-3)
+
+    references, estimates = torch.stack([s1, s2]), torch.stack([estimate, s2 - 0.2 * s1])
+    stats = BSSStatistics(2)
+    for ref_chunk, est_chunk in zip(references.split(1000, dim=-1), estimates.split(1000, dim=-1)):
+        stats.update(ref_chunk, est_chunk)
+    streamed, whole = stats.metrics(), bss_metrics(references, estimates)
+    for name in whole:
+        assert torch.allclose(streamed[name], whole[name], atol=1e-4)
+    assert torch.allclose(streamed['si_sdr'], si_sdr(references, estimates).float(), atol=1e-4)
@@ -0,0 +1,53 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchaudio")
+pytest.importorskip("librosa")
+pytest.importorskip("h5py")
+
+from model import FEATURE_CHANNELS, MemoryEfficientStemSeparationModel, load_model
+from separate_stems import reconstruct_audio, separate_chunks, separation_features
+
+SAMPLE_RATE, N_MELS, N_FFT, TARGET_LENGTH = 22050, 32, 512, 40
+
+
+def _waveform(seconds=1.5):
+    t = torch.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return 0.5 * torch.sin(2 * torch.pi * 440 * t) + 0.05 * torch.randn_like(t)
+
+
+def test_features_match_the_model_input():
+    audio = _waveform()
+    chunks, num_frames = separation_features(audio, SAMPLE_RATE, N_MELS, N_FFT, TARGET_LENGTH)
+    assert chunks.shape == (-(-num_frames // TARGET_LENGTH), FEATURE_CHANNELS, N_MELS, TARGET_LENGTH)
+    assert num_frames == audio.size(0) // (N_FFT // 4) + 1
+
+    model = MemoryEfficientStemSeparationModel(FEATURE_CHANNELS, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH).eval()
+    output, = separate_chunks([model], chunks, torch.device('cpu'))
+    assert output.shape == chunks.shape
+    stem = reconstruct_audio(output, num_frames, audio.size(0), SAMPLE_RATE, N_MELS, N_FFT, reconstruction='mixture_phase', mixture=audio)
+    assert stem.shape == (audio.size(0),)
+
+
+def test_stereo_input_is_mixed_down():
+    audio = _waveform(0.5)
+    stereo = torch.stack([audio, audio], dim=1)
+    mono_chunks, _ = separation_features(audio, SAMPLE_RATE, N_MELS, N_FFT, TARGET_LENGTH)
+    stereo_chunks, _ = separation_features(stereo, SAMPLE_RATE, N_MELS, N_FFT, TARGET_LENGTH)
+    assert torch.allclose(mono_chunks, stereo_chunks)
+
+
+def test_single_channel_input_is_rejected():
+    model = MemoryEfficientStemSeparationModel(FEATURE_CHANNELS, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH).eval()
+    with pytest.raises(ValueError):
+        model(torch.randn(1, 1, N_MELS, TARGET_LENGTH))
+
+
+def test_trained_checkpoint_loads_with_the_feature_channels(tmp_path):
+    model = MemoryEfficientStemSeparationModel(FEATURE_CHANNELS, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH)
+    path = str(tmp_path / 'model_final_stem_vocals.pt')
+    torch.save({'model_state_dict': model.state_dict()}, path)
+    loaded = load_model(path, FEATURE_CHANNELS, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH, device='cpu')
+    x = torch.randn(2, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH)
+    with torch.no_grad():
+        assert torch.allclose(loaded(x), model.eval()(x))
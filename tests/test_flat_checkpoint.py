@@ -0,0 +1,53 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("numpy")
+
+from flat_checkpoint import export_flat_checkpoint, materialize, open_flat_checkpoint, save_flat_checkpoint
+
+
+def _model():
+    return torch.nn.Sequential(torch.nn.Linear(5, 3), torch.nn.BatchNorm1d(3), torch.nn.Linear(3, 1, bias=False))
+
+
+def test_flat_round_trip_of_several_models(tmp_path):
+    torch.manual_seed(0)
+    models = {'vocals': _model(), 'drums': _model().half()}
+    path = str(tmp_path / 'stems.flat')
+    save_flat_checkpoint(path, models, {'vocals': {'n_mels': 32}})
+
+    flat = open_flat_checkpoint(path)
+    assert flat.models == ['vocals', 'drums']
+    assert flat.config('vocals') == {'n_mels': 32}
+    assert flat.config('drums') == {}
+    for name, model in models.items():
+        loaded = flat.state_dict(name)
+        assert set(loaded) == set(model.state_dict())
+        for key, tensor in model.state_dict().items():
+            assert loaded[key].dtype == tensor.dtype
+            assert torch.equal(loaded[key], tensor)
+    with pytest.raises(ValueError):
+        flat.state_dict()
+    with pytest.raises(KeyError):
+        flat.state_dict('bass')
+
+
+def test_materialized_model_matches_the_original(tmp_path):
+    torch.manual_seed(0)
+    model = _model().eval()
+    path = str(tmp_path / 'model.flat')
+    save_flat_checkpoint(path, {'model': model})
+
+    restored = materialize(_model, open_flat_checkpoint(path).state_dict(), 'cpu').eval()
+    x = torch.randn(4, 5)
+    with torch.no_grad():
+        assert torch.equal(restored(x), model(x))
+
+
+def test_export_unwraps_full_state_checkpoints(tmp_path):
+    model = _model()
+    checkpoint_path = str(tmp_path / 'checkpoint_step_000000010.pt')
+    torch.save({'model_state_dict': model.state_dict(), 'global_step': 10}, checkpoint_path)
+    out_path = export_flat_checkpoint({'bass': checkpoint_path}, str(tmp_path / 'bass.flat'))
+    loaded = open_flat_checkpoint(out_path).state_dict('bass')
+    assert all(torch.equal(loaded[key], tensor) for key, tensor in model.state_dict().items())
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+sf = pytest.importorskip("soundfile")
+
+from generate_other_noise import generate_shuffled_noise
+
+
+def _input_dirs(root):
+    rng = np.random.default_rng(0)
+    input_dirs = {}
+    for stem in ('vocals', 'drums', 'bass'):
+        stem_dir = root / stem
+        stem_dir.mkdir(parents=True)
+        for i in range(3):
+            sf.write(str(stem_dir / f'{i}.wav'), rng.uniform(-0.5, 0.5, 800).astype(np.float32), 400)
+        input_dirs[stem] = str(stem_dir)
+    return input_dirs
+
+
+def _load(output_dir, num_examples):
+    return [np.load(os.path.join(output_dir, f'shuffled_noise_{i + 1}.npy')) for i in range(num_examples)]
+
+
+def test_resumed_run_regenerates_the_same_examples(tmp_path):
+    input_dirs = _input_dirs(tmp_path / 'stems')
+    output_dir = str(tmp_path / 'noise')
+    kwargs = dict(num_examples=5, target_length=1, audio_format='npy', num_workers=1, seed=3, batch_size=2)
+
+    generate_shuffled_noise(input_dirs, output_dir, **kwargs)
+    first = _load(output_dir, 5)
+    for i in (1, 4):
+        os.remove(os.path.join(output_dir, f'shuffled_noise_{i + 1}.npy'))
+    generate_shuffled_noise(input_dirs, output_dir, **kwargs)
+    resumed = _load(output_dir, 5)
+
+    assert all(np.array_equal(a, b) for a, b in zip(first, resumed))
+    assert not np.array_equal(first[0], first[1])
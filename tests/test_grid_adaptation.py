@@ -0,0 +1,65 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from modules.efficient_kan import KANLinear, spline_bases
+from modules.grid_adaptation import QuantileSketch, b_spline_basis
+
+
+def test_sketch_is_not_part_of_the_state_dict():
+    layer = KANLinear(4, 3)
+    keys = set(layer.state_dict())
+    layer.enable_grid_sketch()
+    layer.train()
+    layer(torch.randn(64, 4))
+    assert set(layer.state_dict()) == keys
+    KANLinear(4, 3).load_state_dict(layer.state_dict())
+
+
+def test_sketch_quantiles_follow_the_data():
+    sketch = QuantileSketch(2, num_bins=512, decay=1.0)
+    x = torch.rand(20000, 2) * torch.tensor([1.0, 10.0])
+    sketch.update(x)
+    q = sketch.quantiles(torch.tensor([0.25, 0.5, 0.75]))
+    assert torch.allclose(q[0], torch.tensor([0.25, 0.5, 0.75]), atol=0.02)
+    assert torch.allclose(q[1], torch.tensor([2.5, 5.0, 7.5]), atol=0.2)
+
+
+def test_update_grid_from_sketch_keeps_the_function():
+    torch.manual_seed(0)
+    layer = KANLinear(3, 2, grid_size=8)
+    layer.enable_grid_sketch(decay=1.0)
+    layer.train()
+    x = torch.rand(512, 3) * 1.6 - 0.8
+    with torch.no_grad():
+        layer(x)
+        before = layer(x)
+        layer.update_grid_from_sketch()
+        after = layer(x)
+    assert (after - before).norm() <= 0.05 * before.norm()
+
+
+def test_sketch_only_rebins_when_a_batch_leaves_the_range(monkeypatch):
+    sketch = QuantileSketch(2)
+    sketch.update(torch.rand(256, 2) * 4 - 2)
+    calls = []
+    rebin = sketch._rebin
+    monkeypatch.setattr(sketch, '_rebin', lambda low, high: calls.append(1) or rebin(low, high))
+
+    sketch.update(torch.rand(256, 2) - 0.5)
+    assert calls == []
+    sketch.update(torch.full((1, 2), 10.0))
+    assert calls == [1]
+    assert torch.all(sketch.high > 10.0)
+
+
+def test_spline_bases_share_the_grid_adaptation_recursion():
+    layer = KANLinear(3, 2, grid_size=6)
+    x = (torch.rand(32, 3) * 2 - 1).requires_grad_()
+    bases, dbases = spline_bases(x, layer.grid, layer.spline_order, derivative=True)
+    assert torch.allclose(bases, b_spline_basis(x.T, layer.grid, layer.spline_order).transpose(0, 1))
+    assert torch.allclose(layer.b_splines(x), bases)
+
+    weights = torch.randn(bases.size(-1))
+    grad, = torch.autograd.grad((bases * weights).sum(), x)
+    assert torch.allclose(grad, (dbases * weights).sum(-1), atol=1e-4)
@@ -0,0 +1,49 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("sympy")
+pytest.importorskip("sklearn")
+pytest.importorskip("matplotlib")
+pytest.importorskip("tqdm")
+
+from modules.KAN import KAN
+
+
+def _inputs(width, n=256):
+    return torch.rand(n, width, generator=torch.Generator().manual_seed(1)) * 2 - 1
+
+
+def test_compact_matches_prune_with_symbolic_edges():
+    model = KAN(width=[3, 6, 2], grid=5, k=3, seed=0)
+    x = _inputs(3)
+    model(x)
+    model.fix_symbolic(0, 1, 2, 'sin', fit_params_bool=False, verbose=False)
+    model.fix_symbolic(1, 4, 0, 'x^2', fit_params_bool=False, verbose=False)
+    for j in range(2):
+        model.remove_edge(1, 3, j)  # neuron (1, 3) no longer reaches the outputs
+    model(x)
+
+    pruned = model.prune(threshold=1e-2)
+    compact = model.compact()
+    with torch.no_grad():
+        assert torch.allclose(compact(x), pruned(x), atol=1e-5)
+        assert torch.allclose(compact(x), model(x), atol=1e-5)
+    assert compact.width[1] <= pruned.width[1]
+
+
+def test_compact_folds_constant_neurons_with_symbolic_outputs():
+    model = KAN(width=[2, 5, 1], grid=5, k=3, seed=0)
+    model.remove_edge(0, 0, 2)
+    model.remove_edge(0, 1, 2)  # neuron (1, 2) is now a constant
+    model.fix_symbolic(1, 2, 0, 'sin', fit_params_bool=False, verbose=False)
+    x = _inputs(2)
+    with torch.no_grad():
+        expected = model(x)
+    acts = [a.clone() for a in model.acts]
+
+    compact = model.compact()
+    with torch.no_grad():
+        assert torch.allclose(compact(x), expected, atol=1e-5)
+    assert compact.width == [2, 4, 1]
+    # compact() must not clobber the activations prune() reads
+    assert all(torch.equal(a, b) for a, b in zip(acts, model.acts))
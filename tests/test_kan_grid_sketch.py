@@ -0,0 +1,53 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("numpy")
+pytest.importorskip("sympy")
+pytest.importorskip("sklearn")
+pytest.importorskip("matplotlib")
+pytest.importorskip("tqdm")
+
+from modules.KAN import KAN
+from modules.KANLayer import KANLayer
+from modules.utils import create_dataset
+
+
+def test_layer_update_grid_from_sketch_keeps_the_function():
+    torch.manual_seed(0)
+    layer = KANLayer(in_dim=2, out_dim=3, num=8, k=3, noise_scale=1.0)
+    layer.enable_grid_sketch(decay=1.0)
+    x = torch.rand(512, 2) * 1.2 - 0.9
+    with torch.no_grad():
+        before = layer(x)[0]
+        layer.update_grid_from_sketch()
+        after = layer(x)[0]
+
+    # the grid now follows the inputs of each edge, rows ordered j * in_dim + i
+    grid = layer.grid.reshape(3, 2, -1)
+    assert torch.allclose(grid[0], grid[1]) and torch.allclose(grid[0], grid[2])
+    assert grid[0, 0, 0] > -0.95 and grid[0, 0, -1] < 0.35
+    assert (after - before).norm() <= 0.05 * before.norm()
+
+
+def test_layer_update_grid_from_sketch_without_data_is_a_no_op():
+    layer = KANLayer(in_dim=2, out_dim=2)
+    grid = layer.grid.clone()
+    layer.update_grid_from_sketch()
+    layer.enable_grid_sketch()
+    layer.update_grid_from_sketch()
+    assert torch.equal(layer.grid, grid)
+
+
+def test_train_with_grid_sketch_updates_grids_from_training_passes():
+    f = lambda x: torch.sin(torch.pi * x[:, [0]]) + 2 * x[:, [1]] ** 2
+    dataset = create_dataset(f, n_var=2, ranges=[0, 2], train_num=200, test_num=50)
+    model = KAN(width=[2, 3, 1], grid=5, k=3, seed=0)
+    grid = model.act_fun[0].grid.clone()
+
+    results = model.train(dataset, opt='Adam', steps=4, lr=1e-2, grid_sketch=True, grid_update_num=2, stop_grid_update_step=4)
+
+    assert all(layer.grid_sketch is not None for layer in model.act_fun)
+    assert not torch.equal(model.act_fun[0].grid, grid)
+    # the first layer's grid moved onto the [0, 2] inputs it was trained on
+    assert model.act_fun[0].grid.min() > -0.5 and model.act_fun[0].grid.max() > 1.5
+    assert all(torch.isfinite(torch.as_tensor(loss)) for loss in results['train_loss'])
@@ -0,0 +1,25 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchaudio")
+
+from loss_functions import MultiResolutionSpectralLoss
+
+
+def test_db_features_are_compared_as_magnitudes():
+    torch.manual_seed(0)
+    power = torch.rand(2, 3, 16, 40) + 1e-3
+    to_db = lambda p: 10 * torch.log10(p)
+    db_loss = MultiResolutionSpectralLoss()
+    magnitude_loss = MultiResolutionSpectralLoss(db_input=False)
+
+    target, prediction = power, power * torch.rand_like(power)
+    expected = magnitude_loss(target.sqrt(), prediction.sqrt())
+    assert torch.allclose(db_loss(to_db(target), to_db(prediction)), expected, rtol=1e-4)
+
+
+def test_negative_db_is_not_folded_onto_positive_db():
+    loss = MultiResolutionSpectralLoss()
+    target = torch.full((1, 3, 8, 8), -20.0)
+    assert loss(target, target) == 0
+    assert loss(target, -target) > 0
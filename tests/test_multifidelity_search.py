@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("librosa")
+pytest.importorskip("h5py")
+
+from multifidelity_search import TrialRunner, population_based_training
+
+
+class _Runner:
+    """Stands in for TrialRunner: the loss of a trial is its config value, checkpoints name their trial."""
+    def __init__(self, root):
+        self.root = root
+        self.calls = []
+
+    def trial_dir(self, trial_id):
+        path = os.path.join(self.root, trial_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def latest_checkpoint(self, trial_id):
+        path = os.path.join(self.trial_dir(trial_id), 'state.pt')
+        with open(path, 'w') as f:
+            f.write(trial_id)
+        return path
+
+    def run(self, trial_id, config, total_epochs, warm_start=None):
+        source = None
+        if warm_start is not None:
+            with open(warm_start) as f:
+                source = f.read()
+        self.calls.append((trial_id, dict(config), source))
+        return config['x']
+
+
+def test_losers_never_copy_another_loser(tmp_path):
+    runner = _Runner(str(tmp_path))
+    population_based_training(runner, {'x': ('float', 0.0, 1.0)}, population_size=4, epochs_per_round=1, rounds=2, exploit_fraction=0.75, seed=0)
+
+    first_round = runner.calls[:4]
+    best = min(first_round, key=lambda call: call[1]['x'])[0]
+    warm_started = [call for call in runner.calls[4:] if call[2] is not None]
+    assert len(warm_started) == 3
+    # ranked[:3] and ranked[-3:] overlap, so only the best trial is a winner
+    assert all(source == best and trial_id != best for trial_id, _, source in warm_started)
+
+
+def test_last_loss_survives_a_restart(tmp_path):
+    runner = TrialRunner.__new__(TrialRunner)
+    runner.work_dir = str(tmp_path)
+    runner.save_last_loss('trial_0', epoch=4, loss=0.25)
+
+    restarted = TrialRunner.__new__(TrialRunner)
+    restarted.work_dir = str(tmp_path)
+    assert restarted.last_loss('trial_0', 4) == 0.25
+    assert restarted.last_loss('trial_0', 6) == float('inf')
+    assert restarted.last_loss('trial_1', 4) == float('inf')
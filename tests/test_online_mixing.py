@@ -0,0 +1,35 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchaudio")
+np = pytest.importorskip("numpy")
+sf = pytest.importorskip("soundfile")
+
+from online_mixing import OnlineMixingSource, find_stem_files, hpss_power
+
+
+def test_hpss_splits_tones_from_clicks():
+    power = torch.full((1, 64, 64), 1e-6)
+    power[0, 20, :] = 1.0   # stationary tone
+    power[0, :, 40] = 1.0   # click
+    harmonic, percussive = hpss_power(power)
+    assert torch.all(harmonic + percussive <= power + 1e-6)
+    assert harmonic[0, 20, 10] > 0.99 and percussive[0, 20, 10] < 0.01
+    assert percussive[0, 50, 40] > 0.99 and harmonic[0, 50, 40] < 0.01
+
+
+def test_batches_have_the_cached_feature_layout(tmp_path):
+    sample_rate, n_mels, target_length = 8000, 16, 20
+    data_dir = tmp_path / 'stems'
+    rng = np.random.default_rng(0)
+    for stem in ('vocals', 'drums'):
+        (data_dir / stem).mkdir(parents=True)
+        sf.write(str(data_dir / stem / 'a.wav'), rng.uniform(-0.5, 0.5, sample_rate).astype(np.float32), sample_rate)
+
+    source = OnlineMixingSource(find_stem_files(str(data_dir), ['vocals', 'drums']), 'vocals', str(tmp_path / 'pcm'),
+                                sample_rate, n_mels, n_fft=256, target_length=target_length, batch_size=2,
+                                device='cpu', steps_per_epoch=1, prefetch=1)
+    batches = list(source.epoch(0))
+    assert len(batches) == 1
+    assert batches[0]['input'].shape == (2, 3, n_mels, target_length)
+    assert batches[0]['target'].shape == (2, 3, n_mels, target_length)
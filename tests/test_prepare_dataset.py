@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("soundfile")
+
+import prepare_dataset
+
+
+class _Writer:
+    """Records submitted paths; paths containing fail_on count as failed writes."""
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.failures = 0
+        self.paths = []
+
+    def submit(self, waveform, sample_rate, file_path):
+        self.paths.append(file_path)
+        if self.fail_on and self.fail_on in file_path:
+            self.failures += 1
+
+    def wait(self):
+        pass
+
+
+def _run(monkeypatch, writer, tmp_path):
+    monkeypatch.setattr(prepare_dataset, '_get_writer', lambda audio_format, encode_threads: writer)
+    monkeypatch.setattr(prepare_dataset, 'read_source', lambda file_path, pcm_store_dir=None: (np.ones(8, dtype=np.float32), 4))
+    file_lists = {'vocals': ['a.wav'], 'drums': ['b.wav']}
+    return prepare_dataset.generate_example(0, str(tmp_path), str(tmp_path), file_lists, target_length=2)
+
+
+def test_mixture_is_written_after_the_stems(monkeypatch, tmp_path):
+    writer = _Writer()
+    assert _run(monkeypatch, writer, tmp_path) == 0
+    assert [p.split('/')[-1] for p in writer.paths] == ['vocals_0001.ogg', 'drums_0001.ogg', 'example_0001.ogg']
+
+
+def test_failed_stem_skips_the_mixture(monkeypatch, tmp_path):
+    writer = _Writer(fail_on='drums')
+    assert _run(monkeypatch, writer, tmp_path) is None
+    assert not any('example' in p for p in writer.paths)
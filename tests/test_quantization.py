@@ -0,0 +1,52 @@
+import argparse
+import warnings
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchaudio")
+pytest.importorskip("librosa")
+pytest.importorskip("h5py")
+
+from model import FEATURE_CHANNELS, MemoryEfficientStemSeparationModel, load_model
+from quantization import model_segments, quantize_model, save_quantized_model
+
+N_MELS, TARGET_LENGTH = 16, 24
+
+
+def test_cached_spectrogram_is_split_along_time():
+    spec = torch.arange(FEATURE_CHANNELS * N_MELS * 60, dtype=torch.float32).reshape(1, FEATURE_CHANNELS, N_MELS, 60)
+    segments = model_segments(spec, TARGET_LENGTH)
+    assert segments.shape == (3, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH)
+    assert torch.equal(segments[1], spec[0, ..., TARGET_LENGTH:2 * TARGET_LENGTH])
+    assert torch.all(segments[2, ..., 12:] == spec.min())
+    assert model_segments(spec, TARGET_LENGTH, max_segments=2).shape[0] == 2
+
+
+def test_quantized_artifact_round_trip(tmp_path):
+    if not torch.backends.quantized.supported_engines or torch.backends.quantized.supported_engines == ['none']:
+        pytest.skip("no quantized engine")
+    torch.manual_seed(0)
+    model = MemoryEfficientStemSeparationModel(FEATURE_CHANNELS, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH).eval()
+    data = [torch.randn(4, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH) for _ in range(2)]
+    quantized = quantize_model(model, data)
+
+    path = str(tmp_path / 'model_int8.pt')
+    config = {'in_channels': FEATURE_CHANNELS, 'out_channels': FEATURE_CHANNELS, 'n_mels': N_MELS, 'target_length': TARGET_LENGTH}
+    save_quantized_model(quantized, path, config, {'sdr_mean_db': 30.0})
+    torch.load(path, weights_only=True)
+    with warnings.catch_warnings():
+        # rebuilding the module structure must not convert observers that never saw data
+        warnings.simplefilter("error", UserWarning)
+        loaded = load_model(path, FEATURE_CHANNELS, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH, device='cpu')
+    assert loaded.quantization_engine == quantized.quantization_engine
+    with torch.no_grad():
+        assert torch.allclose(loaded(data[0]), quantized(data[0]))
+        assert loaded(data[0]).shape == model(data[0]).shape
+
+
+def test_load_model_refuses_pickled_objects(tmp_path):
+    path = str(tmp_path / 'full_state.pt')
+    torch.save({'model_state_dict': {}, 'config': argparse.Namespace(lr=1e-3)}, path)
+    with pytest.raises(ValueError, match="more than model weights"):
+        load_model(path, FEATURE_CHANNELS, FEATURE_CHANNELS, N_MELS, TARGET_LENGTH, device='cpu')
@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+from result_cache import MANIFEST_FILE, ResultCache, checkpoint_fingerprint, file_sha256, result_key
+
+
+def _stage(cache, name, content, size=100):
+    staging_dir = cache.staging_dir()
+    with open(os.path.join(staging_dir, name), 'wb') as f:
+        f.write(content * size)
+    return staging_dir
+
+
+def test_put_renames_the_staging_directory_into_place(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = result_key('audio', ['model'], 128, 2048, 'griffinlim32')
+    assert cache.get(key) is None
+
+    staging_dir = _stage(cache, 'stem_0.wav', b'a')
+    paths = cache.put(key, staging_dir, ['stem_0.wav'])
+    assert not os.path.exists(staging_dir)
+    assert paths == [os.path.join(str(tmp_path), key[:2], key, 'stem_0.wav')]
+    assert cache.get(key) == paths
+    assert os.path.exists(os.path.join(os.path.dirname(paths[0]), MANIFEST_FILE))
+
+
+def test_concurrent_puts_of_one_key_keep_a_single_entry(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    staged = [_stage(cache, 'stem_0.wav', bytes([i])) for i in range(8)]
+    results = []
+    threads = [threading.Thread(target=lambda d=d: results.append(cache.put('ab' * 32, d, ['stem_0.wav']))) for d in staged]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(tuple, results))) == 1
+    assert os.listdir(os.path.join(str(tmp_path), 'staging')) == []
+    assert cache.get('ab' * 32) == results[0]
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=2500)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, _stage(cache, 'stem.wav', b'x', 1000), ['stem.wav'])
+        manifest = os.path.join(str(tmp_path), key[:2], key, MANIFEST_FILE)
+        os.utime(manifest, (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.get(keys[0]) is not None  # marks the older entry as used
+
+    cache.put(keys[2], _stage(cache, 'stem.wav', b'x', 1000), ['stem.wav'])
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_new_entry_is_kept_even_when_it_alone_exceeds_the_budget(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=10)
+    key = 'cd' * 32
+    cache.put(key, _stage(cache, 'stem.wav', b'x', 1000), ['stem.wav'])
+    assert cache.get(key) is not None
+
+
+def test_discard_and_keys(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    staging_dir = _stage(cache, 'stem.wav', b'x')
+    cache.discard(staging_dir)
+    assert not os.path.exists(staging_dir)
+
+    checkpoint = tmp_path / 'model.pt'
+    checkpoint.write_bytes(b'weights')
+    assert checkpoint_fingerprint(str(checkpoint)) == file_sha256(str(checkpoint))
+    base = result_key('audio', ['model'], 128, 2048, 'griffinlim32')
+    assert base != result_key('audio', ['model'], 128, 2048, 'mixture_phase')
+    assert base != result_key('audio', ['other'], 128, 2048, 'griffinlim32')
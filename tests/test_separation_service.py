@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchaudio")
+pytest.importorskip("librosa")
+sf = pytest.importorskip("soundfile")
+
+from conftest import TINY_SETTINGS
+from separation_service import get_separation_service
+
+
+def _service(checkpoint_dir, cache_dir):
+    return get_separation_service(checkpoint_dir, TINY_SETTINGS['n_mels'], TINY_SETTINGS['target_length'], TINY_SETTINGS['n_fft'],
+                                  cache_dir=cache_dir, devices=['cpu'], num_workers=1, griffin_lim_iters=2)
+
+
+def test_missing_checkpoints_raise_value_error(tmp_path):
+    with pytest.raises(ValueError):
+        _service(str(tmp_path / 'empty'), str(tmp_path / 'cache'))
+
+
+def test_separates_and_caches(stem_checkpoints, short_wav, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    service = _service(stem_checkpoints, cache_dir)
+    paths = service.separate(short_wav, timeout=120)
+    assert len(paths) == 2
+    for path in paths:
+        audio, sample_rate = sf.read(path)
+        assert sample_rate == 8000 and audio.shape == (4000,)
+
+    cached = service.submit(short_wav)
+    assert cached.done and cached.result_paths == paths
+    assert _service(stem_checkpoints, cache_dir) is service
+
+
+def test_changed_checkpoints_get_a_new_service(stem_checkpoints, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    service = _service(stem_checkpoints, cache_dir)
+    path = os.path.join(stem_checkpoints, 'model_final_stem_vocals.pt')
+    state = torch.load(path)
+    state['final_conv.bias'] += 1
+    torch.save(state, path)
+    assert _service(stem_checkpoints, cache_dir) is not service
+    assert _service(stem_checkpoints, str(tmp_path / 'other_cache')) is not _service(stem_checkpoints, cache_dir)
@@ -0,0 +1,68 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from modules.efficient_kan import KAN
+
+
+def test_frozen_state_dict_matches_unfrozen():
+    torch.manual_seed(0)
+    model = KAN([4, 6, 2])
+    keys = set(model.state_dict())
+    model.freeze(table_size=256)
+    assert set(model.state_dict()) == keys
+
+    fresh = KAN([4, 6, 2])
+    fresh.load_state_dict(model.state_dict())
+    x = torch.rand(32, 4) * 2 - 1
+    model.unfreeze()
+    with torch.no_grad():
+        assert torch.allclose(fresh(x), model(x))
+
+
+def test_frozen_output_matches_exact_splines():
+    torch.manual_seed(0)
+    model = KAN([4, 6, 2])
+    x = torch.rand(64, 4) * 2 - 1
+    with torch.no_grad():
+        exact = model(x)
+        error = model.freeze(table_size=1024)
+        assert error < 1e-3
+        assert torch.allclose(model(x), exact, atol=1e-3)
+
+
+@pytest.mark.parametrize("exception", [ValueError, RuntimeError])
+def test_failed_freeze_leaves_every_layer_unfrozen(monkeypatch, exception):
+    model = KAN([4, 6, 2])
+
+    def fail(**kwargs):
+        raise exception("table error too large")
+
+    monkeypatch.setattr(model.layers[1], 'freeze', fail)
+    with pytest.raises(exception):
+        model.freeze(table_size=256)
+    assert all(layer.spline_table is None and layer.table_error is None for layer in model.layers)
+
+
+def test_failed_pykan_freeze_leaves_every_layer_unfrozen(monkeypatch):
+    pytest.importorskip("sympy")
+    pytest.importorskip("sklearn")
+    pytest.importorskip("matplotlib")
+    pytest.importorskip("tqdm")
+    from modules.KAN import KAN as PyKAN
+
+    model = PyKAN(width=[2, 3, 1], grid=5, k=3, seed=0)
+    x = torch.rand(64, 2) * 2 - 1
+    with torch.no_grad():
+        exact = model(x)
+        model.freeze(table_size=1024)
+        assert torch.allclose(model(x), exact, atol=1e-3)
+    model.unfreeze()
+
+    def fail(**kwargs):
+        raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(model.act_fun[1], 'freeze', fail)
+    with pytest.raises(RuntimeError):
+        model.freeze(table_size=256)
+    assert all(layer.spline_table is None and layer.table_error is None for layer in model.act_fun)
@@ -0,0 +1,68 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+sympy = pytest.importorskip("sympy")
+
+from modules.symbolic_compiler import CompiledSymbolicKAN, compile_formulas
+
+x1, x2 = sympy.symbols('x_1 x_2')
+FORMULAS = [sympy.sin(2 * x1 + 0.5) + x2 ** 2, 3 * sympy.sin(2 * x1 + 0.5) - sympy.exp(x2), sympy.Float(1.25)]
+
+
+def _expected(x):
+    shared = torch.sin(2 * x[:, 0] + 0.5)
+    return torch.stack([shared + x[:, 1] ** 2, 3 * shared - torch.exp(x[:, 1]), torch.full_like(x[:, 0], 1.25)], 1)
+
+
+def test_torch_backend_matches_the_formulas():
+    x = torch.rand(64, 2) * 2 - 1
+    fun = compile_formulas(FORMULAS, [x1, x2])
+    assert torch.allclose(fun(x), _expected(x), atol=1e-6)
+
+
+def test_numpy_backend_matches_the_formulas():
+    x = torch.rand(64, 2, dtype=torch.float64) * 2 - 1
+    fun = compile_formulas(FORMULAS, [x1, x2], backend='numpy')
+    out = fun(x.numpy())
+    assert out.shape == (64, 3)
+    assert np.allclose(out, _expected(x).numpy())
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        compile_formulas(FORMULAS, [x1, x2], backend='jax')
+
+
+def test_compiled_module_traces_to_torchscript():
+    x = torch.rand(16, 2) * 2 - 1
+    compiled = CompiledSymbolicKAN(FORMULAS, [x1, x2])
+    assert torch.allclose(compiled(x), _expected(x), atol=1e-6)
+    traced = compiled.to_torchscript(x)
+    other = torch.rand(16, 2) * 2 - 1
+    assert torch.allclose(traced(other), _expected(other), atol=1e-6)
+
+
+def _kan():
+    pytest.importorskip("sklearn")
+    pytest.importorskip("matplotlib")
+    pytest.importorskip("tqdm")
+    from modules.KAN import KAN
+    return KAN
+
+
+def test_compile_symbolic_rejects_spline_edges():
+    model = _kan()(width=[2, 1], grid=5, k=3, seed=0)
+    model.fix_symbolic(0, 0, 0, 'sin', fit_params_bool=False, verbose=False)
+    with pytest.raises(ValueError, match="spline-valued"):
+        model.compile_symbolic()
+
+
+def test_compile_symbolic_matches_forward():
+    model = _kan()(width=[2, 1], grid=5, k=3, seed=0)
+    model.fix_symbolic(0, 0, 0, 'sin', fit_params_bool=False, verbose=False)
+    model.fix_symbolic(0, 1, 0, 'x^2', fit_params_bool=False, verbose=False)
+    x = torch.rand(64, 2) * 2 - 1
+    compiled = model.compile_symbolic()
+    with torch.no_grad():
+        assert torch.allclose(compiled(x), model(x), atol=1e-4)